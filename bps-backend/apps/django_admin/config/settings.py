@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.admin',
     'core',
     'uploads',
+    'search',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -47,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack.
+    'core.timing.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -118,6 +121,20 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Admin changelists (core/pagination.py): above this many rows an unfiltered
+# list shows the planner's row estimate instead of running COUNT(*), and
+# filtered counts give up after the timeout and fall back to the estimate.
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', '100000'))
+ADMIN_COUNT_TIMEOUT_MS = int(os.getenv('ADMIN_COUNT_TIMEOUT_MS', '200'))
+
+# Foreign key autocomplete results (core/autocomplete.py), cached per process
+ADMIN_AUTOCOMPLETE_CACHE_TTL = float(os.getenv('ADMIN_AUTOCOMPLETE_CACHE_TTL', '60'))
+ADMIN_AUTOCOMPLETE_CACHE_SIZE = int(os.getenv('ADMIN_AUTOCOMPLETE_CACHE_SIZE', '1024'))
+
+# Bearer token Prometheus must send to scrape /metrics (core/timing.py); unset = staff only
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
@@ -129,3 +146,40 @@ S3_ACCESS_KEY = os.getenv('S3_ACCESS_KEY')
 S3_SECRET_KEY = os.getenv('S3_SECRET_KEY')
 S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
 S3_REGION = 'us-east-1'
+
+# Shared S3 client tuning (see core/s3.py)
+S3_MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', '20'))
+S3_CONNECT_TIMEOUT = float(os.getenv('S3_CONNECT_TIMEOUT', '5'))
+S3_READ_TIMEOUT = float(os.getenv('S3_READ_TIMEOUT', '60'))
+S3_MAX_ATTEMPTS = int(os.getenv('S3_MAX_ATTEMPTS', '3'))
+# Receivers of per-operation S3 latency/bytes/errors (core/instrumentation.py);
+# add 'core.instrumentation.TracingSink' to emit OpenTelemetry spans
+S3_INSTRUMENTATION_SINKS = [
+    'core.instrumentation.RegistrySink',
+    'core.instrumentation.LoggingSink',
+    'core.timing.RequestTimingSink',
+]
+# Uploads above the threshold are streamed as multipart, one part in memory at a time
+S3_MULTIPART_THRESHOLD = int(os.getenv('S3_MULTIPART_THRESHOLD', str(8 * 1024 * 1024)))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv('S3_MULTIPART_CHUNKSIZE', str(8 * 1024 * 1024)))
+
+# Browser-to-S3 uploads from the admin image forms (core/direct_upload.py)
+S3_DIRECT_UPLOAD_MAX_SIZE = int(os.getenv('S3_DIRECT_UPLOAD_MAX_SIZE', str(50 * 1024 * 1024)))
+S3_DIRECT_UPLOAD_EXPIRY = int(os.getenv('S3_DIRECT_UPLOAD_EXPIRY', '300'))
+
+# Bulk image ingestion (uploads/ingest.py)
+UPLOAD_INGEST_WORKERS = int(os.getenv('UPLOAD_INGEST_WORKERS', '8'))
+# Allow selecting a whole asset pack at once on the bulk upload page
+DATA_UPLOAD_MAX_NUMBER_FILES = 1000
+
+# Sprite atlases of element images (uploads/atlas.py): largest sheet side and
+# transparent gap between frames, in pixels
+ATLAS_SHEET_SIZE = int(os.getenv('ATLAS_SHEET_SIZE', '2048'))
+ATLAS_PADDING = int(os.getenv('ATLAS_PADDING', '2'))
+
+# Element/Map image renditions (core/renditions.py): formats to encode, best
+# first (PNG is the fallback and always made), and the largest source, in
+# pixels, rendered on the admin request; bigger ones go to render_renditions
+RENDITION_FORMATS = ['avif', 'webp', 'png']
+RENDITION_QUALITY = int(os.getenv('RENDITION_QUALITY', '75'))
+RENDITION_INLINE_MAX_PIXELS = int(os.getenv('RENDITION_INLINE_MAX_PIXELS', str(1024 * 1024)))
@@ -17,6 +17,15 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from core.views import autocomplete, metrics, placements_nearest, placements_viewport, presign_upload, s3_metrics, thumbnail
+
 urlpatterns = [
+    path('direct-upload/presign/', presign_upload, name='presign_upload'),
+    path('thumbnails/<int:size>/<path:key>', thumbnail, name='thumbnail'),
+    path('placements/<str:owner>/<str:pk>/viewport/', placements_viewport, name='placements_viewport'),
+    path('placements/<str:owner>/<str:pk>/nearest/', placements_nearest, name='placements_nearest'),
+    path('autocomplete/fk/', autocomplete, name='cached_autocomplete'),
+    path('metrics', metrics, name='metrics'),
+    path('s3-metrics/', s3_metrics, name='s3_metrics'),
     path('', admin.site.urls),
 ]
@@ -1,27 +1,76 @@
 import uuid
 
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
 from django.apps import apps
-from django.conf import settings
+from django.db import transaction
+from django.template.response import TemplateResponse
 from django.utils import timezone
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
+
+from core.admin_mixins import (
+    AutocompleteForeignKeyMixin,
+    LargeTablePaginationMixin,
+    OptimizedChangelistMixin,
+    PlacementTransferMixin,
+)
+from core.forms import InstantiateSpacesForm, get_avatar_form, get_element_form, get_map_form
+from core.models import Avatar, Element, Map, Mapelementplacement, Space, Spaceelementplacement
+from core.placements import copy_map_placements, instantiate_spaces
+from core.s3 import public_url
+from core.thumbnails import thumbnail_url
+from search.backend import TrigramSearchMixin
+from uploads.atlas import map_scope, request_builds, scopes_for_elements
+from uploads.dedup import release
+from uploads.models import ImageRendition
 
 
 def _image_preview(key):
     """Generate an HTML image preview tag for an S3 key."""
     if not key:
         return '(no image)'
-    url = f'{settings.S3_ENDPOINT}/{settings.S3_BUCKET_NAME}/{key}'
+    url = thumbnail_url(key, 200)
     return format_html(
         '<img src="{}" style="max-height:200px; max-width:200px; border:1px solid #ccc; border-radius:4px;" />',
         url,
     )
 
 
-# models.py is regenerated by inspectdb on every startup. During that step the
-# file is temporarily empty, so these imports can fail. Wrap in try/except so
-# Django's admin autodiscovery doesn't crash the management command pipeline.
-class AutoUuidAdmin(admin.ModelAdmin):
+def _renditions(key, width, height):
+    """Links to the game renditions of key at its row's declared size."""
+    renditions = ImageRendition.objects.filter(source_key=key, declared_width=width, declared_height=height)
+    if not renditions:
+        return '(none yet)'
+    return format_html_join(
+        format_html('<br>'), '<a href="{}">{}x{} {}</a> ({} bytes)',
+        ((public_url(r.key), r.width, r.height, r.format, r.size) for r in renditions),
+    )
+
+
+def _queued_message(scopes):
+    return f'Queued {len(scopes)} atlas build(s) for the build_atlases worker: {", ".join(scopes)}.'
+
+
+class ReleaseImageMixin:
+    """Drops the deleted rows' references to their images (uploads/dedup.py)."""
+    image_field = 'image_key'
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            release(getattr(obj, self.image_field))
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            keys = list(queryset.values_list(self.image_field, flat=True))
+            super().delete_queryset(request, queryset)
+            release(*keys)
+
+
+class AutoUuidAdmin(
+    AutocompleteForeignKeyMixin, TrigramSearchMixin, OptimizedChangelistMixin, LargeTablePaginationMixin,
+    admin.ModelAdmin,
+):
     """ModelAdmin that auto-generates a UUID for TextField primary keys."""
 
     def get_exclude(self, request, obj=None):
@@ -42,77 +91,148 @@ class AutoUuidAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
 
-try:
-    from core.models import Avatar, Element, Map, Mapelementplacement, Space, Spaceelementplacement
-    from core.forms import get_avatar_form, get_element_form, get_map_form
-
-    class AvatarAdmin(admin.ModelAdmin):
-        form = get_avatar_form(Avatar)
-        list_display = ('name', 'image_key', 'user', 'created_at')
-        readonly_fields = ('id', 'created_at', 'updated_at', 'image_preview')
-        search_fields = ('name',)
-
-        def image_preview(self, obj):
-            return _image_preview(obj.image_key)
+class AvatarAdmin(
+    ReleaseImageMixin, AutocompleteForeignKeyMixin, TrigramSearchMixin, OptimizedChangelistMixin,
+    LargeTablePaginationMixin, admin.ModelAdmin,
+):
+    form = get_avatar_form(Avatar)
+    list_display = ('name', 'image_key', 'user', 'created_at')
+    readonly_fields = ('id', 'created_at', 'updated_at', 'image_preview')
+    search_fields = ('name',)
+
+    def image_preview(self, obj):
+        return _image_preview(obj.image_key)
+
+    image_preview.short_description = 'Current Image'
+
+
+class ElementAdmin(
+    ReleaseImageMixin, AutocompleteForeignKeyMixin, TrigramSearchMixin, OptimizedChangelistMixin,
+    LargeTablePaginationMixin, admin.ModelAdmin,
+):
+    form = get_element_form(Element)
+    list_display = ('name', 'width', 'height', 'static', 'image_key', 'created_at')
+    readonly_fields = ('id', 'created_at', 'updated_at', 'image_preview', 'renditions')
+    search_fields = ('name',)
+    list_filter = ('static',)
+
+    actions = ['rebuild_sprite_atlases']
+
+    def image_preview(self, obj):
+        return _image_preview(obj.image_key)
+
+    image_preview.short_description = 'Current Image'
+
+    def renditions(self, obj):
+        return _renditions(obj.image_key, obj.width, obj.height)
+
+    @admin.action(description='Rebuild sprite atlases containing selected elements', permissions=['change'])
+    def rebuild_sprite_atlases(self, request, queryset):
+        scopes = scopes_for_elements(queryset.values_list('pk', flat=True))
+        request_builds(scopes)
+        self.message_user(request, _queued_message(scopes), messages.SUCCESS)
+
+
+class MapAdmin(
+    ReleaseImageMixin, PlacementTransferMixin, AutocompleteForeignKeyMixin, TrigramSearchMixin,
+    OptimizedChangelistMixin, LargeTablePaginationMixin, admin.ModelAdmin,
+):
+    form = get_map_form(Map)
+    image_field = 'thumbnail_key'
+    list_display = ('name', 'width', 'height', 'thumbnail_key', 'created_at')
+    readonly_fields = ('id', 'created_at', 'updated_at', 'thumbnail_preview', 'renditions')
+    search_fields = ('name',)
+    actions = ['create_spaces', 'build_sprite_atlases']
+
+    def thumbnail_preview(self, obj):
+        return _image_preview(obj.thumbnail_key)
+
+    thumbnail_preview.short_description = 'Current Thumbnail'
+
+    def renditions(self, obj):
+        return _renditions(obj.thumbnail_key, obj.width, obj.height)
+
+    @admin.action(description='Create spaces from selected maps', permissions=['add_space'])
+    def create_spaces(self, request, queryset):
+        form = InstantiateSpacesForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            count = form.cleaned_data['count']
+            total_spaces = total_placements = 0
+            with transaction.atomic():
+                for map_obj in queryset:
+                    name = form.cleaned_data['name'] or map_obj.name
+                    names = [name] if count == 1 else [f'{name} #{i}' for i in range(1, count + 1)]
+                    spaces, placements = instantiate_spaces(map_obj, names)
+                    total_spaces += len(spaces)
+                    total_placements += placements
+            self.message_user(
+                request,
+                f'Created {total_spaces} space(s) with {total_placements} placement(s).',
+                messages.SUCCESS,
+            )
+            return None
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'title': 'Create spaces from maps',
+            'form': form,
+            'queryset': queryset,
+            'action': 'create_spaces',
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'admin/core/map/create_spaces.html', context)
+
+    @admin.action(description='Build sprite atlases of selected maps', permissions=['change'])
+    def build_sprite_atlases(self, request, queryset):
+        scopes = [map_scope(pk) for pk in queryset.order_by('pk').values_list('pk', flat=True)]
+        request_builds(scopes)
+        self.message_user(request, _queued_message(scopes), messages.SUCCESS)
+
+    def has_add_space_permission(self, request):
+        return admin.site.get_model_admin(Space).has_add_permission(request)
+
+
+admin.site.register(Avatar, AvatarAdmin)
+admin.site.register(Element, ElementAdmin)
+admin.site.register(Map, MapAdmin)
+
+
+class SpaceAdmin(PlacementTransferMixin, AutoUuidAdmin):
+    readonly_fields = ('created_at', 'updated_at')
 
-        image_preview.short_description = 'Current Image'
-
-    class ElementAdmin(admin.ModelAdmin):
-        form = get_element_form(Element)
-        list_display = ('name', 'width', 'height', 'static', 'image_key', 'created_at')
-        readonly_fields = ('id', 'created_at', 'updated_at', 'image_preview')
-        search_fields = ('name',)
-        list_filter = ('static',)
-
-        def image_preview(self, obj):
-            return _image_preview(obj.image_key)
-
-        image_preview.short_description = 'Current Image'
-
-    class MapAdmin(admin.ModelAdmin):
-        form = get_map_form(Map)
-        list_display = ('name', 'width', 'height', 'thumbnail_key', 'created_at')
-        readonly_fields = ('id', 'created_at', 'updated_at', 'thumbnail_preview')
-        search_fields = ('name',)
-
-        def thumbnail_preview(self, obj):
-            return _image_preview(obj.thumbnail_key)
-
-        thumbnail_preview.short_description = 'Current Thumbnail'
+    def get_exclude(self, request, obj=None):
+        exclude = super().get_exclude(request, obj)
+        if obj is None:
+            exclude.extend(['created_at', 'updated_at', 'deleted_at'])
+        return exclude
 
-    admin.site.register(Avatar, AvatarAdmin)
-    admin.site.register(Element, ElementAdmin)
-    admin.site.register(Map, MapAdmin)
-    class SpaceAdmin(AutoUuidAdmin):
-        readonly_fields = ('created_at', 'updated_at')
+    def save_model(self, request, obj, form, change):
+        now = timezone.now()
+        if not change:
+            obj.created_at = now
+        obj.updated_at = now
+        super().save_model(request, obj, form, change)
+        if not change and obj.map_id:
+            # A new space starts with its map's default layout.
+            copy_map_placements(obj.map_id, [obj.pk])
 
-        def get_exclude(self, request, obj=None):
-            exclude = super().get_exclude(request, obj)
-            if obj is None:
-                exclude.extend(['created_at', 'updated_at', 'deleted_at'])
-            return exclude
 
-        def save_model(self, request, obj, form, change):
-            now = timezone.now()
-            if not change:
-                obj.created_at = now
-            obj.updated_at = now
-            super().save_model(request, obj, form, change)
+admin.site.register(Mapelementplacement, AutoUuidAdmin)
+admin.site.register(Space, SpaceAdmin)
+admin.site.register(Spaceelementplacement, AutoUuidAdmin)
 
-    admin.site.register(Mapelementplacement, AutoUuidAdmin)
-    admin.site.register(Space, SpaceAdmin)
-    admin.site.register(Spaceelementplacement, AutoUuidAdmin)
 
-except ImportError:
-    # Models not yet generated (inspectdb hasn't finished writing models.py).
-    # Custom admin classes will be available on the next management command in
-    # the startup chain (makemigrations, migrate, runserver).
-    pass
+class AutoRegisteredAdmin(
+    AutocompleteForeignKeyMixin, TrigramSearchMixin, OptimizedChangelistMixin, LargeTablePaginationMixin,
+    admin.ModelAdmin,
+):
+    """Admin for models without a hand-written one."""
 
 
 # Auto-register any models that weren't manually registered above.
 for model in apps.get_app_config('core').get_models():
     try:
-        admin.site.register(model)
+        admin.site.register(model, AutoRegisteredAdmin)
     except admin.sites.AlreadyRegistered:
         pass
@@ -0,0 +1,204 @@
+import io
+
+from django.contrib import messages
+from django.core.exceptions import FieldDoesNotExist, PermissionDenied
+from django.db import models
+from django.http import Http404, HttpResponseRedirect, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+
+from core.autocomplete import CachedAutocompleteSelect, supports_autocomplete
+from core.forms import PlacementImportForm
+from core.pagination import EstimatedCountPaginator, KeysetChangeList
+from core.placements import (
+    CONTENT_TYPES,
+    FORMATS,
+    PlacementImportError,
+    export_placements,
+    format_for_filename,
+    import_placements,
+)
+
+# Cap on the columns shown for admins that don't set list_display themselves.
+MAX_DEFAULT_COLUMNS = 8
+
+# Columns a changelist row never needs: secrets and wide blobs. They are
+# deferred on the model itself and on every select_related() FK target.
+DEFERRED_FIELDS = {'password_hash', 'token_hash', 'password', 'session_data', 'logs', 'change_message'}
+
+
+def deferred_field_names(model):
+    return [f.name for f in model._meta.concrete_fields if f.name in DEFERRED_FIELDS]
+
+
+def column_list_display(model):
+    """list_display for a model: its columns, minus DEFERRED_FIELDS."""
+    names = [f.name for f in model._meta.concrete_fields if f.name not in DEFERRED_FIELDS]
+    return names[:MAX_DEFAULT_COLUMNS] or ['__str__']
+
+
+def foreign_keys_in(model, names):
+    """FK fields among names (list_display entries that aren't fields are ignored)."""
+    fks = []
+    for name in names:
+        if not isinstance(name, str):
+            continue
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if isinstance(field, models.ForeignKey):
+            fks.append(field)
+    return fks
+
+
+class OptimizedChangelistMixin:
+    """ModelAdmin mixin that keeps changelist pages at a constant query count.
+
+    Django only select_related()s non-null FKs on its own, and every FK on the
+    Prisma tables is nullable, so each FK column in list_display costs one
+    query per row. This joins exactly the FKs shown in list_display and defers
+    sensitive/wide columns (DEFERRED_FIELDS) on the model and the joined rows.
+
+    Admins that leave list_display at Django's default ('__str__',) get the
+    model's columns instead, so FK values are visible (and joined).
+    """
+
+    def get_list_display(self, request):
+        list_display = super().get_list_display(request)
+        if tuple(list_display) == ('__str__',):
+            return column_list_display(self.model)
+        return list_display
+
+    def get_list_select_related(self, request):
+        if self.list_select_related:
+            return self.list_select_related
+        fks = foreign_keys_in(self.model, self.get_list_display(request))
+        return [f.name for f in fks] or False
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        match = getattr(request, 'resolver_match', None)
+        if not (match and match.url_name and match.url_name.endswith('_changelist')):
+            return qs
+
+        shown = set(self.get_list_display(request))
+        deferred = [name for name in deferred_field_names(self.model) if name not in shown]
+        for fk in foreign_keys_in(self.model, shown):
+            deferred += [f'{fk.name}__{name}' for name in deferred_field_names(fk.related_model)]
+        return qs.defer(*deferred) if deferred else qs
+
+
+class LargeTablePaginationMixin:
+    """ModelAdmin mixin for changelists over tables too big to count or page by offset.
+
+    Counts go through EstimatedCountPaginator, and the second unfiltered
+    "(N total)" count Django runs for filtered lists is turned off.
+
+    Deep pages can be browsed by cursor instead of page number through
+    KeysetChangeList (?cursor= in the query string).
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+class AutocompleteForeignKeyMixin:
+    """ModelAdmin mixin rendering every FK as an autocomplete (core.autocomplete).
+
+    Applies to FKs whose target admin has something to search; the rest, and
+    fields listed in raw_id_fields or radio_fields, keep Django's widgets.
+    """
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if (
+            'widget' not in kwargs
+            and db_field.name not in self.raw_id_fields
+            and db_field.name not in self.radio_fields
+            and supports_autocomplete(db_field, self.admin_site, request)
+        ):
+            kwargs['widget'] = CachedAutocompleteSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class PlacementTransferMixin:
+    """ModelAdmin mixin for Map/Space: bulk export and import of placements.
+
+    Adds "Export placements" and "Import placements" to the change page; the
+    work is done by core.placements.
+    """
+
+    change_form_template = 'admin/core/placement_owner_change_form.html'
+
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        urls = [
+            path(
+                '<path:object_id>/placements/export/',
+                self.admin_site.admin_view(self.export_placements_view),
+                name='%s_%s_export_placements' % info,
+            ),
+            path(
+                '<path:object_id>/placements/import/',
+                self.admin_site.admin_view(self.import_placements_view),
+                name='%s_%s_import_placements' % info,
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def _get_owner(self, request, object_id):
+        obj = self.get_object(request, object_id)
+        if obj is None:
+            raise Http404(f'{self.opts.verbose_name} {object_id!r} does not exist.')
+        return obj
+
+    def export_placements_view(self, request, object_id):
+        obj = self._get_owner(request, object_id)
+        if not self.has_view_or_change_permission(request, obj):
+            raise PermissionDenied
+        fmt = request.GET.get('format', 'csv')
+        if fmt not in FORMATS:
+            raise Http404(f'Unknown format {fmt!r}.')
+        response = StreamingHttpResponse(export_placements(obj, fmt), content_type=CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{self.opts.model_name}-{obj.pk}-placements.{fmt}"'
+        return response
+
+    def import_placements_view(self, request, object_id):
+        obj = self._get_owner(request, object_id)
+        if not self.has_change_permission(request, obj):
+            raise PermissionDenied
+
+        if request.method == 'POST':
+            form = PlacementImportForm(request.POST, request.FILES)
+            if form.is_valid():
+                uploaded = form.cleaned_data['file']
+                fmt = form.cleaned_data['format'] or format_for_filename(uploaded.name)
+                lines = io.TextIOWrapper(uploaded.file, encoding='utf-8-sig', newline='')
+                try:
+                    report = import_placements(obj, lines, fmt, replace=form.cleaned_data['replace'])
+                except PlacementImportError as e:
+                    for error in e.errors:
+                        form.add_error('file', error)
+                else:
+                    self.message_user(
+                        request,
+                        f'Imported placements: {report.created} created, {report.updated} updated, '
+                        f'{report.deleted} deleted in {report.elapsed:.2f}s.',
+                        messages.SUCCESS,
+                    )
+                    info = self.opts.app_label, self.opts.model_name
+                    return HttpResponseRedirect(reverse('admin:%s_%s_change' % info, args=[obj.pk]))
+        else:
+            form = PlacementImportForm()
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'original': obj,
+            'title': f'Import placements into {obj}',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/core/import_placements.html', context)
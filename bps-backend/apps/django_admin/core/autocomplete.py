@@ -0,0 +1,129 @@
+"""
+Autocomplete widgets for foreign keys, backed by a cached JSON search.
+
+A plain FK field renders a <select> with every row of the referenced table.
+CachedAutocompleteSelect is Django's select2 autocomplete widget instead: the
+form renders only the current value, and options are fetched as the user
+types from CachedAutocompleteJsonView. That is Django's own admin
+autocomplete view (same parameters, permission checks and search through
+the target ModelAdmin) with its JSON responses kept in RESULTS, a TTL + LRU
+cache in this process:
+
+- key: referenced model, source field, normalised term and page;
+- entries expire after ADMIN_AUTOCOMPLETE_CACHE_TTL seconds, and past
+  ADMIN_AUTOCOMPLETE_CACHE_SIZE entries the least recently used are dropped;
+- saving or deleting a row of a model drops that model's entries.
+  Bulk writes send no signals, so for those only the TTL applies.
+
+Permission checks run on every request, cached or not.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.admin.views.autocomplete import AutocompleteJsonView
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import PermissionDenied
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+from django.urls import reverse
+
+
+class TTLCache:
+    """Thread-safe mapping whose entries expire after ttl seconds, evicting LRU beyond maxsize."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, predicate):
+        """Drop every entry whose key matches predicate."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+RESULTS = TTLCache(settings.ADMIN_AUTOCOMPLETE_CACHE_SIZE, settings.ADMIN_AUTOCOMPLETE_CACHE_TTL)
+
+
+def _forget_model(sender, **kwargs):
+    if RESULTS:
+        label = sender._meta.label
+        RESULTS.discard(lambda key: key[0] == label)
+
+
+post_save.connect(_forget_model, dispatch_uid='core.autocomplete.post_save')
+post_delete.connect(_forget_model, dispatch_uid='core.autocomplete.post_delete')
+
+
+class CachedAutocompleteJsonView(AutocompleteJsonView):
+    def get_queryset(self):
+        qs = super().get_queryset()
+        # Pages are cached independently, so they must come from one stable order.
+        return qs if qs.ordered else qs.order_by(*self.model_admin.get_ordering(self.request) or ['pk'])
+
+    def get(self, request, *args, **kwargs):
+        term, model_admin, source_field, to_field_name = self.process_request(request)
+        self.model_admin = model_admin
+        if not self.has_perm(request):
+            raise PermissionDenied
+
+        key = (
+            model_admin.model._meta.label,
+            source_field.model._meta.label,
+            source_field.name,
+            ' '.join(term.split()).casefold(),
+            request.GET.get(self.page_kwarg, '1'),
+        )
+        body = RESULTS.get(key)
+        if body is None:
+            body = super().get(request, *args, **kwargs).content
+            RESULTS.set(key, body)
+            cache_status = 'MISS'
+        else:
+            cache_status = 'HIT'
+        response = HttpResponse(body, content_type='application/json')
+        response['X-Autocomplete-Cache'] = cache_status
+        return response
+
+
+class CachedAutocompleteSelect(AutocompleteSelect):
+    def get_url(self):
+        return reverse('cached_autocomplete')
+
+
+def supports_autocomplete(db_field, admin_site, request):
+    """Whether the FK's target is registered in admin_site with something to search."""
+    target = admin_site._registry.get(db_field.remote_field.model)
+    return target is not None and bool(target.get_search_fields(request))
@@ -0,0 +1,127 @@
+"""
+Latency, query count and page size of the admin pages, for bench_admin.
+
+Pages are fetched in-process with Django's test client, so what is measured
+is the view (queries, Python, template rendering), not a web server. Results
+are plain dicts so a run can be saved as JSON and compared with an earlier
+one by compare().
+"""
+
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib import admin
+from django.db import connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from core import s3
+
+APPS = ('core', 'uploads')
+
+# A run is a regression when p95 grows by more than this factor, or the
+# query count grows at all (query counts are deterministic, latency isn't).
+DEFAULT_THRESHOLD = 1.25
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def registered_admins():
+    """(model, ModelAdmin) for every model of APPS in the default admin site."""
+    return sorted(
+        ((model, model_admin) for model, model_admin in admin.site._registry.items()
+         if model._meta.app_label in APPS),
+        key=lambda item: item[0]._meta.label,
+    )
+
+
+def _search_term(model_admin, sample):
+    """A term the first searchable field of sample matches, or None."""
+    # No request: neither Django's nor TrigramSearchMixin's version looks at it.
+    for field in model_admin.get_search_fields(None):
+        name = field.lstrip('^=@')
+        if '__' in name or sample is None:
+            continue
+        value = str(getattr(sample, name, '') or '')
+        if value:
+            return value[:12]
+    return None
+
+
+def pages(model, model_admin):
+    """(view name, url) pairs to benchmark for one registered model."""
+    info = (model._meta.app_label, model._meta.model_name)
+    changelist = reverse('admin:%s_%s_changelist' % info)
+    yield 'changelist', changelist
+
+    sample = model._default_manager.order_by('pk').first()
+    term = _search_term(model_admin, sample)
+    if term:
+        yield 'search', f'{changelist}?{urlencode({"q": term})}'
+    if sample is not None:
+        yield 'change', reverse('admin:%s_%s_change' % info, args=[sample.pk])
+
+
+def measure(client, url, requests, warmup=1, using='default'):
+    """Fetch url warmup + requests times; stats over the timed requests."""
+    for _ in range(warmup):
+        client.get(url)
+    timings, queries = [], []
+    for _ in range(requests):
+        with CaptureQueriesContext(connections[using]) as captured:
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - start)
+        queries.append(len(captured))
+    return {
+        'status': response.status_code,
+        'p50_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'queries': max(queries),
+        'bytes': len(response.content),
+    }
+
+
+@contextmanager
+def stub_s3():
+    """Point core.s3 at an in-process moto S3 with an empty bucket."""
+    from moto import mock_aws
+
+    with mock_aws(), override_settings(
+        S3_ENDPOINT='https://s3.us-east-1.amazonaws.com',
+        S3_ACCESS_KEY='testing',
+        S3_SECRET_KEY='testing',
+        S3_BUCKET_NAME='bench-bucket',
+    ):
+        s3.reset_s3_client()
+        try:
+            s3.get_s3_client().create_bucket(Bucket=settings.S3_BUCKET_NAME)
+            yield
+        finally:
+            s3.reset_s3_client()
+
+
+def _key(result):
+    return result['size'], result['model'], result['view']
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Human-readable regressions of current against baseline (both run dicts)."""
+    before = {_key(r): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = before.get(_key(result))
+        if old is None:
+            continue
+        label = '%s %s at %s rows' % (result['model'], result['view'], result['size'])
+        if result['queries'] > old['queries']:
+            regressions.append(f'{label}: {old["queries"]} -> {result["queries"]} queries')
+        if result['p95_ms'] > old['p95_ms'] * threshold:
+            regressions.append(f'{label}: p95 {old["p95_ms"]:.1f} -> {result["p95_ms"]:.1f} ms')
+    return regressions
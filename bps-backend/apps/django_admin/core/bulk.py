@@ -0,0 +1,79 @@
+"""
+Fast bulk inserts: PostgreSQL COPY, with bulk_create as the portable fallback.
+"""
+
+import csv
+import io
+from datetime import datetime
+
+from django.db import connections, transaction
+
+# COPY's NULL marker; an unquoted empty field would be ambiguous with ''.
+NULL = r'\N'
+
+
+def copy_from(cursor, sql, fileobj):
+    """Run a COPY ... FROM STDIN with fileobj as the data, for psycopg2 or 3."""
+    raw = cursor.cursor  # Django's wrapper hides the driver's COPY API
+    if hasattr(raw, 'copy_expert'):  # psycopg2
+        raw.copy_expert(sql, fileobj)
+        return
+    with raw.copy(sql) as copy:  # psycopg 3
+        while data := fileobj.read(64 * 1024):
+            copy.write(data)
+
+
+def _copy_value(value):
+    if value is None:
+        return NULL
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return value
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_rows(model, fields, rows, batch_size=50_000, progress=None):
+    """Insert rows (tuples in `fields` order; attnames like 'map_id') into model's table.
+
+    rows can be any iterable, so callers can generate them lazily. Each batch
+    is one COPY on PostgreSQL, or bulk_create elsewhere, in its own
+    transaction. progress(inserted_so_far) is called after every batch.
+    Returns the number of rows inserted.
+    """
+    using = model.objects.db
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    columns = ', '.join(qn(model._meta.get_field(name).column) for name in fields)
+    sql = f'COPY {qn(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL \'{NULL}\')'
+
+    total = 0
+    for batch in _batches(rows, batch_size):
+        with transaction.atomic(using=using):
+            if connection.vendor == 'postgresql':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for row in batch:
+                    writer.writerow([_copy_value(v) for v in row])
+                buffer.seek(0)
+                with connection.cursor() as cursor:
+                    copy_from(cursor, sql, buffer)
+            else:
+                model.objects.bulk_create(
+                    [model(**dict(zip(fields, row))) for row in batch], batch_size=1000,
+                )
+        total += len(batch)
+        if progress:
+            progress(total)
+    return total
@@ -0,0 +1,91 @@
+"""
+Direct browser-to-S3 uploads for the admin image forms.
+
+With JavaScript enabled, picking a file hashes it in the browser and asks the
+presign_upload view for its content key (uploads/dedup.py). If that content is
+already stored the upload is skipped; otherwise the view returns a short-lived
+presigned POST policy bound to the key, the file's SHA-256 and the immutable
+Cache-Control, and the browser sends the file straight to the bucket. The form
+only submits the key. The server HEADs that key before saving. Without
+JavaScript the file input falls back to a normal upload through Django.
+"""
+
+import re
+
+from django import forms
+from django.conf import settings
+from django.urls import reverse_lazy
+
+from core.s3 import head_file, presigned_post
+from uploads.dedup import IMMUTABLE, StoredFile, content_key, is_stored
+
+# Key prefixes the browser may upload into, one per image form.
+UPLOAD_PREFIXES = ('avatars', 'elements', 'maps', 'uploads')
+
+
+class DirectUploadFileInput(forms.ClearableFileInput):
+    """File input that direct_upload.js turns into a browser-to-S3 upload."""
+
+    def __init__(self, prefix, attrs=None):
+        attrs = {
+            'data-direct-upload-url': reverse_lazy('presign_upload'),
+            'data-prefix': prefix,
+            'accept': 'image/*',
+            **(attrs or {}),
+        }
+        super().__init__(attrs=attrs)
+
+    class Media:
+        js = ['core/admin/direct_upload.js']
+
+
+def uploaded_key_field():
+    """Hidden field direct_upload.js fills with the key it uploaded to."""
+    return forms.CharField(required=False, widget=forms.HiddenInput)
+
+
+def presign(prefix, content_type, size, sha256):
+    """Return the content key for an upload, plus a presigned POST policy for it.
+
+    'exists' is true, and there is no policy, when the content is already
+    stored. Raises ValueError when the request is outside what we allow.
+    """
+    if prefix not in UPLOAD_PREFIXES:
+        raise ValueError('Unknown upload prefix.')
+    if not content_type.startswith('image/'):
+        raise ValueError('Only image uploads are allowed.')
+    if not 0 < size <= settings.S3_DIRECT_UPLOAD_MAX_SIZE:
+        raise ValueError(f'File must be between 1 byte and {settings.S3_DIRECT_UPLOAD_MAX_SIZE} bytes.')
+    if not re.fullmatch('[0-9a-f]{64}', sha256):
+        raise ValueError('sha256 must be 64 lowercase hex digits.')
+
+    key = content_key(prefix, sha256, content_type)
+    if is_stored(prefix, key, size):
+        return {'key': key, 'exists': True}
+    policy = presigned_post(
+        key,
+        content_type,
+        max_size=size,
+        expires_in=settings.S3_DIRECT_UPLOAD_EXPIRY,
+        cache_control=IMMUTABLE,
+        sha256=sha256,
+    )
+    return {'key': key, 'exists': False, **policy}
+
+
+def verify_uploaded_key(key, prefix):
+    """Check a browser-uploaded content key really exists under prefix. Returns its HEAD metadata."""
+    if not re.fullmatch(rf'{re.escape(prefix)}/[0-9a-f]{{64}}\.\w+', key):
+        raise forms.ValidationError('Uploaded file key is not valid for this form.')
+    head = head_file(key)
+    if head is None:
+        raise forms.ValidationError('The uploaded file was not found in storage. Please upload it again.')
+    if head.get('ContentLength', 0) > settings.S3_DIRECT_UPLOAD_MAX_SIZE:
+        raise forms.ValidationError('The uploaded file is too large.')
+    return head
+
+
+def uploaded_file(key, head):
+    """StoredFile for a key verify_uploaded_key() accepted, to pass to acquire()."""
+    sha256 = key.rsplit('/', 1)[-1].split('.', 1)[0]
+    return StoredFile(key, sha256, head.get('ContentLength'), uploaded=True)
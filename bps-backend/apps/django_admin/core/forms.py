@@ -1,18 +1,29 @@
 import uuid
 from django import forms
+from django.db import transaction
 from django.utils import timezone
-from core.s3 import upload_file, delete_file
+from core.direct_upload import DirectUploadFileInput, uploaded_file, uploaded_key_field, verify_uploaded_key
+from core.renditions import read_size
+from uploads.dedup import acquire, content_key, digest, release, store
+from uploads.transcoding import queue_rendition
 
 
-def _build_image_form(model_class, key_field: str, upload_label: str):
-    """Factory that returns a ModelForm subclass with an image upload field."""
+def _build_image_form(model_class, key_field: str, upload_label: str, renditions: bool = False):
+    """Factory that returns a ModelForm subclass with an image upload field.
+
+    With renditions, the model's width/height are the image's declared size
+    and saving a new image or size queues its renditions (core/renditions.py).
+    """
+    prefix = f'{model_class.__name__.lower()}s'
 
     class ImageUploadForm(forms.ModelForm):
         image_upload = forms.FileField(
             required=False,
             label=upload_label,
             help_text='Select a file to upload to S3. Leave empty to keep the current value.',
+            widget=DirectUploadFileInput(prefix),
         )
+        uploaded_key = uploaded_key_field()
 
         class Meta:
             model = model_class
@@ -26,18 +37,43 @@ def _build_image_form(model_class, key_field: str, upload_label: str):
                     'Auto-filled when uploading an image. Can also be set manually.'
                 )
 
+        def clean_uploaded_key(self):
+            key = self.cleaned_data.get('uploaded_key')
+            if key:
+                self._direct_head = verify_uploaded_key(key, prefix)
+            return key
+
         def clean(self):
             cleaned = super().clean()
-            uploaded = cleaned.get('image_upload')
+            uploaded = cleaned.get('image_upload') or cleaned.get('uploaded_key')
             key_value = cleaned.get(key_field)
             existing_key = getattr(self.instance, key_field, None)
             if not uploaded and not key_value and not existing_key:
                 raise forms.ValidationError(
                     f'Either upload an image or provide a value for {key_field}.'
                 )
+            upload = cleaned.get('image_upload')
+            if upload and not cleaned.get('uploaded_key'):
+                # Hash now so the content key is on the instance when the
+                # model's unique checks run (e.g. Element's image_key + static).
+                self._digest = digest(upload.chunks())
+                cleaned[key_field] = content_key(prefix, self._digest[0], self._content_type(upload))
+                # Header only: how big the source is decides where it's rendered.
+                self._source_size = read_size(upload)
             return cleaned
 
+        @staticmethod
+        def _content_type(uploaded):
+            return uploaded.content_type or 'application/octet-stream'
+
         def save(self, commit=True):
+            # The admin calls save(commit=False) inside its own atomic block and
+            # saves the instance right after, so the queued deletion below
+            # commits or rolls back together with the model row either way.
+            with transaction.atomic():
+                return self._save(commit)
+
+        def _save(self, commit):
             instance = super().save(commit=False)
 
             if not instance.pk:
@@ -49,19 +85,36 @@ def _build_image_form(model_class, key_field: str, upload_label: str):
             instance.updated_at = now
 
             uploaded = self.cleaned_data.get('image_upload')
-            if uploaded:
-                old_key = getattr(instance, key_field, None)
-
-                ext = uploaded.name.rsplit('.', 1)[-1] if '.' in uploaded.name else 'bin'
-                key = f'{model_class.__name__.lower()}s/{uuid.uuid4()}.{ext}'
-                upload_file(key, uploaded.read(), uploaded.content_type or 'application/octet-stream')
+            # Set when the browser already uploaded the file straight to S3.
+            direct_key = self.cleaned_data.get('uploaded_key')
+            # The key the row pointed at before this edit.
+            old_key = self.initial.get(key_field) or None
+            stored = None
+            if direct_key:
+                stored = uploaded_file(direct_key, self._direct_head)
+                key = direct_key
+            elif uploaded:
+                sha256, size = self._digest
+                stored = store(prefix, uploaded.chunks, self._content_type(uploaded), sha256, size)
+                key = stored.key
+            else:
+                # Unchanged, or typed in by hand.
+                key = getattr(instance, key_field) or None
+            if key:
                 setattr(instance, key_field, key)
 
-                if old_key and old_key != key:
-                    try:
-                        delete_file(old_key)
-                    except Exception:
-                        pass
+            # Same rule for every source of the key: a new key gains a
+            # reference and the old one loses its own; an unchanged key keeps
+            # the reference it already has.
+            if key != old_key:
+                if key:
+                    acquire(key, stored=[stored] if stored else ())
+                if old_key:
+                    release(old_key)
+
+            if renditions and key and (key != old_key or {'width', 'height'} & set(self.changed_data)):
+                size = getattr(self, '_source_size', None) if uploaded and not direct_key else None
+                queue_rendition(key, instance.width, instance.height, pixels=size and size[0] * size[1])
 
             if commit:
                 instance.save()
@@ -75,8 +128,32 @@ def get_avatar_form(model_class):
 
 
 def get_element_form(model_class):
-    return _build_image_form(model_class, 'image_key', 'Upload element image')
+    return _build_image_form(model_class, 'image_key', 'Upload element image', renditions=True)
 
 
 def get_map_form(model_class):
-    return _build_image_form(model_class, 'thumbnail_key', 'Upload map thumbnail')
+    return _build_image_form(model_class, 'thumbnail_key', 'Upload map thumbnail', renditions=True)
+
+
+class PlacementImportForm(forms.Form):
+    file = forms.FileField(label='Placements file', help_text='CSV with an id,element_id,x,y,scale,rotation header, or JSONL.')
+    format = forms.ChoiceField(
+        choices=[('', 'From file extension'), ('csv', 'CSV'), ('jsonl', 'JSONL')],
+        required=False,
+    )
+    replace = forms.BooleanField(
+        required=False,
+        label='Replace existing placements',
+        help_text='Delete placements that are not in the file.',
+    )
+
+
+class InstantiateSpacesForm(forms.Form):
+    count = forms.IntegerField(
+        min_value=1, max_value=1000, initial=1,
+        help_text='Spaces to create from each selected map.',
+    )
+    name = forms.CharField(
+        required=False,
+        help_text='Defaults to the map name. With more than one space, "#1", "#2", ... is appended.',
+    )
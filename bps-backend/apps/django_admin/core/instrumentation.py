@@ -0,0 +1,161 @@
+"""
+Instrumentation for the storage operations in core.s3.
+
+Each public function in core.s3 runs its client calls inside operation(). That
+produces one S3Operation per call: which operation, the key prefix (atlases/,
+avatars/, elements/, maps/, uploads/ or other), time taken, bytes moved, and the error
+if there was one. The S3Operation is handed to every configured sink:
+
+- RegistrySink: latency histograms and byte/error counters in core.metrics,
+  shown on /metrics and on the admin's S3 metrics page.
+- LoggingSink: a DEBUG line per operation, WARNING for failures.
+- core.timing.RequestTimingSink: the s3 part of the request's Server-Timing.
+- TracingSink: an OpenTelemetry span per operation (needs opentelemetry-api).
+
+Sinks are dotted paths in settings.S3_INSTRUMENTATION_SINKS. A sink is any
+callable taking an S3Operation, so tests and ad-hoc debugging can add their
+own. When no sinks are configured, all an operation costs is a perf_counter()
+call and a loop over an empty list.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from core.metrics import REGISTRY
+
+logger = logging.getLogger('core.s3')
+
+PREFIXES = ('atlases', 'avatars', 'elements', 'maps', 'uploads')
+
+# Storage-scale buckets, in seconds: small PUTs to MinIO up to slow multipart uploads.
+LATENCY_BUCKETS = (0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+OPERATION_SECONDS = REGISTRY.histogram(
+    's3_operation_seconds', 'Latency of S3 operations.', ['operation', 'prefix'], buckets=LATENCY_BUCKETS,
+)
+BYTES = REGISTRY.counter('s3_bytes', 'Bytes uploaded or downloaded.', ['operation', 'prefix'])
+ERRORS = REGISTRY.counter('s3_errors', 'Failed S3 operations (per key for batch deletes).', ['operation', 'prefix'])
+
+
+def prefix_of(key):
+    head = key.split('/', 1)[0] if key else ''
+    return head if head in PREFIXES else 'other'
+
+
+def common_prefix(keys):
+    prefixes = {prefix_of(key) for key in keys}
+    return prefixes.pop() if len(prefixes) == 1 else 'mixed'
+
+
+@dataclass
+class S3Operation:
+    operation: str
+    prefix: str
+    key: str = ''
+    bytes: int = 0
+    seconds: float = 0.0
+    started_at_ns: int = 0  # wall clock, for spans
+    error: str = ''  # exception class name
+    failed_keys: list = field(default_factory=list)  # batch deletes only
+
+    @property
+    def ok(self):
+        return not self.error and not self.failed_keys
+
+
+class RegistrySink:
+    def __call__(self, op):
+        OPERATION_SECONDS.observe(op.seconds, operation=op.operation, prefix=op.prefix)
+        if op.bytes:
+            BYTES.inc(op.bytes, operation=op.operation, prefix=op.prefix)
+        if op.error:
+            ERRORS.inc(operation=op.operation, prefix=op.prefix)
+        for key in op.failed_keys:
+            ERRORS.inc(operation=op.operation, prefix=prefix_of(key))
+
+
+class LoggingSink:
+    def __call__(self, op):
+        if not op.ok:
+            logger.warning(
+                'S3 %s %s failed after %.1f ms: %s', op.operation, op.key or op.prefix, op.seconds * 1000,
+                op.error or f'{len(op.failed_keys)} keys not deleted',
+            )
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug('S3 %s %s: %d bytes in %.1f ms', op.operation, op.key or op.prefix, op.bytes, op.seconds * 1000)
+
+
+class TracingSink:
+    """One OpenTelemetry span per operation, created after the fact with its real start and end."""
+
+    def __init__(self):
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            raise ImproperlyConfigured('TracingSink needs opentelemetry-api installed.')
+        self.trace = trace
+        self.tracer = trace.get_tracer('core.s3')
+
+    def __call__(self, op):
+        span = self.tracer.start_span(
+            f's3.{op.operation}',
+            kind=self.trace.SpanKind.CLIENT,
+            start_time=op.started_at_ns,
+            attributes={
+                'rpc.system': 'aws-api',
+                'rpc.service': 'S3',
+                'aws.s3.bucket': settings.S3_BUCKET_NAME or '',
+                'aws.s3.key': op.key,
+                's3.prefix': op.prefix,
+                's3.bytes': op.bytes,
+            },
+        )
+        if not op.ok:
+            span.set_status(self.trace.Status(self.trace.StatusCode.ERROR, op.error or 'partial failure'))
+        span.end(end_time=op.started_at_ns + int(op.seconds * 1e9))
+
+
+_sinks = None
+
+
+def sinks():
+    global _sinks
+    if _sinks is None:
+        _sinks = [import_string(path)() for path in settings.S3_INSTRUMENTATION_SINKS]
+    return _sinks
+
+
+def _reset_sinks(setting, **kwargs):
+    global _sinks
+    if setting == 'S3_INSTRUMENTATION_SINKS':
+        _sinks = None
+
+
+setting_changed.connect(_reset_sinks)
+
+
+@contextmanager
+def operation(name, key='', prefix=None):
+    """Time the block as one S3 operation; the block may set op.bytes / op.failed_keys."""
+    op = S3Operation(name, prefix or prefix_of(key), key, started_at_ns=time.time_ns())
+    start = time.perf_counter()
+    try:
+        yield op
+    except BaseException as exc:
+        op.error = type(exc).__name__
+        raise
+    finally:
+        op.seconds = time.perf_counter() - start
+        for sink in sinks():
+            try:
+                sink(op)
+            except Exception:
+                # Instrumentation must never break the storage call itself.
+                logger.exception('S3 instrumentation sink %r failed', sink)
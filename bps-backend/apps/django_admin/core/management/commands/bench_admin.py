@@ -0,0 +1,123 @@
+import json
+import uuid
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User as DjangoUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.benchmark import DEFAULT_THRESHOLD, compare, measure, pages, registered_admins, stub_s3
+from core.bulk import insert_rows
+from core.synthetic import TABLES, Counts, already_generated, generate
+from uploads.models import UploadedImage
+
+
+class _Rollback(Exception):
+    pass
+
+
+def counts_for(size):
+    """Table sizes for a dataset of `size`: users and each placement table get size rows."""
+    return Counts(
+        users=size, avatars=max(1, size // 100), elements=max(1, size // 20), maps=max(1, size // 200),
+        spaces=max(1, size // 10), map_placements=size, space_placements=size, tokens_per_user=1,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the changelist, search and change pages of every model registered by core and '
+        'uploads at several dataset sizes: p50/p95 latency, query count and bytes rendered. '
+        'Data is generated inside a transaction that is rolled back, and S3 is an in-process moto fake.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+        parser.add_argument('--requests', type=int, default=20, help='Timed requests per page.')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed requests per page first.')
+        parser.add_argument('--models', nargs='+', help='Only these models (app_label.Model).')
+        parser.add_argument('--seed', type=int, default=9001, help='Synthetic data seed (core.synthetic).')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', help='Earlier --output file; fail if this run regressed against it.')
+        parser.add_argument(
+            '--threshold', type=float, default=DEFAULT_THRESHOLD,
+            help='p95 growth factor counted as a regression (any extra query always is).',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            import moto  # noqa: F401
+        except ImportError:
+            raise CommandError('moto is not installed (uv sync --group dev).')
+        if already_generated(options['seed']):
+            raise CommandError(f'Synthetic data for seed {options["seed"]} already exists; use another --seed.')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Cannot read {options["compare"]}: {e}')
+
+        run = {
+            'started_at': timezone.now().isoformat(),
+            'vendor': connection.vendor,
+            'django': django.get_version(),
+            'sizes': options['sizes'],
+            'requests': options['requests'],
+            'results': [],
+        }
+        with stub_s3(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for size in options['sizes']:
+                try:
+                    with transaction.atomic():
+                        self._load(size, options['seed'])
+                        run['results'] += self._bench(size, options)
+                        raise _Rollback
+                except _Rollback:
+                    pass
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(run, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}.')
+        if baseline is not None:
+            regressions = compare(baseline, run, options['threshold'])
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(line))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions against {options["compare"]}.')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["compare"]}.'))
+
+    def _load(self, size, seed):
+        self.stdout.write(f'Loading {size:,}-row dataset...')
+        generate(seed, counts_for(size))
+        now = timezone.now()
+        insert_rows(UploadedImage, ('id', 's3_key', 'original_filename', 'content_type', 'uploaded_at'), (
+            (uuid.UUID(int=i), f'uploads/bench-{seed}-{i}.png', f'bench-{i}.png', 'image/png', now)
+            for i in range(max(1, size // 10))
+        ))
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for _, model, _, _ in TABLES:
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+    def _bench(self, size, options):
+        client = Client()
+        client.force_login(DjangoUser.objects.create_superuser(f'bench-{uuid.uuid4().hex}', password=None))
+        results = []
+        for model, model_admin in registered_admins():
+            if options['models'] and model._meta.label not in options['models']:
+                continue
+            for view, url in pages(model, model_admin):
+                stats = measure(client, url, options['requests'], options['warmup'])
+                results.append({'size': size, 'model': model._meta.label, 'view': view, **stats})
+                self.stdout.write('%9s  %-32s %-10s p50 %8.2f ms  p95 %8.2f ms  %4d queries  %8d bytes%s' % (
+                    f'{size:,}', model._meta.label, view, stats['p50_ms'], stats['p95_ms'],
+                    stats['queries'], stats['bytes'], '' if stats['status'] == 200 else f'  HTTP {stats["status"]}',
+                ))
+        return results
@@ -0,0 +1,87 @@
+import statistics
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from core import s3
+
+
+def _summarise(samples):
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return statistics.mean(ordered), statistics.median(ordered), p95
+
+
+class Command(BaseCommand):
+    help = (
+        'Micro-benchmark S3 latency: a new client per call (the old behaviour) '
+        'versus the shared pooled client from core.s3.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--size', type=int, default=64 * 1024, help='Object size in bytes.')
+        parser.add_argument(
+            '--moto', action='store_true',
+            help='Run against an in-process moto server instead of S3_ENDPOINT.',
+        )
+        parser.add_argument('--moto-port', type=int, default=5055)
+
+    def handle(self, *args, **options):
+        if options['moto']:
+            try:
+                from moto.server import ThreadedMotoServer
+            except ImportError:
+                raise CommandError('moto is not installed (uv sync --group dev).')
+            server = ThreadedMotoServer(port=options['moto_port'], verbose=False)
+            server.start()
+            try:
+                with override_settings(
+                    S3_ENDPOINT=f'http://127.0.0.1:{options["moto_port"]}',
+                    S3_ACCESS_KEY='testing',
+                    S3_SECRET_KEY='testing',
+                    S3_BUCKET_NAME='bench-bucket',
+                ):
+                    s3.reset_s3_client()
+                    s3.get_s3_client().create_bucket(Bucket=settings.S3_BUCKET_NAME)
+                    self._run(options)
+            finally:
+                s3.reset_s3_client()
+                server.stop()
+        else:
+            self._run(options)
+
+    def _run(self, options):
+        body = b'\0' * options['size']
+        iterations = options['iterations']
+        prefix = f'bench/{uuid.uuid4()}'
+
+        def per_call(i):
+            client = s3.new_s3_client()
+            key = f'{prefix}/per-call-{i}'
+            client.put_object(Bucket=settings.S3_BUCKET_NAME, Key=key, Body=body)
+            client = s3.new_s3_client()
+            client.delete_object(Bucket=settings.S3_BUCKET_NAME, Key=key)
+
+        def pooled(i):
+            key = f'{prefix}/pooled-{i}'
+            s3.upload_file(key, body, 'application/octet-stream')
+            s3.delete_file(key)
+
+        # Warm the shared client so its one-off construction isn't measured.
+        s3.get_s3_client()
+
+        for label, fn in (('per-call client', per_call), ('pooled client', pooled)):
+            samples = []
+            for i in range(iterations):
+                start = time.perf_counter()
+                fn(i)
+                samples.append((time.perf_counter() - start) * 1000)
+            mean, p50, p95 = _summarise(samples)
+            self.stdout.write(
+                f'{label:<16} put+delete x{iterations}: '
+                f'mean={mean:.2f}ms p50={p50:.2f}ms p95={p95:.2f}ms'
+            )
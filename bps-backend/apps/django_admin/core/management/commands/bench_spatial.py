@@ -0,0 +1,122 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Element, Map
+from core.placements import import_placements
+from core.spatial import footprint, nearest, placements, viewport
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return statistics.median(ordered) * 1000, p95 * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark viewport and nearest-neighbour placement queries at several map sizes. '
+        'Everything is created inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--queries', type=int, default=50, help='Queries per size and kind.')
+        parser.add_argument('--viewport', type=int, default=1000, help='Viewport side in map units.')
+        parser.add_argument('--k', type=int, default=10, help='Neighbours per nearest() query.')
+        parser.add_argument(
+            '--baseline', type=int, default=3,
+            help='Viewport queries answered the old way (load every placement) for comparison; 0 to skip.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stderr.write(self.style.WARNING(
+                'Not PostgreSQL: the GiST index is not used, so timings are not representative.'
+            ))
+        rng = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                elements = self._make_elements(rng)
+                for size in options['sizes']:
+                    self._bench(size, elements, rng, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _make_elements(self, rng):
+        now = timezone.now()
+        return Element.objects.bulk_create([
+            Element(
+                id=f'bench-element-{i}', name=f'Bench element {i}', image_key=f'elements/bench-{i}.png',
+                width=rng.randint(16, 256), height=rng.randint(16, 256), static=True,
+                created_at=now, updated_at=now,
+            )
+            for i in range(50)
+        ])
+
+    def _bench(self, size, elements, rng, options):
+        # Constant density: the map grows with the number of placements, so
+        # a viewport holds about the same number of rows at every size.
+        side = int((size * 2500) ** 0.5)
+        now = timezone.now()
+        owner = Map.objects.create(
+            id=f'bench-map-{size}', name=f'Bench {size}', width=side, height=side,
+            thumbnail_key='maps/bench.png', created_at=now, updated_at=now,
+        )
+
+        def lines():
+            yield 'id,element_id,x,y,scale,rotation\n'
+            for i in range(size):
+                element = rng.choice(elements).id
+                rotation = rng.choice((0, 0, 0, 90))
+                yield f'bench-{size}-{i},{element},{rng.randrange(side)},{rng.randrange(side)},{rng.uniform(0.5, 2):.3f},{rotation}\n'
+
+        start = time.perf_counter()
+        import_placements(owner, lines(), 'csv')
+        load = time.perf_counter() - start
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE "MapElementPlacement"')
+
+        view = options['viewport']
+        boxes = [(x, y, x + view, y + view) for x, y in
+                 ((rng.randrange(side), rng.randrange(side)) for _ in range(options['queries']))]
+
+        viewport_times, hits = [], []
+        for box in boxes:
+            start = time.perf_counter()
+            hits.append(len(list(viewport(owner, *box))))
+            viewport_times.append(time.perf_counter() - start)
+
+        nearest_times = []
+        for x, y, _, _ in boxes:
+            start = time.perf_counter()
+            nearest(owner, x, y, options['k'])
+            nearest_times.append(time.perf_counter() - start)
+
+        self.stdout.write(f'{size:>9,} placements  (loaded in {load:.1f}s, {size / load:,.0f} rows/s)')
+        self.stdout.write('    viewport  p50 %7.2f ms  p95 %7.2f ms  avg %.0f rows' % (
+            *_percentiles(viewport_times), statistics.mean(hits)))
+        self.stdout.write('    nearest   p50 %7.2f ms  p95 %7.2f ms  k=%d' % (
+            *_percentiles(nearest_times), options['k']))
+
+        if options['baseline']:
+            baseline_times = []
+            for x0, y0, x1, y1 in boxes[:options['baseline']]:
+                start = time.perf_counter()
+                [
+                    p for p in placements(owner)
+                    if (b := footprint(p))[0] <= x1 and b[2] >= x0 and b[1] <= y1 and b[3] >= y0
+                ]
+                baseline_times.append(time.perf_counter() - start)
+            self.stdout.write('    load-all  p50 %7.2f ms  p95 %7.2f ms  (previous approach)' % _percentiles(baseline_times))
@@ -1,32 +1,11 @@
 import getpass
-import secrets
-import string
 
-import argon2
 from django.contrib.auth.models import User as DjangoUser
 from django.core.management.base import BaseCommand, CommandError
 from django.db import connection
 from django.utils import timezone
 
-
-def generate_cuid():
-    """Generate a CUID-compatible unique identifier (lowercase letter + 23 alphanumeric chars)."""
-    alphabet = string.ascii_lowercase + string.digits
-    first = secrets.choice(string.ascii_lowercase)
-    rest = ''.join(secrets.choice(alphabet) for _ in range(23))
-    return first + rest
-
-
-def slow_hash(password):
-    """Hash a password with argon2id, matching the Node.js slowHash parameters:
-    timeCost=2, memoryCost=2^14 (16384 KiB), parallelism=1."""
-    hasher = argon2.PasswordHasher(
-        time_cost=2,
-        memory_cost=2 ** 14,
-        parallelism=1,
-        type=argon2.Type.ID,
-    )
-    return hasher.hash(password)
+from core.hashing import generate_cuid, slow_hash
 
 
 class Command(BaseCommand):
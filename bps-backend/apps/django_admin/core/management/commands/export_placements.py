@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Map, Space
+from core.placements import FORMATS, export_placements, format_for_filename
+
+OWNERS = {'map': Map, 'space': Space}
+
+
+class Command(BaseCommand):
+    help = 'Stream every placement of a map or space to a CSV or JSONL file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('owner', choices=sorted(OWNERS))
+        parser.add_argument('id', help='Map or Space id.')
+        parser.add_argument('--output', '-o', default='-', help='File to write (default: stdout).')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from --output, else csv.')
+
+    def handle(self, *args, **options):
+        model = OWNERS[options['owner']]
+        try:
+            owner = model.objects.get(pk=options['id'])
+        except model.DoesNotExist:
+            raise CommandError(f'No {options["owner"]} with id {options["id"]!r}.')
+
+        output = options['output']
+        fmt = options['format'] or format_for_filename(output)
+        out = sys.stdout if output == '-' else open(output, 'w', newline='', encoding='utf-8')
+        try:
+            for line in export_placements(owner, fmt):
+                out.write(line)
+        finally:
+            if out is not sys.stdout:
+                out.close()
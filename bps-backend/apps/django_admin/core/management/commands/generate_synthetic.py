@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.synthetic import Counts, already_generated, generate
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with deterministic synthetic users, maps, elements, spaces, placements '
+        'and refresh tokens for scale testing. The same --seed and counts always give the same rows.'
+    )
+
+    def add_arguments(self, parser):
+        defaults = Counts()
+        parser.add_argument('--seed', type=int, default=0, help='Also prefixes every id (s<seed>-...).')
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--avatars', type=int, default=defaults.avatars)
+        parser.add_argument('--elements', type=int, default=defaults.elements)
+        parser.add_argument('--maps', type=int, default=defaults.maps)
+        parser.add_argument('--spaces', type=int, default=defaults.spaces)
+        parser.add_argument('--map-placements', type=int, default=defaults.map_placements)
+        parser.add_argument('--space-placements', type=int, default=defaults.space_placements)
+        parser.add_argument(
+            '--tokens-per-user', type=float, default=defaults.tokens_per_user,
+            help='Mean refresh tokens per user (exponentially distributed).',
+        )
+        parser.add_argument('--batch-size', type=int, default=50_000, help='Rows per COPY / bulk insert.')
+
+    def handle(self, *args, **options):
+        counts = Counts(
+            users=options['users'], avatars=options['avatars'], elements=options['elements'],
+            maps=options['maps'], spaces=options['spaces'],
+            map_placements=options['map_placements'], space_placements=options['space_placements'],
+            tokens_per_user=options['tokens_per_user'],
+        )
+        if min(counts.users, counts.elements, counts.maps) < 1:
+            raise CommandError('--users, --elements and --maps must be at least 1.')
+        if counts.space_placements and not counts.spaces:
+            raise CommandError('--space-placements needs at least one space.')
+        if already_generated(options['seed']):
+            raise CommandError(f'Data for seed {options["seed"]} already exists; use another --seed.')
+
+        start = time.perf_counter()
+        last = {'at': start}
+
+        def progress(label, inserted):
+            now = time.perf_counter()
+            # At most a line a second; a line per batch floods the terminal.
+            if now - last['at'] >= 1:
+                last['at'] = now
+                self.stdout.write(f'  {label}: {inserted:,} rows...')
+
+        report = generate(options['seed'], counts, batch_size=options['batch_size'], progress=progress)
+        for label, rows, elapsed in report:
+            rate = rows / elapsed if elapsed else 0
+            self.stdout.write(f'{label:>16}: {rows:>12,} rows in {elapsed:6.1f}s ({rate:,.0f} rows/s)')
+        total = sum(rows for _, rows, _ in report)
+        self.stdout.write(self.style.SUCCESS(
+            f'{total:,} rows for seed {options["seed"]} in {time.perf_counter() - start:.1f}s.'
+        ))
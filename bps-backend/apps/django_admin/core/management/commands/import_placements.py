@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.management.commands.export_placements import OWNERS
+from core.placements import FORMATS, PlacementImportError, format_for_filename, import_placements
+
+
+class Command(BaseCommand):
+    help = (
+        'Upsert the placements of a map or space from a CSV or JSONL file '
+        '(COPY into a staging table on PostgreSQL).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('owner', choices=sorted(OWNERS))
+        parser.add_argument('id', help='Map or Space id.')
+        parser.add_argument('file')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension.')
+        parser.add_argument('--replace', action='store_true', help='Delete placements not in the file.')
+
+    def handle(self, *args, **options):
+        model = OWNERS[options['owner']]
+        try:
+            owner = model.objects.get(pk=options['id'])
+        except model.DoesNotExist:
+            raise CommandError(f'No {options["owner"]} with id {options["id"]!r}.')
+
+        fmt = options['format'] or format_for_filename(options['file'])
+        try:
+            with open(options['file'], newline='', encoding='utf-8-sig') as lines:
+                report = import_placements(owner, lines, fmt, replace=options['replace'])
+        except OSError as e:
+            raise CommandError(str(e))
+        except PlacementImportError as e:
+            raise CommandError('\n'.join(e.errors))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.created} created, {report.updated} updated, {report.deleted} deleted '
+            f'in {report.elapsed:.2f}s ({report.rows_per_second:.0f} rows/s).'
+        ))
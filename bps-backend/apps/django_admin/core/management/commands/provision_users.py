@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Role
+from core.placements import format_for_filename
+from core.provisioning import BATCH_SIZE, available_cores, provision_users, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        'Create app users in bulk from a CSV (name,email[,password,handle,role]) or JSONL file, '
+        'hashing passwords on a process pool.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='Default: from the file extension.')
+        parser.add_argument('--password', help='Password for rows that have none.')
+        parser.add_argument('--role', choices=Role.values, default=Role.USER, help='Role for rows that have none.')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help=f'Hashing processes (default: available cores, {available_cores()} here).',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Users per INSERT.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or format_for_filename(options['file'])
+
+        def progress(created):
+            self.stdout.write(f'{created} users created...')
+
+        try:
+            with open(options['file'], newline='', encoding='utf-8-sig') as lines:
+                report = provision_users(
+                    read_records(lines, fmt),
+                    default_password=options['password'],
+                    role=options['role'],
+                    workers=options['workers'],
+                    batch_size=options['batch_size'],
+                    progress=progress,
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for line, reason in sorted(report.skipped):
+            self.stdout.write(self.style.WARNING(f'Skipped line {line}: {reason}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.created} users created, {len(report.skipped)} skipped in {report.elapsed:.1f}s '
+            f'({report.users_per_second:.1f} users/s on {report.workers} hashing processes).'
+        ))
@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Refreshtoken
+from core.purge import PurgeTarget, purge_in_batches
+
+TARGETS = ('tokens', 'sessions')
+
+
+def purge_targets(now, keep, only=TARGETS):
+    """Expired/revoked refresh tokens and expired Django sessions, each walked by its index."""
+    cutoff = now - keep
+    targets = []
+    if 'tokens' in only:
+        targets += [
+            PurgeTarget('expired refresh tokens', Refreshtoken.objects.filter(expires_at__lt=cutoff), 'expires_at'),
+            PurgeTarget('revoked refresh tokens', Refreshtoken.objects.filter(revoked_at__lt=cutoff), 'revoked_at'),
+        ]
+    if 'sessions' in only:
+        targets.append(PurgeTarget('expired sessions', Session.objects.filter(expire_date__lt=now), 'expire_date'))
+    return targets
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired and revoked refresh tokens and expired admin sessions '
+        'in small batches, so it can run against a busy database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per DELETE.')
+        parser.add_argument(
+            '--sleep', type=float, default=0.2,
+            help='Seconds to pause between batches (lets replicas catch up).',
+        )
+        parser.add_argument(
+            '--keep-days', type=float, default=0,
+            help='Keep tokens for this many days after they expire or are revoked.',
+        )
+        parser.add_argument('--only', choices=TARGETS, action='append', help='Purge only this kind (repeatable).')
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be deleted.')
+
+    def handle(self, *args, **options):
+        targets = purge_targets(timezone.now(), timedelta(days=options['keep_days']), options['only'] or TARGETS)
+
+        if options['dry_run']:
+            for target in targets:
+                self.stdout.write(f'{target.label}: {target.queryset.count()} would be deleted.')
+            return
+
+        def progress(target, deleted, total):
+            self.stdout.write(f'{target.label}: deleted {deleted} (total {total})')
+
+        for target in targets:
+            total = purge_in_batches(target, options['batch_size'], options['sleep'], progress)
+            self.stdout.write(self.style.SUCCESS(f'{target.label}: {total} deleted.'))
@@ -0,0 +1,153 @@
+"""
+A small in-process metrics registry with Prometheus text exposition.
+
+Only what the admin needs: counters and histograms with labels. Values live
+in this process. With several worker processes each one reports its own, and
+Prometheus sums them by instance. Updates take one lock and do a short
+bisect, cheap enough to run on every request.
+"""
+
+import bisect
+import threading
+
+# Request-scale buckets, in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            series = sorted(self._series.items())
+            lines += [line for key, value in series for line in self._lines(key, value)]
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._series.get(self._key(labels), 0)
+
+    def _lines(self, key, value):
+        yield f'{self.name}_total{_labels(self.labelnames, key)} {_number(value)}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket (not cumulative) counts, one extra for +Inf, then sum.
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def summaries(self):
+        """[(labels dict, count, sum, p50, p95)] per series, quantiles as bucket upper bounds."""
+        with self._lock:
+            series = sorted((key, list(value)) for key, value in self._series.items())
+        bounds = (*self.buckets, float('inf'))
+        rows = []
+        for key, value in series:
+            count = sum(value[:-1])
+            quantiles = []
+            for fraction in (0.5, 0.95):
+                cumulative = 0
+                for bound, n in zip(bounds, value):
+                    cumulative += n
+                    if cumulative >= fraction * count:
+                        quantiles.append(bound)
+                        break
+            rows.append((dict(zip(self.labelnames, key)), count, value[-1], *quantiles))
+        return rows
+
+    def snapshot(self, **labels):
+        """(count, sum) of one series."""
+        series = self._series.get(self._key(labels))
+        return (sum(series[:-1]), series[-1]) if series else (0, 0.0)
+
+    def _lines(self, key, series):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float('inf')), series):
+            cumulative += count
+            yield f'{self.name}_bucket{_labels(self.labelnames, key, [("le", _number(bound))])} {cumulative}'
+        yield f'{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-1])}'
+        yield f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Re-registering returns the existing metric, so modules can be reloaded.
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def metrics(self):
+        with self._lock:
+            return sorted(self._metrics.values(), key=lambda m: m.name)
+
+    def expose(self):
+        """Everything in the Prometheus text format (version 0.0.4)."""
+        return '\n'.join(line for metric in self.metrics() for line in metric.expose()) + '\n'
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -1,13 +1,14 @@
-# This is an auto-generated Django model module.
-# You'll have to do the following manually to clean this up:
-#   * Rearrange models' order
-#   * Make sure each model has one field with primary_key=True
-#   * Make sure each ForeignKey and OneToOneField has `on_delete` set to the desired behavior
-#   * Remove `managed = False` lines if you wish to allow Django to create, modify, and delete the table
-# Feel free to rename the models, but don't rename db_table values or field names.
+# Generated from packages/db/prisma/schema.prisma by scripts/prisma_models.py.
+# Do not edit by hand: change the Prisma schema and regenerate instead.
+# Every model is unmanaged; Prisma owns these tables and their migrations.
 from django.db import models
 
 
+class Role(models.TextChoices):
+    ADMIN = 'ADMIN'
+    USER = 'USER'
+
+
 class Avatar(models.Model):
     id = models.TextField(primary_key=True)
     name = models.TextField()
@@ -20,6 +21,10 @@ class Avatar(models.Model):
     class Meta:
         managed = False
         db_table = 'Avatar'
+        indexes = [
+            models.Index(fields=['image_key'], name='Avatar_image_key_idx'),
+            models.Index(fields=['created_at', 'id'], name='Avatar_created_at_id_idx'),
+        ]
 
 
 class Element(models.Model):
@@ -38,6 +43,9 @@ class Element(models.Model):
         managed = False
         db_table = 'Element'
         unique_together = (('image_key', 'static'),)
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='Element_created_at_id_idx'),
+        ]
 
 
 class Handlesequence(models.Model):
@@ -63,6 +71,9 @@ class Map(models.Model):
     class Meta:
         managed = False
         db_table = 'Map'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='Map_created_at_id_idx'),
+        ]
 
 
 class Mapelementplacement(models.Model):
@@ -71,12 +82,15 @@ class Mapelementplacement(models.Model):
     element = models.ForeignKey(Element, models.DO_NOTHING, blank=True, null=True, related_name='+')
     x = models.IntegerField()
     y = models.IntegerField()
-    scale = models.FloatField()
-    rotation = models.FloatField()
+    scale = models.FloatField(default=1)
+    rotation = models.FloatField(default=0)
 
     class Meta:
         managed = False
         db_table = 'MapElementPlacement'
+        indexes = [
+            models.Index(fields=['map', 'scale'], name='MEP_map_id_scale_idx'),
+        ]
 
 
 class Refreshtoken(models.Model):
@@ -92,6 +106,12 @@ class Refreshtoken(models.Model):
     class Meta:
         managed = False
         db_table = 'RefreshToken'
+        indexes = [
+            models.Index(fields=['user'], name='RefreshToken_user_id_idx'),
+            models.Index(fields=['expires_at'], name='RefreshToken_expires_at_idx'),
+            models.Index(fields=['revoked_at'], name='RefreshToken_revoked_at_idx'),
+            models.Index(fields=['created_at', 'id'], name='RefreshToken_created_at_id_idx'),
+        ]
 
 
 class Space(models.Model):
@@ -106,6 +126,10 @@ class Space(models.Model):
     class Meta:
         managed = False
         db_table = 'Space'
+        indexes = [
+            models.Index(fields=['user'], name='Space_user_id_idx'),
+            models.Index(fields=['created_at', 'id'], name='Space_created_at_id_idx'),
+        ]
 
 
 class Spaceelementplacement(models.Model):
@@ -114,12 +138,15 @@ class Spaceelementplacement(models.Model):
     element = models.ForeignKey(Element, models.DO_NOTHING, blank=True, null=True, related_name='+')
     x = models.IntegerField()
     y = models.IntegerField()
-    scale = models.FloatField()
-    rotation = models.FloatField()
+    scale = models.FloatField(default=1)
+    rotation = models.FloatField(default=0)
 
     class Meta:
         managed = False
         db_table = 'SpaceElementPlacement'
+        indexes = [
+            models.Index(fields=['space', 'scale'], name='SEP_space_id_scale_idx'),
+        ]
 
 
 class User(models.Model):
@@ -128,7 +155,7 @@ class User(models.Model):
     handle = models.TextField(unique=True)
     password_hash = models.TextField()
     email = models.TextField(unique=True)
-    role = models.TextField()  # This field type is a guess.
+    role = models.TextField(choices=Role.choices, default=Role.USER)
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
     deleted_at = models.DateTimeField(blank=True, null=True)
@@ -137,6 +164,11 @@ class User(models.Model):
     class Meta:
         managed = False
         db_table = 'User'
+        indexes = [
+            models.Index(fields=['role', 'deleted_at'], name='User_role_deleted_at_idx'),
+            models.Index(fields=['handle'], name='User_handle_idx'),
+            models.Index(fields=['created_at', 'id'], name='User_created_at_id_idx'),
+        ]
 
 
 class PrismaMigrations(models.Model):
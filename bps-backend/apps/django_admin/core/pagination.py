@@ -0,0 +1,267 @@
+"""
+Paginators for admin changelists over very large Prisma tables.
+"""
+
+import base64
+import binascii
+import json
+import logging
+
+from django.conf import settings
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+# Query-string parameter that switches a changelist to keyset pagination.
+CURSOR_VAR = 'cursor'
+
+
+def estimated_row_count(model, using='default'):
+    """Planner's row estimate for model's table (pg_class.reltuples), or None.
+
+    None means the estimate isn't available: not PostgreSQL, or the table has
+    never been vacuumed/analyzed (reltuples = -1).
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)',
+            [connection.ops.quote_name(model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+def estimated_query_count(qs):
+    """Planner's row estimate for qs itself (EXPLAIN (FORMAT JSON)), or None outside PostgreSQL."""
+    connection = connections[qs.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = qs.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that avoids exact COUNT(*) scans on huge tables.
+
+    - Unfiltered lists use the pg_class.reltuples estimate once it is at least
+      ADMIN_ESTIMATED_COUNT_THRESHOLD rows.
+    - Everything else gets an exact count under a statement timeout of
+      ADMIN_COUNT_TIMEOUT_MS; if it times out, the planner's estimate for
+      the query itself (filters included) is used. A list with rows never
+      counts as empty.
+
+    is_estimate tells templates to show the count as approximate.
+    """
+
+    is_estimate = False
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        query = getattr(qs, 'query', None)
+        if query is None:
+            return super().count
+
+        using = qs.db
+        unfiltered = not query.where and not query.distinct and not query.combinator
+        if unfiltered:
+            estimate = estimated_row_count(qs.model, using)
+            if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                self.is_estimate = True
+                return estimate
+
+        if connections[using].vendor != 'postgresql':
+            return qs.count()
+
+        connection = connections[using]
+        # Inside an outer transaction the atomic block below is a savepoint,
+        # and a SET LOCAL outlives its release: put the old timeout back.
+        nested = connection.in_atomic_block
+        if nested:
+            with connection.cursor() as cursor:
+                cursor.execute('SHOW statement_timeout')
+                previous = cursor.fetchone()[0]
+        try:
+            with transaction.atomic(using=using), connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', [settings.ADMIN_COUNT_TIMEOUT_MS])
+                return qs.count()
+        except DatabaseError:
+            logger.info('Exact count of %s timed out; using estimate', qs.model._meta.label)
+        finally:
+            if nested:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT set_config('statement_timeout', %s, true)", [previous])
+        self.is_estimate = True
+        estimate = estimated_query_count(qs)
+        if estimate:
+            return estimate
+        # The planner can claim 0 rows from stale statistics; an empty page shows 0.
+        return 1 if qs.exists() else 0
+
+
+def keyset_ordering(model):
+    """Ordering a keyset page walks: a sort column plus the pk as tie-breaker.
+
+    The sort column is the model's Meta.ordering (UploadedImage: -uploaded_at),
+    else created_at, newest first. Models with neither page by pk alone.
+    """
+    opts = model._meta
+    pk = opts.pk.name
+    columns = {f.name for f in opts.concrete_fields}
+    for candidate in [*opts.ordering[:1], '-created_at']:
+        if isinstance(candidate, str) and candidate.lstrip('-') in columns - {pk}:
+            sign = '-' if candidate.startswith('-') else ''
+            return (candidate, sign + pk)
+    return ('-' + pk,)
+
+
+def keyset_q(names, values, op):
+    """Q for the row comparison (names...) <op> (values...), op being 'lt' or 'gt'.
+
+    Written as `a <= x AND (a < x OR (a = x AND b < y))` rather than a row
+    constructor so it stays in the ORM; the leading `a <= x` is what lets
+    PostgreSQL start an index range scan at the cursor.
+    """
+    q = Q(**{f'{names[-1]}__{op}': values[-1]})
+    for name, value in zip(reversed(names[:-1]), reversed(values[:-1])):
+        q = Q(**{f'{name}__{op}': value}) | (Q(**{name: value}) & q)
+    if len(names) > 1:
+        q &= Q(**{f'{names[0]}__{op}e': values[0]})
+    return q
+
+
+class KeysetChangeList(ChangeList):
+    """ChangeList that pages by cursor instead of LIMIT/OFFSET.
+
+    It is active while the query string carries CURSOR_VAR and no column sort.
+    The list is ordered by keyset_ordering() and the cursor encodes the key
+    of the row the page starts after. Every page is an index range scan of at
+    most list_per_page + 1 rows, however deep it is. Rows inserted meanwhile
+    never shift a page the way they shift OFFSET pages.
+
+    An empty cursor means the first page. The list is counted there only;
+    the count travels in the cursors to the pages after it.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.keyset = self.cursor is not None and not request.GET.get(ORDER_VAR)
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    @cached_property
+    def keyset_fields(self):
+        return [
+            (self.lookup_opts.get_field(name.lstrip('-')), name.startswith('-'))
+            for name in keyset_ordering(self.model)
+        ]
+
+    def get_ordering(self, request, queryset):
+        if not self.keyset:
+            return super().get_ordering(request, queryset)
+        return [('-' if desc else '') + field.name for field, desc in self.keyset_fields]
+
+    def encode_cursor(self, direction, obj):
+        key = [field.value_to_string(obj) for field, _ in self.keyset_fields]
+        total = [self.result_count, self.paginator.is_estimate]
+        data = json.dumps({'d': direction, 'k': key, 'n': total}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        """(direction, key values, (count, is_estimate) or None) for token; an empty token is the first page."""
+        if not token:
+            return 'next', None, None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            direction, key, total = data['d'], data['k'], data.get('n')
+            if direction not in ('next', 'prev') or len(key) != len(self.keyset_fields):
+                raise ValueError(token)
+            if total is not None:
+                total = int(total[0]), bool(total[1])
+            return direction, [field.to_python(v) for (field, _), v in zip(self.keyset_fields, key)], total
+        except (binascii.Error, IndexError, KeyError, TypeError, ValueError, ValidationError) as e:
+            raise IncorrectLookupParameters(f'Invalid cursor {token!r}') from e
+
+    def get_results(self, request):
+        if not self.keyset:
+            return super().get_results(request)
+
+        direction, key, total = self.decode_cursor(self.cursor)
+        names = [field.name for field, _ in self.keyset_fields]
+        descending = self.keyset_fields[0][1]
+        per_page = self.list_per_page
+
+        def after(values, backwards=False):
+            return keyset_q(names, values, 'lt' if descending != backwards else 'gt')
+
+        # Probe the keys (an index-only scan) one row past the page, in the
+        # direction of travel, to learn whether there is a further page.
+        probe = self.queryset
+        if key is not None:
+            probe = probe.filter(after(key, backwards=direction == 'prev'))
+        if direction == 'prev':
+            probe = probe.reverse()
+        probe = list(probe.values_list(*names)[:per_page + 1])
+        more = len(probe) > per_page
+
+        if direction == 'next':
+            result_list = self.queryset.filter(after(key)) if key is not None else self.queryset
+            has_next, has_previous = more, key is not None
+        else:
+            # The extra probed row is the one just before this page; with no
+            # extra row the page runs from the start of the list.
+            result_list = self.queryset.filter(after(probe[per_page])) if more else self.queryset
+            has_next, has_previous = True, more
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, per_page)
+        if total is not None:
+            paginator.count, paginator.is_estimate = total
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = result_list[:per_page]
+        self.can_show_all = False
+        self.multi_page = has_next or has_previous
+        self.paginator = paginator
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    @property
+    def next_url(self):
+        if self.keyset and self.has_next and self.result_list:
+            last = self.result_list[len(self.result_list) - 1]
+            return self.get_query_string({CURSOR_VAR: self.encode_cursor('next', last)})
+
+    @property
+    def previous_url(self):
+        if self.keyset and self.has_previous and self.result_list:
+            return self.get_query_string({CURSOR_VAR: self.encode_cursor('prev', self.result_list[0])})
+
+    @property
+    def first_url(self):
+        return self.get_query_string({CURSOR_VAR: '', ORDER_VAR: None})
+
+    @property
+    def offset_url(self):
+        return self.get_query_string({CURSOR_VAR: None})
@@ -0,0 +1,343 @@
+"""
+Bulk export and import of the element placements of a Map or Space.
+
+Exports stream straight from a server-side cursor as CSV or JSONL. Imports
+are parsed and validated in one pass: element ids are checked in bulk, and
+ids that belong to another map/space are rejected. Then the rows are written
+in one transaction. On PostgreSQL they are COPY'd into a temporary staging
+table and upserted with a single INSERT ... SELECT ... ON CONFLICT.
+Elsewhere bulk_create(update_conflicts=True) does the same.
+
+Rows without an id get a fresh one, so a layout can be copied onto another
+map by dropping the id column.
+
+instantiate_spaces() creates spaces from a map and copies the map's default
+placements into all of them with one INSERT ... SELECT.
+"""
+
+import csv
+import json
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core.bulk import copy_from
+from core.models import Element, Map, Mapelementplacement, Space, Spaceelementplacement
+
+FIELDS = ('id', 'element_id', 'x', 'y', 'scale', 'rotation')
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+EXPORT_CHUNK_SIZE = 5000
+# Ids per IN (...) query while validating an import.
+LOOKUP_BATCH_SIZE = 5000
+# Staging rows are kept in memory up to this size, then spill to disk.
+SPOOL_MAX_SIZE = 32 * 1024 * 1024
+# Parse errors reported before giving up on a file.
+MAX_ERRORS = 20
+
+STAGING_TABLE = 'placement_import'
+
+# SQL generating a fresh text id per row, for set-based copies.
+NEW_ID_SQL = {
+    'postgresql': 'gen_random_uuid()::text',
+    'sqlite': 'lower(hex(randomblob(16)))',
+}
+
+
+class PlacementImportError(ValueError):
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__('; '.join(self.errors))
+
+
+@dataclass
+class PlacementImportReport:
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return (self.created + self.updated) / self.elapsed if self.elapsed else 0.0
+
+
+def placement_model(owner):
+    """(placement model, owner FK field) for a Map or Space instance."""
+    if isinstance(owner, Map):
+        return Mapelementplacement, Mapelementplacement._meta.get_field('map')
+    if isinstance(owner, Space):
+        return Spaceelementplacement, Spaceelementplacement._meta.get_field('space')
+    raise TypeError(f'Placements belong to a Map or Space, not {owner!r}.')
+
+
+def format_for_filename(filename, default='csv'):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else default
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for csv.writer streaming."""
+
+    def write(self, value):
+        return value
+
+
+def export_placements(owner, fmt='csv'):
+    """Yield the owner's placements as CSV or JSONL lines, ordered by id."""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt!r}.')
+    model, owner_field = placement_model(owner)
+    rows = (
+        model.objects.filter(**{owner_field.attname: owner.pk})
+        .order_by('id')
+        .values_list(*FIELDS)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(FIELDS, row)), separators=(',', ':')) + '\n'
+
+
+def _records(lines, fmt):
+    """(line number, record dict) pairs from CSV or JSONL text lines."""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        missing = set(FIELDS) - {'id', 'scale', 'rotation'} - set(reader.fieldnames or ())
+        if missing:
+            raise PlacementImportError([f'CSV header is missing {", ".join(sorted(missing))}.'])
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, e
+                continue
+            yield number, record if isinstance(record, dict) else ValueError('not a JSON object')
+    else:
+        raise ValueError(f'Unknown format {fmt!r}.')
+
+
+def _clean(record):
+    """Validated row tuple in FIELDS order; raises ValueError/TypeError."""
+    if isinstance(record, Exception):
+        raise record
+    element_id = str(record.get('element_id') or '').strip()
+    if not element_id:
+        raise ValueError('element_id is required')
+
+    def number(name, cast, default=None):
+        value = record.get(name)
+        if value in (None, ''):
+            if default is None:
+                raise ValueError(f'{name} is required')
+            return default
+        return cast(value)
+
+    return (
+        str(record.get('id') or '').strip() or str(uuid.uuid4()),
+        element_id,
+        number('x', int),
+        number('y', int),
+        number('scale', float, 1.0),
+        number('rotation', float, 0.0),
+    )
+
+
+def _in_batches(values):
+    values = list(values)
+    for start in range(0, len(values), LOOKUP_BATCH_SIZE):
+        yield values[start:start + LOOKUP_BATCH_SIZE]
+
+
+def _validate(model, owner_field, owner, ids, element_ids, errors):
+    """Bulk checks against the database; returns the ids that already exist."""
+    known_elements = set()
+    for batch in _in_batches(element_ids):
+        known_elements.update(Element.objects.filter(id__in=batch).values_list('id', flat=True))
+    unknown = sorted(element_ids - known_elements)
+    if unknown:
+        errors.append(f'{len(unknown)} unknown element id(s): {", ".join(unknown[:10])}')
+
+    existing = set()
+    foreign = []
+    for batch in _in_batches(ids):
+        for pk, owner_id in model.objects.filter(id__in=batch).values_list('id', owner_field.attname):
+            existing.add(pk)
+            if owner_id != owner.pk:
+                foreign.append(pk)
+    if foreign:
+        errors.append(
+            f'{len(foreign)} placement id(s) belong to another {owner_field.name} '
+            f'(e.g. {", ".join(sorted(foreign)[:5])}); drop the id column to import them as copies'
+        )
+    return existing
+
+
+def _copy_upsert(connection, model, owner_field, owner, spool, replace):
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    columns = [model._meta.get_field('element' if f == 'element_id' else f).column for f in FIELDS]
+    staging = qn(STAGING_TABLE)
+    owner_column = qn(owner_field.column)
+    updates = ', '.join(f'{qn(c)} = EXCLUDED.{qn(c)}' for c in columns[1:])
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {staging}')
+        cursor.execute(
+            f'CREATE TEMP TABLE {staging} ('
+            'id text PRIMARY KEY, element_id text NOT NULL, x integer NOT NULL, '
+            'y integer NOT NULL, scale double precision NOT NULL, rotation double precision NOT NULL'
+            ') ON COMMIT DROP'
+        )
+        spool.seek(0)
+        copy_from(cursor, f'COPY {staging} ({", ".join(FIELDS)}) FROM STDIN WITH (FORMAT csv)', spool)
+        cursor.execute(
+            f'INSERT INTO {table} ({", ".join(qn(c) for c in columns)}, {owner_column}) '
+            f'SELECT {", ".join(FIELDS)}, %s FROM {staging} '
+            f'ON CONFLICT ({qn(columns[0])}) DO UPDATE SET {updates} '
+            # Ownership was checked above; this keeps a concurrent move from
+            # being silently undone.
+            f'WHERE {table}.{owner_column} = EXCLUDED.{owner_column}',
+            [owner.pk],
+        )
+        if not replace:
+            return 0
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {owner_column} = %s AND NOT EXISTS '
+            f'(SELECT 1 FROM {staging} s WHERE s.id = {table}.{qn(columns[0])})',
+            [owner.pk],
+        )
+        return cursor.rowcount
+
+
+def _orm_upsert(model, owner_field, owner, spool, ids, replace):
+    spool.seek(0)
+    objs = [
+        model(**{owner_field.attname: owner.pk}, **dict(zip(FIELDS, row)))
+        for row in csv.reader(spool)
+    ]
+    model.objects.bulk_create(
+        objs, batch_size=1000, update_conflicts=True,
+        unique_fields=['id'], update_fields=['element', 'x', 'y', 'scale', 'rotation'],
+    )
+    if not replace:
+        return 0
+    current = model.objects.filter(**{owner_field.attname: owner.pk}).values_list('id', flat=True)
+    deleted = 0
+    for batch in _in_batches(set(current) - ids):
+        deleted += model.objects.filter(id__in=batch).delete()[0]
+    return deleted
+
+
+def import_placements(owner, lines, fmt='csv', replace=False):
+    """Upsert placements for owner from CSV/JSONL lines in one transaction.
+
+    With replace=True the owner's placements that aren't in the file are
+    deleted too. Raises PlacementImportError (nothing written) on bad input.
+    """
+    start = time.perf_counter()
+    model, owner_field = placement_model(owner)
+    errors = []
+    ids = set()
+    element_ids = set()
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+', newline='') as spool:
+        writer = csv.writer(spool)
+        for number, record in _records(lines, fmt):
+            try:
+                row = _clean(record)
+            except (TypeError, ValueError) as e:
+                errors.append(f'Line {number}: {e}')
+                if len(errors) >= MAX_ERRORS:
+                    break
+                continue
+            if row[0] in ids:
+                errors.append(f'Line {number}: duplicate id {row[0]}')
+                continue
+            ids.add(row[0])
+            element_ids.add(row[1])
+            writer.writerow(row)
+
+        if not errors:
+            existing = _validate(model, owner_field, owner, ids, element_ids, errors)
+        if errors:
+            raise PlacementImportError(errors[:MAX_ERRORS])
+
+        using = model.objects.db
+        connection = connections[using]
+        with transaction.atomic(using=using):
+            if connection.vendor == 'postgresql':
+                deleted = _copy_upsert(connection, model, owner_field, owner, spool, replace)
+            else:
+                deleted = _orm_upsert(model, owner_field, owner, spool, ids, replace)
+
+    return PlacementImportReport(
+        created=len(ids) - len(existing),
+        updated=len(existing),
+        deleted=deleted,
+        elapsed=time.perf_counter() - start,
+    )
+
+
+def copy_map_placements(map_id, space_ids):
+    """Copy a map's placements into each space in space_ids; returns rows created.
+
+    One INSERT ... SELECT per LOOKUP_BATCH_SIZE spaces, so the cost in round
+    trips doesn't depend on how many placements the map has.
+    """
+    space_ids = list(space_ids)
+    connection = connections[Spaceelementplacement.objects.db]
+    qn = connection.ops.quote_name
+    source, target = Mapelementplacement._meta, Spaceelementplacement._meta
+    copied = [source.get_field(name).column for name in ('element', 'x', 'y', 'scale', 'rotation')]
+    columns = [target.get_field(name).column for name in ('id', 'space', 'element', 'x', 'y', 'scale', 'rotation')]
+    space = Space._meta
+
+    created = 0
+    with connection.cursor() as cursor:
+        for batch in _in_batches(space_ids):
+            cursor.execute(
+                f'INSERT INTO {qn(target.db_table)} ({", ".join(qn(c) for c in columns)}) '
+                f'SELECT {NEW_ID_SQL[connection.vendor]}, s.{qn(space.pk.column)}, '
+                f'{", ".join("p." + qn(c) for c in copied)} '
+                f'FROM {qn(source.db_table)} p CROSS JOIN {qn(space.db_table)} s '
+                f'WHERE p.{qn(source.get_field("map").column)} = %s '
+                f'AND s.{qn(space.pk.column)} IN ({", ".join(["%s"] * len(batch))})',
+                [map_id, *batch],
+            )
+            created += cursor.rowcount
+    return created
+
+
+def instantiate_spaces(map_obj, names, user_id=None):
+    """Create one Space per name from map_obj, with a copy of its placements.
+
+    Runs in one transaction: a bulk INSERT of the spaces plus
+    copy_map_placements(). Returns (spaces, placements created).
+    """
+    now = timezone.now()
+    spaces = [
+        Space(
+            id=str(uuid.uuid4()), name=name, map=map_obj, user_id=user_id,
+            created_at=now, updated_at=now,
+        )
+        for name in names
+    ]
+    with transaction.atomic(using=Space.objects.db):
+        Space.objects.bulk_create(spaces)
+        created = copy_map_placements(map_obj.pk, [space.pk for space in spaces])
+    return spaces, created
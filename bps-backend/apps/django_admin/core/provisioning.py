@@ -0,0 +1,145 @@
+"""
+Bulk creation of app users (the Prisma User table) from CSV or JSONL.
+
+argon2id hashing (core.hashing.slow_hash, the Node-compatible parameters) is
+by far the slowest part, so it is spread over a process pool with one worker
+per available core. Rows are checked for duplicate emails/handles up front,
+so no hashing is wasted on them. Hashed users are then inserted with
+bulk_create in batches while the pool keeps hashing.
+"""
+
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from core.hashing import generate_cuid, slow_hash
+from core.models import Role, User
+
+BATCH_SIZE = 1000
+# Passwords handed to a worker at a time; amortises the IPC per hash.
+HASH_CHUNK_SIZE = 32
+LOOKUP_BATCH_SIZE = 5000
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        return os.cpu_count() or 1
+
+
+@dataclass
+class ProvisionReport:
+    created: int = 0
+    skipped: list = field(default_factory=list)  # (line, reason)
+    elapsed: float = 0.0
+    workers: int = 0
+
+    @property
+    def users_per_second(self):
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+
+def read_records(lines, fmt):
+    """(line number, dict) pairs from CSV (with a header row) or JSONL lines."""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for number, line in enumerate(lines, start=1):
+            if line.strip():
+                yield number, json.loads(line)
+    else:
+        raise ValueError(f'Unknown format {fmt!r}.')
+
+
+def _existing(column, values, ignore_case=False):
+    """The values already taken in column; lower-cased if ignore_case."""
+    found = set()
+    values = list(values)
+    users = User.objects.annotate(lookup=Lower(column) if ignore_case else F(column))
+    for start in range(0, len(values), LOOKUP_BATCH_SIZE):
+        batch = values[start:start + LOOKUP_BATCH_SIZE]
+        if ignore_case:
+            batch = [value.lower() for value in batch]
+        found.update(users.filter(lookup__in=batch).values_list('lookup', flat=True))
+    return found
+
+
+def _prepare(records, default_password, role, report):
+    """Validated rows (without hashes), duplicates and bad rows moved to report.skipped."""
+    rows = []
+    emails = set()
+    handles = set()
+    for number, record in records:
+        name = str(record.get('name') or '').strip()
+        email = str(record.get('email') or '').strip()
+        password = record.get('password') or default_password
+        user_role = str(record.get('role') or role).upper()
+        handle = str(record.get('handle') or '').strip() or generate_cuid()
+        if not name or not email:
+            report.skipped.append((number, 'name and email are required'))
+        elif not password:
+            report.skipped.append((number, 'no password (give --password for a default)'))
+        elif user_role not in Role.values:
+            report.skipped.append((number, f'unknown role {user_role!r}'))
+        elif email.lower() in emails or handle in handles:
+            report.skipped.append((number, f'duplicate email or handle in file ({email})'))
+        else:
+            emails.add(email.lower())
+            handles.add(handle)
+            rows.append((number, name, email, handle, user_role, password))
+
+    taken_emails = _existing('email', (r[2] for r in rows), ignore_case=True)
+    taken_handles = _existing('handle', (r[3] for r in rows))
+    kept = []
+    for row in rows:
+        if row[2].lower() in taken_emails or row[3] in taken_handles:
+            report.skipped.append((row[0], f'user already exists ({row[2]})'))
+        else:
+            kept.append(row)
+    return kept
+
+
+def provision_users(records, default_password=None, role=Role.USER, workers=None, batch_size=BATCH_SIZE, progress=None):
+    """Create a User per record ({name, email, password?, handle?, role?}).
+
+    Returns a ProvisionReport. progress(created_so_far) is called per batch.
+    """
+    start = time.perf_counter()
+    report = ProvisionReport(workers=workers or available_cores())
+    rows = _prepare(records, default_password, role, report)
+
+    def insert(batch):
+        with transaction.atomic():
+            User.objects.bulk_create(batch, batch_size=batch_size)
+        report.created += len(batch)
+        if progress:
+            progress(report.created)
+
+    with ProcessPoolExecutor(max_workers=report.workers) as pool:
+        hashes = pool.map(slow_hash, (row[5] for row in rows), chunksize=HASH_CHUNK_SIZE)
+        batch = []
+        for (_, name, email, handle, user_role, _), password_hash in zip(rows, hashes):
+            now = timezone.now()
+            batch.append(User(
+                id=generate_cuid(), name=name, handle=handle, password_hash=password_hash,
+                email=email, role=user_role, created_at=now, updated_at=now,
+            ))
+            if len(batch) >= batch_size:
+                insert(batch)
+                batch = []
+        if batch:
+            insert(batch)
+
+    report.elapsed = time.perf_counter() - start
+    return report
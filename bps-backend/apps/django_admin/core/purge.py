@@ -0,0 +1,45 @@
+"""
+Deleting large numbers of rows without long locks or replication spikes.
+
+purge_in_batches() repeatedly picks the next batch of primary keys in index
+order and deletes exactly those rows (re-checking the condition), each batch
+in its own short transaction, with an optional pause between batches.
+"""
+
+import time
+from dataclasses import dataclass
+
+from django.db import transaction
+
+
+@dataclass
+class PurgeTarget:
+    """Rows of queryset to delete, walked in order_by (an indexed column) order."""
+    label: str
+    queryset: object
+    order_by: str
+
+
+def purge_in_batches(target, batch_size, sleep=0.0, progress=None):
+    """Delete every row of target in batches; returns the number deleted.
+
+    progress(target, deleted_in_batch, total_so_far) is called after each batch.
+    """
+    total = 0
+    while True:
+        pks = list(
+            target.queryset.order_by(target.order_by).values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return total
+        with transaction.atomic(using=target.queryset.db):
+            # The filter is applied again, so a row that stopped matching since
+            # it was selected (a refreshed session, say) survives.
+            deleted, _ = target.queryset.filter(pk__in=pks).delete()
+        total += deleted
+        if progress:
+            progress(target, deleted, total)
+        if len(pks) < batch_size:
+            return total
+        if sleep:
+            time.sleep(sleep)
@@ -0,0 +1,127 @@
+"""
+Game-facing renditions of uploaded Element and Map images.
+
+An upload is kept as it came, but players should download only what the
+sprite needs. A rendition is the source resized to its row's declared width
+x height (and twice that, for high-DPI screens), re-encoded and stripped of
+metadata. Renditions live next to the source under a derived key
+(``elements/abc.png`` -> ``elements/abc.png.32x32.webp``, ``...64x64.avif``).
+Sources are content-addressed, so a key never changes content and
+renditions are uploaded as immutable.
+
+Nothing is upscaled. The 2x rendition is only made when the source is large
+enough, and a source smaller than its declared size is encoded at its own
+size. AVIF and WebP are made where this Pillow build can encode them, and
+PNG always, as the fallback every client reads.
+"""
+
+import io
+import re
+import tempfile
+from dataclasses import dataclass
+
+from django.conf import settings
+from PIL import Image, ImageOps, features
+
+from core.s3 import download_file
+
+SCALES = (1, 2)
+
+CONTENT_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'png': 'image/png'}
+
+_RENDITION_KEY = re.compile(r'^(?P<source>.+)\.\d+x\d+\.(?:avif|webp|png)$')
+
+# Sources larger than this are spooled to disk while being rendered.
+_SPOOL_LIMIT = 8 * 1024 * 1024
+
+
+def rendition_key(key, width, height, fmt):
+    return f'{key}.{width}x{height}.{fmt}'
+
+
+def rendition_source(key):
+    """The source a rendition key was made from (key itself if it isn't one)."""
+    match = _RENDITION_KEY.match(key)
+    return match['source'] if match else key
+
+
+def formats():
+    """Formats to encode, best first, among settings.RENDITION_FORMATS this Pillow can write."""
+    return [fmt for fmt in settings.RENDITION_FORMATS if fmt == 'png' or features.check(fmt)]
+
+
+def target_sizes(source_size, declared):
+    """[(scale, (width, height))] to render for a source of source_size pixels.
+
+    declared is the row's (width, height); None or non-positive sizes mean
+    "the source's own size", encoded once.
+    """
+    sw, sh = source_size
+    if not declared or min(declared) <= 0:
+        return [(1, source_size)]
+    sizes = []
+    for scale in SCALES:
+        w, h = declared[0] * scale, declared[1] * scale
+        if sw >= w and sh >= h:
+            sizes.append((scale, (w, h)))
+        elif scale == 1:
+            sizes.append((1, source_size))
+    return sizes
+
+
+def encode(img, fmt):
+    out = io.BytesIO()
+    quality = settings.RENDITION_QUALITY
+    if fmt == 'webp':
+        img.save(out, format='WEBP', quality=quality, method=4)
+    elif fmt == 'avif':
+        img.save(out, format='AVIF', quality=quality)
+    else:
+        img.save(out, format='PNG', optimize=True)
+    # Nothing is passed for exif/icc_profile/pnginfo, so no metadata is written.
+    return out.getvalue()
+
+
+@dataclass
+class RenderedImage:
+    key: str
+    scale: int
+    width: int
+    height: int
+    format: str
+    body: bytes
+
+    @property
+    def content_type(self):
+        return CONTENT_TYPES[self.format]
+
+
+def read_size(fileobj):
+    """(width, height) from an image's header, without decoding it; None if it isn't an image."""
+    position = fileobj.tell()
+    try:
+        with Image.open(fileobj) as img:
+            return img.size
+    except Exception:
+        return None
+    finally:
+        fileobj.seek(position)
+
+
+def render(key, declared=None):
+    """Every rendition of the image at key, for a row declared (width, height)."""
+    with tempfile.SpooledTemporaryFile(max_size=_SPOOL_LIMIT) as source:
+        download_file(key, source)
+        source.seek(0)
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img)
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+
+    rendered = []
+    for scale, size in target_sizes(img.size, declared):
+        resized = img if size == img.size else img.resize(size, Image.Resampling.LANCZOS)
+        for fmt in formats():
+            rendered.append(RenderedImage(
+                rendition_key(key, *size, fmt), scale, *size, fmt, encode(resized, fmt),
+            ))
+    return rendered
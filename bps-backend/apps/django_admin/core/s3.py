@@ -1,32 +1,234 @@
+import base64
+import contextlib
+import threading
+
 import boto3
 from botocore.config import Config
+from botocore.exceptions import ClientError
 from django.conf import settings
 
+from core.instrumentation import common_prefix, operation
 
-def get_s3_client():
-    return boto3.client(
+# boto3 clients are thread-safe once created, but creating one (session setup,
+# credential resolution, endpoint discovery) is not cheap and each client owns
+# its own HTTP connection pool. Build a single client per process and reuse it
+# so admin requests share warm keep-alive connections to S3/MinIO.
+_client = None
+_client_lock = threading.Lock()
+
+# DeleteObjects accepts at most 1000 keys per request.
+MAX_DELETE_KEYS = 1000
+
+# S3 rejects multipart parts (other than the last) smaller than 5 MiB.
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def _client_config():
+    return Config(
+        s3={'addressing_style': 'path'},
+        max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+        connect_timeout=settings.S3_CONNECT_TIMEOUT,
+        read_timeout=settings.S3_READ_TIMEOUT,
+        retries={'max_attempts': settings.S3_MAX_ATTEMPTS, 'mode': 'standard'},
+        tcp_keepalive=True,
+    )
+
+
+def new_s3_client():
+    """Build a fresh S3 client. Prefer get_s3_client() outside of benchmarks."""
+    client = boto3.session.Session().client(
         's3',
         region_name=settings.S3_REGION,
         aws_access_key_id=settings.S3_ACCESS_KEY,
         aws_secret_access_key=settings.S3_SECRET_KEY,
         endpoint_url=settings.S3_ENDPOINT,
-        config=Config(s3={'addressing_style': 'path'}),
+        config=_client_config(),
     )
+    return client
+
+
+def get_s3_client():
+    """Return the process-wide pooled S3 client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = new_s3_client()
+    return _client
+
+
+def reset_s3_client():
+    """Drop the shared client so the next call rebuilds it (e.g. after settings change)."""
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def public_url(key: str) -> str:
+    """URL the browser can load the object from (the bucket is publicly readable)."""
+    return f'{settings.S3_ENDPOINT}/{settings.S3_BUCKET_NAME}/{key}'
+
+
+def head_file(key: str):
+    """Return the HeadObject response for key, or None if it doesn't exist."""
+    client = get_s3_client()
+    with operation('head', key):
+        try:
+            return client.head_object(Bucket=settings.S3_BUCKET_NAME, Key=key)
+        except ClientError as exc:
+            if exc.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+
+def object_exists(key: str) -> bool:
+    return head_file(key) is not None
+
+
+def presigned_post(key: str, content_type: str, max_size: int, expires_in: int,
+                   cache_control: str = None, sha256: str = None):
+    """Presigned POST policy letting a browser upload exactly one object to key.
+
+    The policy pins the Content-Type (and Cache-Control, if given) and caps
+    the body at max_size bytes. With sha256 (hex), S3 rejects a body with any
+    other checksum. Returns {'url': ..., 'fields': {...}} as produced by boto3.
+    """
+    fields = {'Content-Type': content_type}
+    if cache_control:
+        fields['Cache-Control'] = cache_control
+    if sha256:
+        fields['x-amz-checksum-sha256'] = base64.b64encode(bytes.fromhex(sha256)).decode()
+    with operation('presign', key):
+        return get_s3_client().generate_presigned_post(
+            Bucket=settings.S3_BUCKET_NAME,
+            Key=key,
+            Fields=fields,
+            Conditions=[
+                *({name: value} for name, value in fields.items()),
+                ['content-length-range', 1, max_size],
+            ],
+            ExpiresIn=expires_in,
+        )
+
+
+def download_file(key: str, fileobj):
+    """Stream an object into a writable file object."""
+    with operation('get', key) as op:
+        position = fileobj.tell()
+        get_s3_client().download_fileobj(settings.S3_BUCKET_NAME, key, fileobj)
+        op.bytes = fileobj.tell() - position
 
 
 def upload_file(key: str, file_body: bytes, content_type: str):
     client = get_s3_client()
-    client.put_object(
-        Bucket=settings.S3_BUCKET_NAME,
-        Key=key,
-        Body=file_body,
-        ContentType=content_type,
-    )
+    with operation('put', key) as op:
+        client.put_object(
+            Bucket=settings.S3_BUCKET_NAME,
+            Key=key,
+            Body=file_body,
+            ContentType=content_type,
+        )
+        op.bytes = len(file_body)
+
+
+def upload_stream(key: str, chunks, content_type: str, cache_control: str = None):
+    """Upload an iterable of byte chunks (e.g. UploadedFile.chunks()) without
+    holding the whole file in memory.
+
+    Bodies smaller than S3_MULTIPART_THRESHOLD go up as a single PUT. Anything
+    larger is sent as a multipart upload, buffering at most one part at a time,
+    and the multipart upload is aborted if any step fails. cache_control, if
+    given, becomes the object's Cache-Control header.
+    """
+    with operation('put_stream', key) as op:
+        def counted():
+            for chunk in chunks:
+                op.bytes += len(chunk)
+                yield chunk
+
+        _upload_stream(key, counted(), content_type, {'CacheControl': cache_control} if cache_control else {})
+
+
+def _upload_stream(key, chunks, content_type, headers):
+    client = get_s3_client()
+    bucket = settings.S3_BUCKET_NAME
+    part_size = max(settings.S3_MULTIPART_CHUNKSIZE, MIN_PART_SIZE)
+    threshold = max(settings.S3_MULTIPART_THRESHOLD, part_size)
+
+    buffer = bytearray()
+    upload_id = None
+    parts = []
+
+    def send_part(data):
+        number = len(parts) + 1
+        response = client.upload_part(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=number,
+            Body=bytes(data),
+        )
+        parts.append({'ETag': response['ETag'], 'PartNumber': number})
+
+    try:
+        for chunk in chunks:
+            buffer += chunk
+            if upload_id is None:
+                if len(buffer) < threshold:
+                    continue
+                upload_id = client.create_multipart_upload(
+                    Bucket=bucket, Key=key, ContentType=content_type, **headers,
+                )['UploadId']
+            while len(buffer) >= part_size:
+                send_part(buffer[:part_size])
+                del buffer[:part_size]
+
+        if upload_id is None:
+            client.put_object(Bucket=bucket, Key=key, Body=bytes(buffer), ContentType=content_type, **headers)
+            return
+
+        if buffer or not parts:
+            send_part(buffer)
+        client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts},
+        )
+    except BaseException:
+        if upload_id is not None:
+            # Don't let a failed abort mask the original error.
+            with contextlib.suppress(Exception):
+                client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
 
 
 def delete_file(key: str):
     client = get_s3_client()
-    client.delete_object(
-        Bucket=settings.S3_BUCKET_NAME,
-        Key=key,
-    )
+    with operation('delete', key):
+        client.delete_object(
+            Bucket=settings.S3_BUCKET_NAME,
+            Key=key,
+        )
+
+
+def delete_files(keys):
+    """Delete many keys with DeleteObjects, 1000 per request.
+
+    Returns a dict mapping each key that could not be deleted to its error
+    message. Keys that don't exist count as deleted.
+    """
+    client = get_s3_client()
+    keys = list(keys)
+    failed = {}
+    for start in range(0, len(keys), MAX_DELETE_KEYS):
+        batch = keys[start:start + MAX_DELETE_KEYS]
+        with operation('delete_many', prefix=common_prefix(batch)) as op:
+            response = client.delete_objects(
+                Bucket=settings.S3_BUCKET_NAME,
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True},
+            )
+            for error in response.get('Errors', []):
+                failed[error['Key']] = f"{error.get('Code', '')}: {error.get('Message', '')}"
+                op.failed_keys.append(error['Key'])
+    return failed
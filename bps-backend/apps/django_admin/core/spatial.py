@@ -0,0 +1,116 @@
+"""
+Viewport and nearest-neighbour queries over the placements of a Map or Space.
+
+A placement is anchored at (x, y) and covers its element's width x height,
+scaled by |scale|. An unrotated placement's footprint is that rectangle. A
+rotated one is treated as the square of half-side d around (x, y), where d
+is the rectangle's diagonal. That contains the rectangle whatever the
+rotation's pivot or unit, so nothing on screen is ever missed.
+
+On PostgreSQL both queries go through the GiST index on (owner, point(x, y))
+(search/indexes.py):
+
+- viewport(): the anchors inside the viewport grown by a margin, the
+  largest footprint any placement of the owner can have. The margin comes
+  from the owner's largest |scale| (MIN/MAX probes of the (owner, scale)
+  B-tree index) times the largest element diagonal. The exact footprint test then
+  runs only on those candidates.
+- nearest(): `ORDER BY point(x, y) <-> point(qx, qy) LIMIT k` is a KNN
+  index scan.
+
+Other backends run the same filters without the index.
+"""
+
+import math
+
+from django.db import connections
+from django.db.models import BooleanField, F, FloatField, Max, Min, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Abs, Power, Sqrt
+
+from core.models import Element
+from core.placements import placement_model
+
+
+def _point_sql(model):
+    qn = connections[model.objects.db].ops.quote_name
+    table = qn(model._meta.db_table)
+    return f'point({table}.{qn("x")}, {table}.{qn("y")})'
+
+
+def search_margin(owner):
+    """Largest distance a placement of owner can reach from its anchor."""
+    model, owner_field = placement_model(owner)
+    # PostgreSQL answers MIN/MAX from the (owner, scale) index.
+    scales = model.objects.filter(**{owner_field.attname: owner.pk}).aggregate(
+        low=Min('scale'), high=Max('scale'),
+    )
+    if scales['high'] is None:
+        return 0.0
+    diagonal = Element.objects.aggregate(
+        d=Max(Sqrt(Power(F('width'), 2) + Power(F('height'), 2)), output_field=FloatField())
+    )['d'] or 0.0
+    return diagonal * max(abs(scales['low']), abs(scales['high']))
+
+
+def placements(owner):
+    model, owner_field = placement_model(owner)
+    return model.objects.filter(**{owner_field.attname: owner.pk}).select_related('element')
+
+
+def viewport(owner, x0, y0, x1, y1):
+    """Placements of owner whose footprint intersects the rectangle (x0, y0)-(x1, y1)."""
+    x0, x1 = sorted((x0, x1))
+    y0, y1 = sorted((y0, y1))
+    qs = placements(owner)
+    model = qs.model
+    margin = search_margin(owner)
+
+    # Candidate anchors: cheap, and the part the index answers.
+    bounds = (x0 - margin, y0 - margin, x1 + margin, y1 + margin)
+    if connections[qs.db].vendor == 'postgresql':
+        qs = qs.filter(RawSQL(
+            f'{_point_sql(model)} <@ box(point(%s, %s), point(%s, %s))', bounds,
+            output_field=BooleanField(),
+        ))
+    else:
+        qs = qs.filter(x__gte=bounds[0], y__gte=bounds[1], x__lte=bounds[2], y__lte=bounds[3])
+
+    # Exact footprint test on the candidates.
+    width = F('element__width') * Abs(F('scale'))
+    height = F('element__height') * Abs(F('scale'))
+    qs = qs.annotate(
+        right=F('x') + width,
+        bottom=F('y') + height,
+        reach=Sqrt(Power(width, 2) + Power(height, 2)),
+    )
+    upright = Q(rotation=0, x__lte=x1, y__lte=y1, right__gte=x0, bottom__gte=y0)
+    rotated = ~Q(rotation=0) & Q(
+        x__lte=x1 + F('reach'), x__gte=x0 - F('reach'),
+        y__lte=y1 + F('reach'), y__gte=y0 - F('reach'),
+    )
+    # A placement with no element is just its anchor point.
+    bare = Q(element__isnull=True, x__gte=x0, x__lte=x1, y__gte=y0, y__lte=y1)
+    return qs.filter(upright | rotated | bare)
+
+
+def nearest(owner, x, y, k=10):
+    """The k placements of owner whose anchors are closest to (x, y), nearest first."""
+    qs = placements(owner)
+    if connections[qs.db].vendor == 'postgresql':
+        distance = RawSQL(f'{_point_sql(qs.model)} <-> point(%s, %s)', (x, y), output_field=FloatField())
+    else:
+        distance = Sqrt(Power(F('x') - x, 2) + Power(F('y') - y, 2))
+    return list(qs.annotate(distance=distance).order_by('distance')[:k])
+
+
+def footprint(placement):
+    """(x0, y0, x1, y1) box a placement is considered to cover."""
+    element = placement.element
+    scale = abs(placement.scale)
+    width = (element.width if element else 0) * scale
+    height = (element.height if element else 0) * scale
+    if placement.rotation:
+        d = math.hypot(width, height)
+        return placement.x - d, placement.y - d, placement.x + d, placement.y + d
+    return placement.x, placement.y, placement.x + width, placement.y + height
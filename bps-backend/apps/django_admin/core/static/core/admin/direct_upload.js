@@ -0,0 +1,86 @@
+// Upload admin image files straight from the browser to S3.
+//
+// For every <input type="file" data-direct-upload-url=...> this hashes the
+// file, asks Django for its content key and, unless that content is already
+// stored, a presigned POST policy, posts the file to the bucket, then stores
+// the key in the form's hidden "uploaded_key" field and clears the file input
+// so the file itself is never sent through the Django worker.
+'use strict';
+(function () {
+    function setStatus(input, text, isError) {
+        let status = input.parentNode.querySelector('.direct-upload-status');
+        if (!status) {
+            status = document.createElement('div');
+            status.className = 'help direct-upload-status';
+            input.parentNode.appendChild(status);
+        }
+        status.textContent = text;
+        status.style.color = isError ? '#ba2121' : '';
+    }
+
+    async function sha256(file) {
+        // crypto.subtle is only there on HTTPS (or localhost); without it the
+        // error below makes the form fall back to a normal upload.
+        const hash = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(hash), (b) => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function upload(input, form) {
+        const file = input.files[0];
+        const keyInput = form.querySelector('input[name="uploaded_key"]');
+        const nameInput = form.querySelector('input[name="uploaded_filename"]');
+        const submits = form.querySelectorAll('input[type="submit"]');
+        if (!file || !keyInput) {
+            return;
+        }
+
+        submits.forEach((el) => { el.disabled = true; });
+        setStatus(input, 'Uploading ' + file.name + '…');
+        try {
+            const body = new FormData();
+            body.append('prefix', input.dataset.prefix);
+            body.append('content_type', file.type || 'application/octet-stream');
+            body.append('size', file.size);
+            body.append('sha256', await sha256(file));
+            const presign = await fetch(input.dataset.directUploadUrl, {
+                method: 'POST',
+                body: body,
+                headers: {'X-CSRFToken': form.querySelector('[name="csrfmiddlewaretoken"]').value},
+                credentials: 'same-origin',
+            });
+            const policy = await presign.json();
+            if (!presign.ok) {
+                throw new Error(policy.error || 'Could not start upload.');
+            }
+
+            if (!policy.exists) {
+                const s3Body = new FormData();
+                Object.entries(policy.fields).forEach(([name, value]) => s3Body.append(name, value));
+                s3Body.append('file', file);
+                const s3 = await fetch(policy.url, {method: 'POST', body: s3Body});
+                if (!s3.ok) {
+                    throw new Error('Storage rejected the upload (HTTP ' + s3.status + ').');
+                }
+            }
+
+            keyInput.value = policy.key;
+            if (nameInput) {
+                nameInput.value = file.name;
+            }
+            input.value = '';
+            setStatus(input, 'Uploaded ' + file.name + '. Save to apply.');
+        } catch (err) {
+            // Leave the file selected so the form falls back to a normal upload.
+            keyInput.value = '';
+            setStatus(input, err.message + ' The file will be sent with the form instead.', true);
+        } finally {
+            submits.forEach((el) => { el.disabled = false; });
+        }
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('input[type="file"][data-direct-upload-url]').forEach((input) => {
+            input.addEventListener('change', () => upload(input, input.form));
+        });
+    });
+})();
@@ -0,0 +1,243 @@
+"""
+Deterministic synthetic data for the Prisma tables, for scale testing.
+
+Every generator takes the same seeded random.Random, so a given seed and
+set of counts always produces the same rows, ids included (timestamps
+are laid out backwards from the time of the run). Ids are
+prefixed with s<seed>- so synthetic rows are easy to recognise. Rows are
+yielded lazily and written with core.bulk.insert_rows (COPY on
+PostgreSQL), so tens of millions of placements never sit in memory.
+
+Distributions are skewed the way real data is: a few maps and users own
+most placements and spaces (log-normal / power-law weights), props cluster
+around a handful of points per map, and most refresh tokens are expired.
+"""
+
+import bisect
+import itertools
+import random
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.utils import timezone
+
+from core.bulk import insert_rows
+from core.hashing import slow_hash
+from core.models import Avatar, Element, Map, Mapelementplacement, Refreshtoken, Space, Spaceelementplacement, User
+
+# Everyone gets the same hash: argon2 per row would dominate the run time.
+PASSWORD = 'password'
+
+SIZES = [16, 32, 48, 64, 96, 128, 192, 256]
+HISTORY = timedelta(days=730)
+
+
+@dataclass
+class Counts:
+    users: int = 1000
+    avatars: int = 20
+    elements: int = 500
+    maps: int = 50
+    spaces: int = 500
+    map_placements: int = 100_000
+    space_placements: int = 100_000
+    tokens_per_user: float = 2.0
+
+
+class Weighted:
+    """Draws indexes in [0, n) with the given relative weights, in O(log n)."""
+
+    def __init__(self, weights):
+        self.cumulative = list(itertools.accumulate(weights))
+
+    def draw(self, rng):
+        return bisect.bisect(self.cumulative, rng.random() * self.cumulative[-1])
+
+
+def split(total, weights):
+    """Integers proportional to weights that add up to total."""
+    scale = total / sum(weights)
+    counts = [int(w * scale) for w in weights]
+    for i in range(total - sum(counts)):
+        counts[i % len(counts)] += 1
+    return counts
+
+
+class SyntheticData:
+    def __init__(self, seed, counts):
+        self.seed = seed
+        self.counts = counts
+        self.rng = random.Random(seed)
+        self.prefix = f's{seed}-'
+        self.now = timezone.now().replace(microsecond=0)
+        self.password_hash = slow_hash(PASSWORD)
+        # Filled in as tables are generated; later tables refer back to them.
+        self.user_created = []
+        self.admins = []
+        self.element_ids = []
+        self.maps = []  # (id, width, height)
+
+    def id(self, kind, i):
+        return f'{self.prefix}{kind}{i}'
+
+    def created_at(self, i, n):
+        """Timestamps that grow with i over HISTORY, like real sign-ups."""
+        jitter = self.rng.random() / max(n, 1)
+        return self.now - HISTORY * (1 - i / max(n, 1) - jitter)
+
+    def users(self):
+        n = self.counts.users
+        for i in range(n):
+            created = self.created_at(i, n)
+            admin = self.rng.random() < 0.01 or i == 0
+            self.user_created.append(created)
+            if admin:
+                self.admins.append(self.id('user', i))
+            yield (
+                self.id('user', i), f'User {i}', f'{self.prefix}user{i}', self.password_hash,
+                f'user{i}.{self.prefix}@example.test', 'ADMIN' if admin else 'USER',
+                created, created, created + timedelta(days=1) if self.rng.random() < 0.02 else None,
+            )
+
+    def avatars(self):
+        n = self.counts.avatars
+        for i in range(n):
+            created = self.created_at(i, n)
+            yield (
+                self.id('avatar', i), f'Avatar {i}', f'avatars/{self.prefix}{i}.png',
+                created, created, self.rng.choice(self.admins),
+            )
+
+    def elements(self):
+        n = self.counts.elements
+        for i in range(n):
+            created = self.created_at(i, n)
+            self.element_ids.append(self.id('element', i))
+            yield (
+                self.id('element', i), f'Element {i}', f'elements/{self.prefix}{i}.png',
+                self.rng.choice(SIZES), self.rng.choice(SIZES), self.rng.random() < 0.8,
+                created, created, self.rng.choice(self.admins),
+            )
+
+    def maps_(self):
+        n = self.counts.maps
+        for i in range(n):
+            created = self.created_at(i, n)
+            width = self.rng.randrange(1000, 20_001, 100)
+            height = self.rng.randrange(1000, 20_001, 100)
+            self.maps.append((self.id('map', i), width, height))
+            yield (
+                self.id('map', i), f'Map {i}', height, width, f'maps/{self.prefix}{i}.png',
+                created, created, self.rng.choice(self.admins),
+            )
+
+    def _positions(self, width, height, count):
+        """Props cluster around a few centres; the rest are scattered."""
+        centres = [(self.rng.uniform(0, width), self.rng.uniform(0, height))
+                   for _ in range(self.rng.randint(1, 5))]
+        spread = min(width, height) / 10
+        for _ in range(count):
+            if self.rng.random() < 0.7:
+                cx, cy = self.rng.choice(centres)
+                x, y = self.rng.gauss(cx, spread), self.rng.gauss(cy, spread)
+            else:
+                x, y = self.rng.uniform(0, width), self.rng.uniform(0, height)
+            yield min(max(int(x), 0), width), min(max(int(y), 0), height)
+
+    def _placement(self, kind, i, owner_id, x, y, elements):
+        return (
+            self.id(kind, i), owner_id, self.element_ids[elements.draw(self.rng)], x, y,
+            round(self.rng.choice((1, 1, 1, 0.5, 1.5, 2)), 2),
+            self.rng.choice((0, 0, 0, 0, 90, 180, 270)),
+        )
+
+    def map_placements(self):
+        elements = Weighted([self.rng.paretovariate(1.2) for _ in self.element_ids])
+        per_map = split(self.counts.map_placements, [self.rng.lognormvariate(0, 1) for _ in self.maps])
+        i = 0
+        for (map_id, width, height), count in zip(self.maps, per_map):
+            for x, y in self._positions(width, height, count):
+                yield self._placement('mep', i, map_id, x, y, elements)
+                i += 1
+
+    def spaces(self):
+        n = self.counts.spaces
+        popular = Weighted([self.rng.paretovariate(1.5) for _ in self.maps])
+        self.space_maps = []
+        for i in range(n):
+            created = self.created_at(i, n)
+            map_index = popular.draw(self.rng)
+            # Power law: a few users own most spaces.
+            owner = int(self.counts.users * self.rng.random() ** 3)
+            self.space_maps.append(self.maps[map_index])
+            yield (
+                self.id('space', i), f'Space {i}', created, created, None,
+                self.maps[map_index][0], self.id('user', owner),
+            )
+
+    def space_placements(self):
+        elements = Weighted([self.rng.paretovariate(1.2) for _ in self.element_ids])
+        per_space = split(self.counts.space_placements, [self.rng.lognormvariate(0, 1) for _ in self.space_maps])
+        i = 0
+        for space_index, ((_, width, height), count) in enumerate(zip(self.space_maps, per_space)):
+            space_id = self.id('space', space_index)
+            for x, y in self._positions(width, height, count):
+                yield self._placement('sep', i, space_id, x, y, elements)
+                i += 1
+
+    def tokens(self):
+        i = 0
+        for user_index, joined in enumerate(self.user_created):
+            for _ in range(min(int(self.rng.expovariate(1 / self.counts.tokens_per_user)), 50)):
+                created = joined + (self.now - joined) * self.rng.random()
+                expires = created + timedelta(days=30)
+                revoked = created + timedelta(days=self.rng.uniform(0, 30)) if self.rng.random() < 0.1 else None
+                yield (
+                    self.id('token', i), f'{self.prefix}{i:x}{self.rng.getrandbits(128):032x}',
+                    self.id('user', user_index), created, expires, revoked,
+                    min(expires, self.now), self.rng.choice(('Mozilla/5.0', 'node', None)),
+                )
+                i += 1
+
+
+# (label, model, generator method, fields in the generator's tuple order)
+TABLES = [
+    ('users', User, 'users',
+     ('id', 'name', 'handle', 'password_hash', 'email', 'role', 'created_at', 'updated_at', 'deleted_at')),
+    ('avatars', Avatar, 'avatars',
+     ('id', 'name', 'image_key', 'created_at', 'updated_at', 'user_id')),
+    ('elements', Element, 'elements',
+     ('id', 'name', 'image_key', 'height', 'width', 'static', 'created_at', 'updated_at', 'user_id')),
+    ('maps', Map, 'maps_',
+     ('id', 'name', 'height', 'width', 'thumbnail_key', 'created_at', 'updated_at', 'user_id')),
+    ('map placements', Mapelementplacement, 'map_placements',
+     ('id', 'map_id', 'element_id', 'x', 'y', 'scale', 'rotation')),
+    ('spaces', Space, 'spaces',
+     ('id', 'name', 'created_at', 'updated_at', 'deleted_at', 'map_id', 'user_id')),
+    ('space placements', Spaceelementplacement, 'space_placements',
+     ('id', 'space_id', 'element_id', 'x', 'y', 'scale', 'rotation')),
+    ('refresh tokens', Refreshtoken, 'tokens',
+     ('id', 'token_hash', 'user_id', 'created_at', 'expires_at', 'revoked_at', 'last_used_at', 'user_agent')),
+]
+
+
+def already_generated(seed):
+    return User.objects.filter(id=f's{seed}-user0').exists()
+
+
+def generate(seed, counts, batch_size=50_000, progress=None):
+    """Insert every table in TABLES, in order. Returns [(label, rows, seconds)].
+
+    progress(label, inserted_so_far) is called after every batch.
+    """
+    data = SyntheticData(seed, counts)
+    report = []
+    for label, model, method, fields in TABLES:
+        start = time.perf_counter()
+        rows = insert_rows(
+            model, fields, getattr(data, method)(), batch_size,
+            progress=progress and (lambda n, label=label: progress(label, n)),
+        )
+        report.append((label, rows, time.perf_counter() - start))
+    return report
@@ -1,3 +1,1393 @@
-from django.test import TestCase
+import base64
+import hashlib
+import importlib
+import io
+import json
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import argon2
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User as DjangoUser
+from django.core.cache import cache as django_cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core import s3
+from core.autocomplete import RESULTS, TTLCache
+from core.benchmark import compare, stub_s3
+from core.instrumentation import BYTES, ERRORS, OPERATION_SECONDS, prefix_of
+from core.direct_upload import verify_uploaded_key
+from core.forms import get_avatar_form, get_element_form
+from core.models import Avatar, Element, Map, Mapelementplacement, Refreshtoken, Space, Spaceelementplacement, User
+from core.pagination import CURSOR_VAR, EstimatedCountPaginator
+from core.placements import PlacementImportError, _copy_upsert, export_placements, import_placements, instantiate_spaces
+from core.provisioning import provision_users
+from core.renditions import target_sizes
+from core.spatial import nearest, viewport
+from core.synthetic import TABLES as SYNTHETIC_TABLES, Counts, SyntheticData
+from core.thumbnails import thumbnail_url
+from core.timing import collect
+from search.indexes import ensure_indexes
+from uploads.atlas import GLOBAL, build, fingerprint, pack, publish, scope_elements
+from uploads.dedup import IMMUTABLE, release
+from uploads.deletions import BACKOFF_BASE, BACKOFF_MAX, _backoff, drain_once, queue_deletion
+from uploads.ingest import IngestSource, ingest
+from uploads.models import ImageRendition, PendingRendition, PendingS3Deletion, SpriteAtlas, StoredObject, UploadedImage
+from uploads.transcoding import CLAIM_TIMEOUT, process_once
+
+
+class PrismaTablesTestCase(TestCase):
+    """TestCase that creates the unmanaged Prisma tables in the test database.
+
+    Django never creates tables for managed=False models, so tests that touch
+    them build the tables themselves and drop them again afterwards.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        existing = set(connection.introspection.table_names())
+        cls._created_models = [
+            model for model in apps.get_app_config('core').get_models()
+            if model._meta.db_table not in existing
+        ]
+        with connection.schema_editor() as editor:
+            for model in cls._created_models:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls._created_models):
+                editor.delete_model(model)
+
+    def setUp(self):
+        admin = DjangoUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+
+
+def make_user(n):
+    now = timezone.now()
+    return User.objects.create(
+        id=f'user{n}', name=f'User {n}', handle=f'handle{n}', password_hash='x' * 97,
+        email=f'user{n}@example.com', role='USER', created_at=now, updated_at=now,
+    )
+
+
+class ChangelistQueryCountTests(PrismaTablesTestCase):
+    """A changelist page must cost the same number of queries however many
+    rows (and distinct FK targets) it shows."""
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def add_placements(self, count):
+        now = timezone.now()
+        map_ = Map.objects.create(
+            id=f'map{count}', name='Map', width=100, height=100, thumbnail_key='maps/x.png',
+            created_at=now, updated_at=now,
+        )
+        space = Space.objects.create(id=f'space{count}', name='Space', map=map_, created_at=now, updated_at=now)
+        for i in range(count):
+            element = Element.objects.create(
+                id=f'el{count}-{i}', name=f'Element {i}', image_key=f'elements/{count}-{i}.png',
+                width=32, height=32, static=True, created_at=now, updated_at=now,
+            )
+            Spaceelementplacement.objects.create(
+                id=f'sep{count}-{i}', space=space, element=element, x=i, y=i, scale=1, rotation=0,
+            )
+
+    def add_tokens(self, count):
+        now = timezone.now()
+        for i in range(count):
+            Refreshtoken.objects.create(
+                id=f'rt{count}-{i}', token_hash=f'hash{count}-{i}', user=make_user(f'{count}-{i}'),
+                created_at=now, expires_at=now + timedelta(days=1), last_used_at=now,
+            )
+
+    def test_placement_changelist(self):
+        url = '/core/spaceelementplacement/'
+        self.add_placements(2)
+        small = self.count_queries(url)
+        self.add_placements(20)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_refreshtoken_changelist(self):
+        url = '/core/refreshtoken/'
+        self.add_tokens(2)
+        small = self.count_queries(url)
+        self.add_tokens(20)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_sensitive_columns_are_deferred(self):
+        self.add_tokens(1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/core/refreshtoken/')
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('token_hash', sql)
+        self.assertNotIn('password_hash', sql)
+
+
+@override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+class EstimatedCountPaginatorTests(TestCase):
+
+    @mock.patch('core.pagination.estimated_row_count', return_value=5_000_000)
+    def test_unfiltered_large_table_uses_estimate(self, _):
+        paginator = EstimatedCountPaginator(DjangoUser.objects.order_by('pk'), 100)
+        self.assertEqual(paginator.count, 5_000_000)
+        self.assertTrue(paginator.is_estimate)
+
+    @mock.patch('core.pagination.estimated_row_count', return_value=5_000_000)
+    def test_filtered_list_is_counted_exactly(self, _):
+        paginator = EstimatedCountPaginator(DjangoUser.objects.filter(is_staff=True).order_by('pk'), 100)
+        self.assertEqual(paginator.count, 0)
+        self.assertFalse(paginator.is_estimate)
+
+    @mock.patch('core.pagination.estimated_row_count', return_value=10)
+    def test_small_table_is_counted_exactly(self, _):
+        paginator = EstimatedCountPaginator(DjangoUser.objects.order_by('pk'), 100)
+        self.assertEqual(paginator.count, 0)
+        self.assertFalse(paginator.is_estimate)
+
+    @skipUnless(connection.vendor == 'postgresql', 'statement_timeout is PostgreSQL-only')
+    @override_settings(ADMIN_COUNT_TIMEOUT_MS=1)
+    def test_slow_count_is_cancelled_by_the_statement_timeout(self):
+        DjangoUser.objects.create(username='staff', is_staff=True)
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            before = cursor.fetchone()[0]
+        slow = DjangoUser.objects.filter(is_staff=True).extra(
+            where=['(SELECT count(*) FROM generate_series(1, 50000000)) > 0'],
+        ).order_by('pk')
+        start = time.perf_counter()
+        with self.assertLogs('core.pagination', 'INFO'):
+            count = EstimatedCountPaginator(slow, 100).count
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertGreaterEqual(count, 1)
+        # The count's savepoint was rolled back, taking its SET LOCAL with it.
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            self.assertEqual(cursor.fetchone()[0], before)
+
+    @skipUnless(connection.vendor == 'postgresql', 'statement_timeout is PostgreSQL-only')
+    def test_successful_count_restores_the_outer_transactions_timeout(self):
+        DjangoUser.objects.create(username='staff', is_staff=True)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = '7s'")
+            paginator = EstimatedCountPaginator(DjangoUser.objects.filter(is_staff=True).order_by('pk'), 100)
+            self.assertEqual(paginator.count, 1)
+            self.assertFalse(paginator.is_estimate)
+            cursor.execute('SHOW statement_timeout')
+            self.assertEqual(cursor.fetchone()[0], '7s')
+
+    @skipUnless(connection.vendor == 'postgresql', 'EXPLAIN (FORMAT JSON) and statement_timeout are PostgreSQL-only')
+    def test_timed_out_filtered_count_uses_the_query_estimate(self):
+        DjangoUser.objects.create(username='staff', is_staff=True)
+        qs = DjangoUser.objects.filter(is_staff=True).order_by('pk')
+        with mock.patch.object(type(qs), 'count', side_effect=OperationalError('canceling statement')):
+            paginator = EstimatedCountPaginator(qs, 100)
+            self.assertGreaterEqual(paginator.count, 1)
+        self.assertTrue(paginator.is_estimate)
+        with mock.patch('core.pagination.estimated_query_count', return_value=0):
+            with mock.patch.object(type(qs), 'count', side_effect=OperationalError('canceling statement')):
+                self.assertEqual(EstimatedCountPaginator(qs, 100).count, 1)
+
+
+class KeysetPaginationTests(PrismaTablesTestCase):
+    url = '/core/refreshtoken/'
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(admin.site.get_model_admin(Refreshtoken), 'list_per_page', 10)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.start = timezone.now()
+        for i in range(25):
+            self.add_token(i)
+
+    def add_token(self, i):
+        # Pairs of tokens share a created_at so the id tie-breaker matters.
+        created = self.start + timedelta(seconds=i // 2)
+        Refreshtoken.objects.create(
+            id=f'rt{i:03}', token_hash=f'hash{i}', created_at=created,
+            expires_at=created + timedelta(days=1), last_used_at=created,
+        )
+
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        cl = response.context['cl']
+        return [obj.id for obj in cl.result_list], cl
+
+    def test_walks_every_row_once_despite_inserts(self):
+        ids, cl = self.page(f'{self.url}?{CURSOR_VAR}=')
+        self.assertEqual(ids[0], 'rt024')
+        seen = list(ids)
+        while cl.next_url:
+            # New rows land ahead of the cursor and must not shift later pages.
+            self.add_token(100 + len(seen))
+            ids, cl = self.page(self.url + cl.next_url)
+            seen += ids
+        self.assertEqual(seen, [f'rt{i:03}' for i in reversed(range(25))])
+
+    def test_previous_returns_to_the_same_page(self):
+        first, cl = self.page(f'{self.url}?{CURSOR_VAR}=')
+        second, cl = self.page(self.url + cl.next_url)
+        self.assertEqual(self.page(self.url + cl.previous_url)[0], first)
+
+    def test_query_count_does_not_grow_with_depth(self):
+        _, cl = self.page(f'{self.url}?{CURSOR_VAR}=')
+        with CaptureQueriesContext(connection) as first:
+            _, cl = self.page(self.url + cl.next_url)
+        with CaptureQueriesContext(connection) as deeper:
+            self.page(self.url + cl.next_url)
+        self.assertEqual(len(first), len(deeper))
+        self.assertFalse(any('OFFSET' in q['sql'] for q in deeper.captured_queries))
+
+    def test_only_the_first_page_counts(self):
+        with CaptureQueriesContext(connection) as queries:
+            _, cl = self.page(f'{self.url}?{CURSOR_VAR}=')
+        self.assertTrue(any('COUNT(' in q['sql'] for q in queries.captured_queries))
+        with CaptureQueriesContext(connection) as queries:
+            _, cl = self.page(self.url + cl.next_url)
+        self.assertFalse(any('COUNT(' in q['sql'] for q in queries.captured_queries))
+        self.assertEqual(cl.result_count, 25)
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get(f'{self.url}?{CURSOR_VAR}=nonsense')
+        self.assertRedirects(response, f'{self.url}?e=1', fetch_redirect_response=False)
+
+
+class AdminSearchTests(PrismaTablesTestCase):
+
+    def test_user_is_searchable_by_indexed_columns(self):
+        make_user(1)
+        make_user(2)
+        response = self.client.get('/core/user/', {'q': 'user2@example'})
+        cl = response.context['cl']
+        self.assertEqual(list(cl.search_fields), ['name', 'handle', 'email'])
+        self.assertEqual([u.id for u in cl.result_list], ['user2'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'pg_trgm is PostgreSQL-only')
+    def test_trigram_search_tolerates_typos_ranks_hits_and_uses_the_index(self):
+        ensure_indexes(connection)
+        for n, handle in enumerate(['stonemasonry', 'stonemason', 'bricklayer']):
+            User.objects.filter(pk=make_user(n).pk).update(handle=handle)
+
+        cl = self.client.get('/core/user/', {'q': 'stonemasn'}).context['cl']
+        self.assertEqual([u.handle for u in cl.result_list], ['stonemason', 'stonemasonry'])
+
+        with CaptureQueriesContext(connection) as queries:
+            list(self.client.get('/core/user/', {'q': 'mason'}).context['cl'].result_list)
+        search_sql = next(q['sql'] for q in queries.captured_queries if 'similarity' in q['sql'].lower())
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {search_sql}')
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('_trgm_idx', plan)
+
+
+class PlacementTestCase(PrismaTablesTestCase):
+    """Two maps and two elements; 'map' has placements p1 and p2."""
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.map = Map.objects.create(
+            id='map', name='Map', width=100, height=100, thumbnail_key='maps/x.png',
+            created_at=now, updated_at=now,
+        )
+        self.other = Map.objects.create(
+            id='other', name='Other', width=100, height=100, thumbnail_key='maps/y.png',
+            created_at=now, updated_at=now,
+        )
+        for i in range(2):
+            Element.objects.create(
+                id=f'el{i}', name=f'Element {i}', image_key=f'elements/{i}.png',
+                width=32, height=32, static=True, created_at=now, updated_at=now,
+            )
+        Mapelementplacement.objects.create(id='p1', map=self.map, element_id='el0', x=1, y=1, scale=1, rotation=0)
+        Mapelementplacement.objects.create(id='p2', map=self.map, element_id='el0', x=2, y=2, scale=1, rotation=0)
+
+
+class PlacementTransferTests(PlacementTestCase):
+
+    def test_export_streams_csv_and_jsonl(self):
+        response = self.client.get(f'/core/map/{self.map.pk}/placements/export/', {'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,element_id,x,y,scale,rotation')
+        self.assertEqual(lines[1:], ['p1,el0,1,1,1.0,0.0', 'p2,el0,2,2,1.0,0.0'])
+
+        rows = list(export_placements(self.map, 'jsonl'))
+        self.assertEqual(json.loads(rows[0])['id'], 'p1')
+
+    def test_import_upserts_and_replaces(self):
+        lines = ['id,element_id,x,y\n', 'p1,el1,10,10\n', ',el1,5,5\n']
+        report = import_placements(self.map, lines, 'csv', replace=True)
+        self.assertEqual((report.created, report.updated, report.deleted), (1, 1, 1))
+        placements = Mapelementplacement.objects.filter(map=self.map)
+        self.assertEqual(placements.count(), 2)
+        self.assertEqual(placements.get(id='p1').element_id, 'el1')
+        self.assertFalse(placements.filter(id='p2').exists())
+
+    def test_import_rejects_bad_rows_without_writing(self):
+        lines = [
+            '{"element_id": "missing", "x": 1, "y": 1}\n',
+            '{"id": "p1", "element_id": "el0", "x": 1, "y": 1}\n',
+        ]
+        with self.assertRaises(PlacementImportError) as ctx:
+            import_placements(self.other, lines, 'jsonl')
+        self.assertEqual(len(ctx.exception.errors), 2)
+        self.assertFalse(Mapelementplacement.objects.filter(map=self.other).exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY and ON CONFLICT are PostgreSQL-only')
+    def test_import_copies_into_staging_and_upserts_once(self):
+        lines = ['id,element_id,x,y\n', 'p1,el1,10,10\n'] + [f',el0,{i},{i}\n' for i in range(500)]
+        with CaptureQueriesContext(connection) as queries:
+            report = import_placements(self.map, lines, 'csv', replace=True)
+        self.assertEqual((report.created, report.updated, report.deleted), (500, 1, 1))
+        self.assertEqual(Mapelementplacement.objects.filter(map=self.map).count(), 501)
+        upserts = [q['sql'] for q in queries.captured_queries if 'ON CONFLICT' in q['sql']]
+        self.assertEqual(len(upserts), 1)
+        self.assertFalse(any('INSERT INTO "MapElementPlacement" ("id"' in q['sql'] and 'VALUES' in q['sql']
+                             for q in queries.captured_queries))
+
+        # A row owned by another map is never taken over by the upsert.
+        Mapelementplacement.objects.filter(pk='p1').update(map=self.other)
+        owner_field = Mapelementplacement._meta.get_field('map')
+        _copy_upsert(connection, Mapelementplacement, owner_field, self.map, io.StringIO('p1,el0,7,7,1,0\n'), False)
+        self.assertEqual(Mapelementplacement.objects.get(pk='p1').map_id, 'other')
+
+    def test_import_view(self):
+        self.assertContains(self.client.get(f'/core/map/{self.other.pk}/change/'), 'Import placements')
+        upload = SimpleUploadedFile('layout.jsonl', b'{"element_id": "el1", "x": 3, "y": 4}\n')
+        response = self.client.post(f'/core/map/{self.other.pk}/placements/import/', {'file': upload})
+        self.assertRedirects(response, f'/core/map/{self.other.pk}/change/', fetch_redirect_response=False)
+        self.assertEqual(Mapelementplacement.objects.filter(map=self.other).count(), 1)
+
+
+class SpatialQueryTests(PrismaTablesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.map = Map.objects.create(
+            id='map', name='Map', width=1000, height=1000, thumbnail_key='maps/x.png',
+            created_at=now, updated_at=now,
+        )
+        Element.objects.create(
+            id='tree', name='Tree', image_key='elements/tree.png', width=100, height=50,
+            static=True, created_at=now, updated_at=now,
+        )
+        for pk, x, y, scale, rotation in [
+            ('inside', 500, 500, 1, 0),
+            ('overlaps', 380, 500, 1, 0),      # reaches x=480 from the left
+            ('scaled', 250, 500, 2.5, 0),      # reaches x=500 only because of its scale
+            ('rotated', 420, 420, 1, 90),      # inside only by its bounding square
+            ('outside', 100, 100, 1, 0),
+        ]:
+            Mapelementplacement.objects.create(
+                id=pk, map=self.map, element_id='tree', x=x, y=y, scale=scale, rotation=rotation,
+            )
+
+    def test_viewport_includes_everything_that_reaches_it(self):
+        found = {p.id for p in viewport(self.map, 450, 450, 600, 600)}
+        self.assertEqual(found, {'inside', 'overlaps', 'scaled', 'rotated'})
+
+    def test_nearest_orders_by_distance(self):
+        self.assertEqual([p.id for p in nearest(self.map, 110, 110, k=2)], ['outside', 'scaled'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'GiST and KNN are PostgreSQL-only')
+    def test_queries_use_the_gist_index(self):
+        ensure_indexes(connection)
+        for query in (lambda: list(viewport(self.map, 450, 450, 600, 600)), lambda: nearest(self.map, 110, 110, k=2)):
+            with CaptureQueriesContext(connection) as queries:
+                query()
+            sql = next(q['sql'] for q in queries.captured_queries if 'point(' in q['sql'])
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            self.assertIn('MapElementPlacement_xy_gist_idx', plan)
+        # KNN ordering comes straight from the index: no sort step.
+        self.assertNotIn('Sort', plan)
+
+    def test_viewport_endpoint(self):
+        response = self.client.get(f'/placements/map/{self.map.pk}/viewport/', {'x0': 0, 'y0': 0, 'x1': 150, 'y1': 150})
+        self.assertEqual([p['id'] for p in response.json()['placements']], ['outside'])
+        self.assertEqual(self.client.get(f'/placements/map/{self.map.pk}/viewport/').status_code, 400)
+
+
+class InstantiateSpacesTests(PlacementTestCase):
+
+    def test_copies_placements_in_constant_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            spaces, created = instantiate_spaces(self.map, [f'Space {i}' for i in range(50)])
+        self.assertEqual(created, 100)
+        self.assertLessEqual(len(ctx), 4)  # savepoint, spaces, placements, release
+        placements = Spaceelementplacement.objects.filter(space__in=spaces)
+        self.assertEqual(placements.count(), 100)
+        self.assertEqual(placements.values('id').distinct().count(), 100)
+        self.assertEqual(set(placements.values_list('element_id', 'x')), {('el0', 1), ('el0', 2)})
+
+    def test_admin_action(self):
+        response = self.client.post('/core/map/', {
+            'action': 'create_spaces', '_selected_action': [self.map.pk, self.other.pk],
+            'apply': '1', 'count': 3, 'name': 'Copy',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Space.objects.filter(map=self.map).count(), 3)
+        self.assertEqual(Spaceelementplacement.objects.filter(space__map=self.map).count(), 6)
+        self.assertTrue(Space.objects.filter(map=self.other, name='Copy #3').exists())
+
+
+class PurgeExpiredTests(PrismaTablesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        for i, (expires, revoked) in enumerate([
+            (now - timedelta(days=2), None),
+            (now - timedelta(hours=1), None),
+            (now + timedelta(days=1), now - timedelta(days=1)),
+            (now + timedelta(days=1), None),
+            (now + timedelta(days=2), None),
+        ]):
+            Refreshtoken.objects.create(
+                id=f'rt{i}', token_hash=f'hash{i}', created_at=now - timedelta(days=3),
+                expires_at=expires, revoked_at=revoked, last_used_at=now,
+            )
+
+    def test_purges_in_batches(self):
+        out = io.StringIO()
+        call_command('purge_expired', '--batch-size=1', '--sleep=0', '--only=tokens', stdout=out)
+        self.assertEqual(sorted(Refreshtoken.objects.values_list('id', flat=True)), ['rt3', 'rt4'])
+        self.assertIn('expired refresh tokens: 2 deleted.', out.getvalue())
+
+    def test_keep_days_and_dry_run(self):
+        call_command('purge_expired', '--dry-run', stdout=io.StringIO())
+        self.assertEqual(Refreshtoken.objects.count(), 5)
+        call_command('purge_expired', '--keep-days=1.5', '--sleep=0', stdout=io.StringIO())
+        self.assertEqual(Refreshtoken.objects.count(), 4)
+
+
+class ProvisionUsersTests(PrismaTablesTestCase):
+
+    def test_provisions_and_skips_duplicates(self):
+        make_user('existing')
+        records = enumerate([
+            {'name': 'Ada', 'email': 'ada@example.com', 'password': 'pw1'},
+            {'name': 'Bob', 'email': 'bob@example.com', 'role': 'admin', 'handle': 'bob'},
+            {'name': 'Ada again', 'email': 'ADA@example.com'},
+            {'name': 'Existing', 'email': 'UserExisting@Example.com'},
+            {'name': 'No email'},
+        ], start=1)
+        report = provision_users(records, default_password='secret', workers=2, batch_size=1)
+
+        self.assertEqual(report.created, 2)
+        self.assertEqual(sorted(line for line, _ in report.skipped), [3, 4, 5])
+        bob = User.objects.get(email='bob@example.com')
+        self.assertEqual((bob.handle, bob.role), ('bob', 'ADMIN'))
+        self.assertTrue(argon2.PasswordHasher().verify(bob.password_hash, 'secret'))
+        self.assertTrue(bob.password_hash.startswith('$argon2id$v=19$m=16384,t=2,p=1$'))
+        self.assertEqual(len(User.objects.get(email='ada@example.com').id), 24)
+
+
+class GenerateSyntheticTests(PrismaTablesTestCase):
+
+    def test_generates_requested_counts(self):
+        call_command(
+            'generate_synthetic', '--seed=3', '--users=20', '--elements=5', '--maps=3', '--spaces=4',
+            '--map-placements=50', '--space-placements=30', '--batch-size=7', stdout=io.StringIO(),
+        )
+        self.assertEqual(User.objects.filter(id__startswith='s3-').count(), 20)
+        self.assertEqual(Space.objects.count(), 4)
+        self.assertEqual(Mapelementplacement.objects.count(), 50)
+        self.assertEqual(Spaceelementplacement.objects.count(), 30)
+        self.assertTrue(User.objects.filter(role='ADMIN').exists())
+        for placement in Mapelementplacement.objects.select_related('map'):
+            self.assertTrue(0 <= placement.x <= placement.map.width and 0 <= placement.y <= placement.map.height)
+
+        with self.assertRaisesMessage(CommandError, 'already exists'):
+            call_command('generate_synthetic', '--seed=3', stdout=io.StringIO())
+
+    def test_same_seed_same_rows(self):
+        def rows(seed):
+            data = SyntheticData(seed, Counts(users=10, elements=4, maps=2, spaces=3, map_placements=20, space_placements=10))
+            return [list(getattr(data, method)()) for _, _, method, _ in SYNTHETIC_TABLES]
+
+        with mock.patch('core.synthetic.slow_hash', return_value='hash'), \
+                mock.patch('core.synthetic.timezone.now', return_value=timezone.now()):
+            self.assertEqual(rows(1), rows(1))
+            self.assertNotEqual([r[3:5] for r in rows(1)[4]], [r[3:5] for r in rows(2)[4]])
+
+
+class BenchAdminTests(PrismaTablesTestCase):
+
+    def test_writes_results_and_rolls_back(self):
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command(
+                'bench_admin', '--sizes', '20', '--requests=2', '--models', 'core.User', 'uploads.UploadedImage',
+                f'--output={output.name}', stdout=io.StringIO(),
+            )
+            run = json.load(output)
+
+        views = {(r['model'], r['view']) for r in run['results']}
+        self.assertEqual(views, {
+            ('core.User', 'changelist'), ('core.User', 'search'), ('core.User', 'change'),
+            ('uploads.UploadedImage', 'changelist'), ('uploads.UploadedImage', 'change'),
+        })
+        for result in run['results']:
+            self.assertEqual((result['size'], result['status']), (20, 200))
+            self.assertGreater(result['bytes'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+        self.assertFalse(User.objects.exists())
+
+    def test_compare_flags_extra_queries_and_slower_p95(self):
+        def run(queries, p95):
+            return {'results': [{'size': 10, 'model': 'core.Map', 'view': 'changelist', 'queries': queries, 'p95_ms': p95}]}
+
+        self.assertEqual(compare(run(4, 10), run(4, 12)), [])
+        self.assertEqual(len(compare(run(4, 10), run(5, 20))), 2)
+
+
+class RequestTimingTests(PrismaTablesTestCase):
+
+    def test_server_timing_and_metrics(self):
+        make_user(1)
+        response = self.client.get('/core/user/')
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'db', 's3', 'render', 'total'})
+        self.assertNotIn('desc="0 queries"', timing['db'])
+
+        metrics = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE admin_request_duration_seconds histogram', metrics)
+        self.assertIn('admin_request_db_queries_count{view="changelist",model="core.User"}', metrics)
+        self.assertIn('admin_responses_total{view="changelist",model="core.User",status="200"}', metrics)
+
+    def test_metrics_and_server_timing_are_closed_to_anonymous_users(self):
+        self.client.logout()
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('Server-Timing', response)
+        with override_settings(METRICS_TOKEN='sekrit'):
+            self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer nope'}).status_code, 403)
+            self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer sekrit'}).status_code, 200)
+        with override_settings(DEBUG=True):
+            self.assertIn('Server-Timing', self.client.get('/metrics'))
+
+    def test_s3_operations_are_timed_once(self):
+        with stub_s3(), collect() as timings:
+            s3.upload_file('avatars/a.png', b'x', 'image/png')
+            self.assertFalse(s3.object_exists('avatars/missing.png'))
+            s3.download_file('avatars/a.png', io.BytesIO())
+        self.assertEqual(timings.s3_calls, 3)  # each operation once
+        self.assertGreater(timings.s3_seconds, 0)
+
+
+recorded_operations = []
+
+
+MiB = 1024 * 1024
+
+
+@override_settings(S3_MULTIPART_THRESHOLD=6 * MiB, S3_MULTIPART_CHUNKSIZE=5 * MiB)
+class StreamingUploadTests(TestCase):
+
+    def chunks(self, size):
+        for start in range(0, size, MiB):
+            yield bytes([start // MiB]) * min(MiB, size - start)
+
+    def test_small_body_is_a_single_put(self):
+        with stub_s3():
+            client = s3.get_s3_client()
+            with mock.patch.object(client, 'create_multipart_upload', wraps=client.create_multipart_upload) as create:
+                s3.upload_stream('uploads/small.bin', self.chunks(6 * MiB - 1), 'application/octet-stream')
+            create.assert_not_called()
+            self.assertEqual(s3.head_file('uploads/small.bin')['ContentLength'], 6 * MiB - 1)
+
+    def test_large_body_is_sent_in_parts(self):
+        with stub_s3():
+            client = s3.get_s3_client()
+            with mock.patch.object(client, 'upload_part', wraps=client.upload_part) as upload_part:
+                s3.upload_stream('uploads/large.bin', self.chunks(11 * MiB), 'application/octet-stream')
+            self.assertEqual([len(c.kwargs['Body']) for c in upload_part.call_args_list], [5 * MiB, 5 * MiB, MiB])
+            body = io.BytesIO()
+            s3.download_file('uploads/large.bin', body)
+            self.assertEqual(body.getvalue(), b''.join(self.chunks(11 * MiB)))
+
+    def test_failed_multipart_upload_is_aborted(self):
+        def failing_chunks():
+            yield from self.chunks(7 * MiB)
+            raise OSError('client went away')
+
+        with stub_s3():
+            client = s3.get_s3_client()
+            with mock.patch.object(client, 'abort_multipart_upload', wraps=client.abort_multipart_upload) as abort:
+                with self.assertRaises(OSError), self.assertLogs('core.s3', 'WARNING'):
+                    s3.upload_stream('uploads/broken.bin', failing_chunks(), 'application/octet-stream')
+            abort.assert_called_once()
+            self.assertFalse(client.list_multipart_uploads(Bucket=settings.S3_BUCKET_NAME).get('Uploads'))
+            self.assertFalse(s3.object_exists('uploads/broken.bin'))
+
+
+class S3InstrumentationTests(PrismaTablesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        recorded_operations.clear()
+        for metric in (OPERATION_SECONDS, BYTES, ERRORS):
+            metric.clear()
+
+    def test_prefixes(self):
+        self.assertEqual(prefix_of('avatars/a.png.thumb60.webp'), 'avatars')
+        self.assertEqual(prefix_of('uploads/x/y.png'), 'uploads')
+        self.assertEqual(prefix_of('bench/a'), 'other')
+
+    @override_settings(S3_INSTRUMENTATION_SINKS=[
+        'core.instrumentation.RegistrySink', 'core.instrumentation.LoggingSink', 'core.tests.RecordingSink',
+    ])
+    def test_operations_are_recorded(self):
+        with stub_s3():
+            s3.upload_file('maps/m.png', b'12345', 'image/png')
+            s3.upload_stream('elements/e.png', [b'ab', b'cd'], 'image/png')
+            s3.download_file('maps/m.png', io.BytesIO())
+            with self.assertLogs('core.s3', 'WARNING'), self.assertRaises(Exception):
+                s3.download_file('maps/missing.png', io.BytesIO())
+
+        self.assertEqual(
+            [(op.operation, op.prefix, op.bytes, bool(op.error)) for op in recorded_operations],
+            [('put', 'maps', 5, False), ('put_stream', 'elements', 4, False),
+             ('get', 'maps', 5, False), ('get', 'maps', 0, True)],
+        )
+        self.assertEqual(OPERATION_SECONDS.snapshot(operation='get', prefix='maps')[0], 2)
+        self.assertEqual(BYTES.value(operation='put', prefix='maps'), 5)
+        self.assertEqual(ERRORS.value(operation='get', prefix='maps'), 1)
+
+        page = self.client.get('/s3-metrics/')
+        self.assertContains(page, 'put_stream')
+
+    @override_settings(S3_INSTRUMENTATION_SINKS=['core.tests.FailingSink'])
+    def test_failing_sink_does_not_break_storage(self):
+        with stub_s3(), self.assertLogs('core.s3', 'ERROR'):
+            s3.upload_file('avatars/a.png', b'x', 'image/png')
+            self.assertTrue(s3.object_exists('avatars/a.png'))
+
+
+class RecordingSink:
+    def __call__(self, op):
+        recorded_operations.append(op)
+
+
+class FailingSink:
+    def __call__(self, op):
+        raise RuntimeError('sink down')
+
+
+class AutocompleteTests(PlacementTestCase):
+
+    def setUp(self):
+        super().setUp()
+        RESULTS.clear()
+
+    def test_change_form_does_not_list_the_referenced_tables(self):
+        url = '/core/mapelementplacement/p1/change/'
+        self.client.get(url)  # warm the content type cache
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(url)
+        self.assertContains(response, 'data-ajax--url="/autocomplete/fk/"', count=2)
+        now = timezone.now()
+        Element.objects.bulk_create([
+            Element(id=f'more{i}', name=f'More {i}', image_key=f'elements/more{i}.png', width=1, height=1, static=True,
+                    created_at=now, updated_at=now)
+            for i in range(50)
+        ])
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(len(small), len(large))
+        self.assertNotContains(response, 'More 1')
+
+    def test_results_are_cached_until_the_model_changes(self):
+        params = {'app_label': 'core', 'model_name': 'mapelementplacement', 'field_name': 'element', 'term': 'element 0'}
+        first = self.client.get('/autocomplete/fk/', params)
+        self.assertEqual(first['X-Autocomplete-Cache'], 'MISS')
+        second = self.client.get('/autocomplete/fk/', {**params, 'term': ' ELEMENT  0 '})
+        self.assertEqual(second['X-Autocomplete-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+        element = Element.objects.get(id='el0')
+        self.assertEqual(second.json()['results'], [{'id': 'el0', 'text': str(element)}])
+
+        element.save()
+        self.assertEqual(self.client.get('/autocomplete/fk/', params)['X-Autocomplete-Cache'], 'MISS')
+
+    def test_permission_is_checked_on_cache_hits(self):
+        params = {'app_label': 'core', 'model_name': 'space', 'field_name': 'map', 'term': ''}
+        self.assertEqual(self.client.get('/autocomplete/fk/', params).status_code, 200)
+        self.client.logout()
+        self.assertEqual(self.client.get('/autocomplete/fk/', params).status_code, 302)
+
+    def test_ttl_and_lru(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        with mock.patch('core.autocomplete.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get('a'))
+
+
+class ThumbnailViewTests(PrismaTablesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        django_cache.clear()
+
+    def test_redirects_to_a_thumbnail_created_on_first_use(self):
+        with stub_s3():
+            s3.upload_file('avatars/a.png', png((400, 300), (255, 0, 0, 255)), 'image/png')
+            self.assertEqual(thumbnail_url('avatars/a.png', 60), '/thumbnails/60/avatars/a.png')
+
+            response = self.client.get('/thumbnails/60/avatars/a.png')
+            self.assertRedirects(
+                response, s3.public_url('avatars/a.png.thumb60.webp'), fetch_redirect_response=False,
+            )
+            self.assertIn('private', response['Cache-Control'])
+            self.assertEqual(s3.head_file('avatars/a.png.thumb60.webp')['ContentType'], 'image/webp')
+            self.assertEqual(thumbnail_url('avatars/a.png', 60), s3.public_url('avatars/a.png.thumb60.webp'))
+
+            s3.upload_file('avatars/b.png', b'not an image', 'image/png')
+            with self.assertLogs('core.views', 'WARNING'):
+                response = self.client.get('/thumbnails/60/avatars/b.png')
+            self.assertRedirects(response, s3.public_url('avatars/b.png'), fetch_redirect_response=False)
+
+        self.assertEqual(self.client.get('/thumbnails/61/avatars/a.png').status_code, 404)
+
+    def test_requires_staff(self):
+        self.client.logout()
+        with mock.patch('core.views.ensure_thumbnail') as ensure:
+            response = self.client.get('/thumbnails/60/avatars/a.png')
+        ensure.assert_not_called()
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response['Location'])
+
+
+class DirectUploadTests(PrismaTablesTestCase):
+    PNG = b'\x89PNG\r\n\x1a\n' + b'direct' * 100
+    SHA256 = hashlib.sha256(PNG).hexdigest()
+
+    def presign(self, **data):
+        return self.client.post('/direct-upload/presign/', {
+            'prefix': 'avatars', 'content_type': 'image/png', 'size': len(self.PNG), 'sha256': self.SHA256, **data,
+        })
+
+    def test_presign_binds_the_content_key_under_the_prefix(self):
+        with stub_s3():
+            response = self.presign()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['key'], f'avatars/{self.SHA256}.png')
+        self.assertFalse(data['exists'])
+        self.assertEqual(data['fields']['key'], data['key'])
+        self.assertEqual(data['fields']['Content-Type'], 'image/png')
+        self.assertEqual(data['fields']['Cache-Control'], IMMUTABLE)
+        self.assertEqual(
+            base64.b64decode(data['fields']['x-amz-checksum-sha256']), hashlib.sha256(self.PNG).digest(),
+        )
+
+        for bad in ({'prefix': 'atlases'}, {'content_type': 'text/html'}, {'size': 0},
+                    {'size': settings.S3_DIRECT_UPLOAD_MAX_SIZE + 1}, {'size': 'lots'},
+                    {'sha256': ''}, {'sha256': self.SHA256.upper()}):
+            self.assertEqual(self.presign(**bad).status_code, 400, bad)
+        self.assertEqual(self.client.get('/direct-upload/presign/').status_code, 405)
+
+    def test_verify_uploaded_key(self):
+        key = f'avatars/{self.SHA256}.png'
+        with stub_s3():
+            s3.upload_file(key, b'x', 'image/png')
+            s3.upload_file(f'elements/{self.SHA256}.png', b'x', 'image/png')
+            s3.upload_file('avatars/a.png', b'x', 'image/png')
+            self.assertEqual(verify_uploaded_key(key, 'avatars')['ContentLength'], 1)
+            for bad in (f'elements/{self.SHA256}.png', f'avatars/../elements/{self.SHA256}.png',
+                        f'avatarsx/{self.SHA256}.png', 'avatars/a.png'):
+                with self.assertRaisesMessage(ValidationError, 'not valid for this form'):
+                    verify_uploaded_key(bad, 'avatars')
+            with self.assertRaisesMessage(ValidationError, 'not found'):
+                verify_uploaded_key(f'avatars/{"0" * 64}.png', 'avatars')
+            with override_settings(S3_DIRECT_UPLOAD_MAX_SIZE=0), self.assertRaisesMessage(ValidationError, 'too large'):
+                verify_uploaded_key(key, 'avatars')
+
+    def test_same_bytes_uploaded_twice_are_stored_once(self):
+        AvatarForm = get_avatar_form(Avatar)
+        with stub_s3():
+            avatars = []
+            for name in ('first', 'second'):
+                data = self.presign().json()
+                if not data['exists']:
+                    # What the browser's POST to the policy stores.
+                    s3.upload_stream(data['key'], [self.PNG], 'image/png', cache_control=IMMUTABLE)
+                form = AvatarForm({'name': name, 'uploaded_key': data['key']})
+                self.assertTrue(form.is_valid(), form.errors)
+                avatars.append(form.save())
+            self.assertTrue(data['exists'])
+        self.assertEqual(avatars[0].image_key, avatars[1].image_key)
+        stored = StoredObject.objects.get()
+        self.assertEqual((stored.key, stored.refcount), (avatars[0].image_key, 2))
+        self.assertEqual((stored.sha256, stored.size), (self.SHA256, len(self.PNG)))
+
+
+class DeletionQueueTests(PrismaTablesTestCase):
+
+    def test_drains_due_keys_in_batches(self):
+        keys = [f'uploads/{i}.png' for i in range(3)]
+        with stub_s3():
+            for key in keys:
+                s3.upload_file(key, b'x', 'image/png')
+            queue_deletion(*keys)
+            queue_deletion('uploads/later.png', delay=timedelta(hours=1))
+
+            self.assertEqual(drain_once(batch_size=2), (2, 0))
+            self.assertEqual(drain_once(batch_size=2), (1, 0))
+            self.assertEqual(drain_once(batch_size=2), (0, 0))
+            self.assertFalse(any(s3.object_exists(key) for key in keys))
+        self.assertEqual(list(PendingS3Deletion.objects.values_list('key', flat=True)), ['uploads/later.png'])
+
+    def test_failed_keys_back_off(self):
+        queue_deletion('uploads/a.png', 'uploads/b.png')
+        with mock.patch('uploads.deletions.delete_files', return_value={'uploads/b.png': 'AccessDenied: no'}):
+            self.assertEqual(drain_once(), (1, 1))
+        row = PendingS3Deletion.objects.get()
+        self.assertEqual((row.key, row.attempts, row.last_error), ('uploads/b.png', 1, 'AccessDenied: no'))
+        self.assertAlmostEqual(
+            (row.next_attempt_at - timezone.now()).total_seconds(), BACKOFF_BASE.total_seconds() * 2, delta=5,
+        )
+        # Not due yet.
+        with mock.patch('uploads.deletions.delete_files') as delete:
+            self.assertEqual(drain_once(), (0, 0))
+        delete.assert_not_called()
+
+        with mock.patch('uploads.deletions.delete_files', side_effect=ConnectionError('S3 down')):
+            PendingS3Deletion.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(drain_once(), (0, 1))
+        self.assertEqual(PendingS3Deletion.objects.get().attempts, 2)
+        self.assertEqual(_backoff(30), BACKOFF_MAX)
+
+
+class DeduplicatedStorageTests(PrismaTablesTestCase):
+    PNG = b'\x89PNG\r\n\x1a\n' + b'sprite' * 100
+
+    def upload(self, form_class, instance=None, content=PNG, **data):
+        form = form_class(
+            {'name': 'Sprite', **data},
+            {'image_upload': SimpleUploadedFile('Sprite.PNG', content, content_type='image/png')},
+            instance=instance,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.save()
+
+    def test_same_content_is_stored_once_and_deleted_with_its_last_reference(self):
+        AvatarForm = get_avatar_form(Avatar)
+        with stub_s3():
+            first = self.upload(AvatarForm)
+            with mock.patch('uploads.dedup.upload_stream') as upload:
+                second = self.upload(AvatarForm)
+            upload.assert_not_called()
+            self.assertEqual(first.image_key, second.image_key)
+            self.assertRegex(first.image_key, r'^avatars/[0-9a-f]{64}\.png$')
+            self.assertEqual(s3.head_file(first.image_key)['CacheControl'], 'public, max-age=31536000, immutable')
+            self.assertEqual(StoredObject.objects.get(key=first.image_key).refcount, 2)
+
+            shared = first.image_key
+            self.upload(AvatarForm, instance=first, content=b'other')
+            self.assertEqual(StoredObject.objects.get(key=shared).refcount, 1)
+            self.assertFalse(PendingS3Deletion.objects.filter(key=shared).exists())
+
+            self.upload(AvatarForm, instance=second, content=b'another')
+            self.assertFalse(StoredObject.objects.filter(key=shared).exists())
+            pending = PendingS3Deletion.objects.get(key=shared)
+            self.assertGreater(pending.next_attempt_at, timezone.now())
+
+            # Re-uploaded before the drain ran: the object must survive it.
+            self.upload(AvatarForm)
+            PendingS3Deletion.objects.update(next_attempt_at=timezone.now())
+            drain_once()
+            self.assertFalse(PendingS3Deletion.objects.exists())
+            self.assertTrue(s3.object_exists(shared))
+
+    def edit_avatar(self, avatar, **data):
+        form = get_avatar_form(Avatar)({'name': avatar.name, 'image_key': avatar.image_key, **data}, instance=avatar)
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.save()
+
+    def test_typed_key_releases_the_old_key(self):
+        with stub_s3():
+            avatar = self.upload(get_avatar_form(Avatar))
+            old_key = avatar.image_key
+            s3.upload_file('avatars/typed.png', self.PNG, 'image/png')
+            self.edit_avatar(avatar, image_key='avatars/typed.png')
+            self.assertEqual(StoredObject.objects.get(key='avatars/typed.png').refcount, 1)
+            self.assertFalse(StoredObject.objects.filter(key=old_key).exists())
+            self.assertTrue(PendingS3Deletion.objects.filter(key=old_key).exists())
+
+            # Saving again without changing the key changes nothing.
+            self.edit_avatar(Avatar.objects.get(pk=avatar.pk), name='Renamed')
+            self.assertEqual(StoredObject.objects.get(key='avatars/typed.png').refcount, 1)
+
+    def test_direct_upload_of_the_current_key_adds_no_reference(self):
+        key = f'avatars/{hashlib.sha256(self.PNG).hexdigest()}.png'
+        with stub_s3():
+            s3.upload_file(key, self.PNG, 'image/png')
+            avatar = self.edit_avatar(Avatar(name='Direct'), uploaded_key=key, image_key='')
+            self.assertEqual(StoredObject.objects.get(key=key).refcount, 1)
+            self.edit_avatar(Avatar.objects.get(pk=avatar.pk), uploaded_key=key)
+            self.assertEqual(StoredObject.objects.get(key=key).refcount, 1)
+
+    def legacy_avatar(self, pk, key='avatars/legacy.png'):
+        now = timezone.now()
+        return Avatar.objects.create(id=pk, name=pk, image_key=key, created_at=now, updated_at=now)
+
+    def test_untracked_keys_are_never_deleted_while_in_use(self):
+        with stub_s3():
+            s3.upload_file('avatars/legacy.png', self.PNG, 'image/png')
+            first = self.legacy_avatar('a')
+            # Typed into a second row: the first row's reference is counted too.
+            second = self.edit_avatar(Avatar(name='b'), image_key='avatars/legacy.png')
+            self.assertEqual(StoredObject.objects.get(key='avatars/legacy.png').refcount, 2)
+            admin.site.get_model_admin(Avatar).delete_model(None, second)
+            self.assertEqual(StoredObject.objects.get(key='avatars/legacy.png').refcount, 1)
+
+            StoredObject.objects.all().delete()
+            with self.assertLogs('uploads.dedup', 'WARNING'):
+                release('avatars/legacy.png')
+            self.assertFalse(PendingS3Deletion.objects.exists())
+
+            queue_deletion('avatars/legacy.png')
+            with self.assertLogs('uploads.deletions', 'WARNING'):
+                drain_once()
+            self.assertTrue(s3.object_exists('avatars/legacy.png'))
+            self.assertEqual(StoredObject.objects.get(key='avatars/legacy.png').refcount, 1)
+
+            admin.site.get_model_admin(Avatar).delete_queryset(None, Avatar.objects.filter(pk=first.pk))
+            self.assertFalse(StoredObject.objects.exists())
+            self.assertTrue(PendingS3Deletion.objects.filter(key='avatars/legacy.png').exists())
+
+    def test_backfill_migration_counts_existing_references(self):
+        self.legacy_avatar('a')
+        self.legacy_avatar('b')
+        self.legacy_avatar('c', key='avatars/other.png')
+        StoredObject.objects.create(key='avatars/other.png', refcount=5)
+        migration = importlib.import_module('uploads.migrations.0006_backfill_stored_objects')
+        migration.backfill(apps, mock.Mock(connection=connection))
+        self.assertEqual(
+            dict(StoredObject.objects.values_list('key', 'refcount')),
+            {'avatars/legacy.png': 2, 'avatars/other.png': 1},
+        )
+        introspection = mock.Mock(table_names=mock.Mock(return_value=['Avatar']))
+        with self.assertRaisesMessage(RuntimeError, 'admin_stored_object is missing'):
+            migration.backfill(apps, mock.Mock(connection=mock.Mock(introspection=introspection)))
+
+    def test_duplicate_element_image_is_a_form_error(self):
+        ElementForm = get_element_form(Element)
+        with stub_s3():
+            self.upload(ElementForm, width=1, height=1, static=True)
+            form = ElementForm(
+                {'name': 'Again', 'width': 1, 'height': 1, 'static': True},
+                {'image_upload': SimpleUploadedFile('again.png', self.PNG, content_type='image/png')},
+            )
+            self.assertFalse(form.is_valid())
+
+    def test_ingest_deduplicates(self):
+        sources = [IngestSource(f'{i}.png', 'image/png', lambda: iter([self.PNG])) for i in range(3)]
+        with stub_s3():
+            report = ingest(sources, max_workers=1)
+        self.assertEqual(len({r.key for r in report.succeeded}), 1)
+        self.assertEqual(UploadedImage.objects.count(), 3)
+        self.assertEqual(StoredObject.objects.get().refcount, 3)
+
+
+def png(size, color):
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.new('RGBA', size, color).save(out, format='PNG')
+    return out.getvalue()
+
+
+@override_settings(ATLAS_SHEET_SIZE=128, ATLAS_PADDING=1)
+class SpriteAtlasTests(PlacementTestCase):
+
+    def build(self, scope, **kwargs):
+        # Manifests are uploaded once the build's transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            return build(scope, **kwargs)
+
+    def manifest(self, scope):
+        body = io.BytesIO()
+        s3.download_file(SpriteAtlas.objects.get(scope=scope).manifest_key, body)
+        return json.loads(body.getvalue())
+
+    def pixel(self, manifest, element_id):
+        from PIL import Image
+
+        frame = manifest['frames'][element_id]
+        body = io.BytesIO()
+        s3.download_file(manifest['sheets'][frame['sheet']]['key'], body)
+        return Image.open(body).getpixel((frame['x'], frame['y']))
+
+    def test_pack_places_without_overlap(self):
+        sizes = [(30, 20), (64, 64), (10, 50), (200, 10), (40, 40)] * 4
+        packing = pack(sizes, 128, padding=1)
+        self.assertEqual(packing.oversize, [3, 8, 13, 18])
+        rects = [(sheet, x, y, *sizes[i]) for i, (sheet, x, y) in packing.positions.items()]
+        self.assertEqual(len(rects), 16)
+        for n, (sheet, x, y, w, h) in enumerate(rects):
+            sheet_w, sheet_h = packing.sheets[sheet]
+            self.assertTrue(x >= 1 and y >= 1 and x + w <= sheet_w and y + h <= sheet_h)
+            for other, ox, oy, ow, oh in rects[n + 1:]:
+                if other == sheet:
+                    self.assertTrue(x + w + 2 <= ox or ox + ow + 2 <= x or y + h + 2 <= oy or oy + oh + 2 <= y)
+        self.assertGreater(packing.efficiency, 0.5)
+
+    def test_build_is_incremental(self):
+        with stub_s3():
+            s3.upload_file('elements/0.png', png((16, 16), (255, 0, 0, 255)), 'image/png')
+            s3.upload_file('elements/1.png', png((32, 32), (0, 0, 255, 255)), 'image/png')
+            s3.upload_file('elements/2.png', png((8, 8), (0, 255, 0, 255)), 'image/png')
+
+            first = self.build(GLOBAL)
+            self.assertEqual((first.built, first.frames, first.sheets, first.downloaded), (True, 2, 1, 2))
+            manifest = self.manifest(GLOBAL)
+            self.assertEqual(manifest['frames']['el0']['w'], 32)  # resized to the element's size
+            self.assertEqual(self.pixel(manifest, 'el0'), (255, 0, 0, 255))
+            self.assertEqual(s3.head_file('atlases/global.json')['CacheControl'], 'no-cache')
+
+            with mock.patch('uploads.atlas.download_file') as download:
+                self.assertFalse(self.build(GLOBAL).built)
+            download.assert_not_called()
+
+            old_sheet = manifest['sheets'][0]['key']
+            Element.objects.filter(pk='el1').update(image_key='elements/2.png')
+            second = self.build(GLOBAL)
+            self.assertEqual((second.reused, second.downloaded), (1, 1))
+            manifest = self.manifest(GLOBAL)
+            self.assertEqual(self.pixel(manifest, 'el0'), (255, 0, 0, 255))
+            self.assertEqual(self.pixel(manifest, 'el1'), (0, 255, 0, 255))
+            self.assertTrue(PendingS3Deletion.objects.filter(key=old_sheet).exists())
+
+            Element.objects.filter(pk='el0').update(width=500)
+            Element.objects.filter(pk='el1').update(image_key='elements/missing.png')
+            with self.assertLogs('uploads.atlas', 'WARNING'), self.assertLogs('core.s3', 'WARNING'):
+                third = self.build(GLOBAL)
+            self.assertEqual((third.frames, third.sheets, third.unpacked), (0, 0, 2))
+            self.assertEqual(self.manifest(GLOBAL)['unpacked'], {'el0': 'elements/0.png', 'el1': 'elements/missing.png'})
+
+    def test_command_builds_map_atlases_queued_by_admin_actions(self):
+        with stub_s3():
+            s3.upload_file('elements/0.png', png((32, 32), (255, 0, 0, 255)), 'image/png')
+            out = io.StringIO()
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('build_atlases', '--map', 'map', stdout=out)
+            self.assertIn('map:map: 1 frames on 1 sheet(s)', out.getvalue())
+            self.assertEqual(list(self.manifest('map:map')['frames']), ['el0'])
+            with self.assertRaises(CommandError):
+                call_command('build_atlases', '--map', 'nope', stdout=out)
+
+            with mock.patch('uploads.atlas.download_file') as download:
+                response = self.client.post(
+                    '/core/map/', {'action': 'build_sprite_atlases', '_selected_action': ['map', 'other']},
+                    follow=True,
+                )
+            download.assert_not_called()
+            self.assertEqual(
+                [str(m) for m in response.context['messages']],
+                ['Queued 2 atlas build(s) for the build_atlases worker: map:map, map:other.'],
+            )
+            self.assertFalse(SpriteAtlas.objects.get(scope='map:other').fingerprint)
+
+            self.client.post('/uploads/spriteatlas/', {
+                'action': 'rebuild', '_selected_action': [SpriteAtlas.objects.get(scope='map:map').pk],
+            })
+            self.assertTrue(SpriteAtlas.objects.get(scope='map:map').rebuild_requested)
+
+            out = io.StringIO()
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('build_atlases', stdout=out)
+            self.assertIn('map:map: 1 frames on 1 sheet(s)', out.getvalue())
+            self.assertIn('map:other: 0 frames on 0 sheet(s)', out.getvalue())
+            self.assertFalse(SpriteAtlas.objects.filter(rebuild_requested=True).exists())
+
+    def test_manifest_is_published_after_the_sheets_are_acquired(self):
+        with stub_s3():
+            s3.upload_file('elements/0.png', png((16, 16), (255, 0, 0, 255)), 'image/png')
+            with self.captureOnCommitCallbacks() as callbacks:
+                build(GLOBAL)
+                self.assertFalse(s3.object_exists('atlases/global.json'))
+            sheet = SpriteAtlas.objects.get(scope=GLOBAL).manifest['sheets'][0]['key']
+            self.assertEqual(StoredObject.objects.get(key=sheet).refcount, 1)
+            for callback in callbacks:
+                callback()
+            self.assertEqual(self.manifest(GLOBAL)['sheets'][0]['key'], sheet)
+
+            # Rebuilding the same sheets takes the new reference before dropping the old one.
+            self.build(GLOBAL, force=True)
+            self.assertEqual(StoredObject.objects.get(key=sheet).refcount, 1)
+            self.assertFalse(PendingS3Deletion.objects.filter(key=sheet).exists())
+
+            # Another build finished while this one was packing: the locked row wins.
+            Element.objects.filter(pk='el0').update(width=16, height=16)
+            digest = fingerprint([list(row) for row in scope_elements(GLOBAL).values_list(
+                'pk', 'image_key', 'width', 'height')])
+
+            def finish_other_build(*args, **kwargs):
+                SpriteAtlas.objects.filter(scope=GLOBAL).update(fingerprint=digest)
+                return pack(*args, **kwargs)
+
+            with mock.patch('uploads.atlas.pack', finish_other_build):
+                self.assertFalse(self.build(GLOBAL).built)
+            self.assertEqual(StoredObject.objects.get(key=sheet).refcount, 1)
+
+            with mock.patch('uploads.atlas.upload_stream', side_effect=OSError('S3 is down')):
+                with self.assertRaises(OSError):
+                    publish(GLOBAL)
+            self.assertEqual(SpriteAtlas.objects.get(scope=GLOBAL).fingerprint, '')
+
+
+class RenditionTests(PrismaTablesTestCase):
+
+    def upload_element(self, size, instance=None, **data):
+        from PIL import Image
+
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera Maker'
+        body = io.BytesIO()
+        Image.new('RGBA', size, (255, 0, 0, 128)).save(body, format='PNG', exif=exif)
+        form = get_element_form(Element)(
+            {'name': 'Sprite', 'width': 32, 'height': 32, 'static': True, **data},
+            {'image_upload': SimpleUploadedFile('sprite.png', body.getvalue(), content_type='image/png')},
+            instance=instance,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            return form.save()
+
+    def test_target_sizes_never_upscale(self):
+        self.assertEqual(target_sizes((4000, 4000), (32, 32)), [(1, (32, 32)), (2, (64, 64))])
+        self.assertEqual(target_sizes((40, 40), (32, 32)), [(1, (32, 32))])
+        self.assertEqual(target_sizes((20, 10), (32, 32)), [(1, (20, 10))])
+        self.assertEqual(target_sizes((20, 10), None), [(1, (20, 10))])
+
+    def test_small_upload_is_rendered_on_commit(self):
+        from PIL import Image
+
+        with stub_s3():
+            element = self.upload_element((300, 300))
+            renditions = ImageRendition.objects.filter(source_key=element.image_key)
+            self.assertEqual(
+                sorted(renditions.values_list('scale', 'width', 'format')),
+                [(1, 32, 'avif'), (1, 32, 'png'), (1, 32, 'webp'), (2, 64, 'avif'), (2, 64, 'png'), (2, 64, 'webp')],
+            )
+            self.assertFalse(PendingRendition.objects.exists())
+
+            key = f'{element.image_key}.64x64.webp'
+            self.assertEqual(s3.head_file(key)['CacheControl'], 'public, max-age=31536000, immutable')
+            body = io.BytesIO()
+            s3.download_file(key, body)
+            with Image.open(body) as img:
+                self.assertEqual((img.size, img.mode), ((64, 64), 'RGBA'))
+                self.assertFalse(img.getexif())
+
+            # A new image: the old one's renditions go with it.
+            old_keys = set(renditions.values_list('key', flat=True))
+            self.upload_element((20, 20), instance=element)
+            self.assertTrue(old_keys <= set(PendingS3Deletion.objects.values_list('key', flat=True)))
+            PendingS3Deletion.objects.update(next_attempt_at=timezone.now())
+            drain_once()
+            self.assertFalse(ImageRendition.objects.filter(key__in=old_keys).exists())
+            self.assertEqual(
+                set(ImageRendition.objects.filter(source_key=element.image_key).values_list('width', 'height')),
+                {(20, 20)},
+            )
+
+    @override_settings(RENDITION_INLINE_MAX_PIXELS=100)
+    def test_large_upload_and_backfill_go_to_the_worker(self):
+        with stub_s3():
+            element = self.upload_element((64, 64))
+            self.assertFalse(ImageRendition.objects.exists())
+            self.assertEqual(PendingRendition.objects.get().source_key, element.image_key)
+            out = io.StringIO()
+            call_command('render_renditions', stdout=out)
+            self.assertIn('1 rendered', out.getvalue())
+            self.assertEqual(ImageRendition.objects.count(), 6)
+
+            Element.objects.filter(pk=element.pk).update(width=16, height=16)
+            call_command('render_renditions', '--backfill', stdout=out)
+            self.assertEqual(ImageRendition.objects.filter(declared_width=16).count(), 6)
+
+    def test_jobs_are_claimed_before_rendering(self):
+        PendingRendition.objects.create(source_key='elements/a.png', width=32, height=32)
+
+        def render(job):
+            # Claimed: a second worker finds nothing due while this one renders.
+            self.assertGreater(PendingRendition.objects.get().next_attempt_at, timezone.now())
+            self.assertEqual(process_once(), (0, 0))
+            raise OSError('S3 is down')
+
+        with mock.patch('uploads.transcoding._render', render):
+            with mock.patch('uploads.transcoding._missing', return_value=False):
+                self.assertEqual(process_once(), (0, 1))
+        job = PendingRendition.objects.get()
+        self.assertEqual((job.attempts, job.last_error), (1, 'S3 is down'))
+
+        # A worker that died mid-render leaves the job to others once its claim runs out.
+        PendingRendition.objects.update(next_attempt_at=timezone.now())
+        with mock.patch('uploads.transcoding._render', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                process_once()
+        self.assertEqual(process_once(), (0, 0))
+        with mock.patch('uploads.transcoding._render'), mock.patch(
+            'uploads.transcoding.timezone.now', return_value=timezone.now() + CLAIM_TIMEOUT + timedelta(seconds=1),
+        ):
+            self.assertEqual(process_once(), (1, 0))
+        self.assertFalse(PendingRendition.objects.exists())
+
+
+def import_script(name):
+    """Import a module from scripts/, which imports its siblings by bare name."""
+    with mock.patch.object(sys, 'path', [str(settings.BASE_DIR / 'scripts'), *sys.path]):
+        return importlib.import_module(name)
+
+
+class FixModelsTests(SimpleTestCase):
+
+    def test_every_uploads_table_is_filtered_from_inspectdb(self):
+        fix_models = import_script('fix_models')
+        tables = {model._meta.db_table for model in apps.get_app_config('uploads').get_models()}
+        self.assertLessEqual(tables, fix_models.MANAGED_TABLES)
+        inspected = ''.join(
+            f"class M{i}(models.Model):\n    class Meta:\n        db_table = '{table}'\n"
+            for i, table in enumerate([*sorted(tables), 'Avatar'])
+        )
+        self.assertEqual(fix_models.filter_managed_tables(inspected).count('(models.Model)'), 1)
+
+
+class BootTests(SimpleTestCase):
+
+    def test_migrations_run_only_when_the_fingerprint_changes(self):
+        boot = import_script('boot')
+        with tempfile.TemporaryDirectory() as tmp:
+            fingerprint_file = Path(tmp) / '.schema-fingerprint'
+            with (
+                mock.patch.object(boot, 'FINGERPRINT_FILE', fingerprint_file),
+                mock.patch.object(boot, 'generate_models') as generate,
+                mock.patch.object(boot, 'schema_fingerprint', return_value='abc') as fingerprint,
+                mock.patch.object(boot, 'manage') as manage,
+                mock.patch('sys.stdout', new_callable=io.StringIO) as stdout,
+            ):
+                with mock.patch.object(sys, 'argv', ['boot.py']):
+                    boot.main()
+                    self.assertEqual(manage.call_count, 2)
+                    self.assertEqual(fingerprint_file.read_text(), 'abc\n')
+
+                    manage.reset_mock()
+                    boot.main()
+                    manage.assert_not_called()
+                    self.assertIn('Schema unchanged; skipping migrations.', stdout.getvalue())
+
+                    fingerprint.return_value = 'def'
+                    boot.main()
+                    self.assertEqual(manage.call_count, 2)
+                    self.assertEqual(fingerprint_file.read_text(), 'def\n')
+
+                manage.reset_mock()
+                with mock.patch.object(sys, 'argv', ['boot.py', '--force']):
+                    boot.main()
+                manage.assert_any_call('migrate')
+            self.assertEqual(generate.call_count, 4)
+
+
+class PrismaModelsTests(SimpleTestCase):
+    SCHEMA = '''
+        enum Role {
+            USER
+            ADMIN // comment
+        }
+
+        model Team {
+            id    String @id @default(cuid())
+            name  String @unique
+            users User[]
+        }
+
+        model User {
+            id        String  @id @default(cuid())
+            role      Role    @default(USER)
+            score     Int     @default(0) @map("points")
+            team_id   String?
+            team      Team?   @relation(fields: [team_id], references: [id])
+
+            @@map("app_user")
+            @@index([role, score])
+            @@unique([team_id, role])
+        }
+    '''
+
+    def setUp(self):
+        self.prisma_models = import_script('prisma_models')
+
+    def generate(self, schema):
+        with tempfile.NamedTemporaryFile('w', suffix='.prisma') as f:
+            f.write(schema)
+            f.flush()
+            return self.prisma_models.generate(f.name)
+
+    def test_renders_enums_defaults_relations_and_indexes(self):
+        text = self.generate(self.SCHEMA)
+        for line in [
+            "class Role(models.TextChoices):\n    USER = 'USER'\n    ADMIN = 'ADMIN'",
+            "class AppUser(models.Model):\n    id = models.TextField(primary_key=True)",
+            '    role = models.TextField(choices=Role.choices, default=Role.USER)',
+            "    score = models.IntegerField(db_column='points', default=0)",
+            "    team = models.ForeignKey(Team, models.DO_NOTHING, blank=True, null=True, related_name='+')",
+            "        db_table = 'app_user'",
+            "        unique_together = (('team', 'role'),)",
+            "            models.Index(fields=['role', 'score'], name='app_user_role_score_idx'),",
+            '    name = models.TextField(unique=True)',
+        ]:
+            self.assertIn(line, text)
+        compile(text, 'models.py', 'exec')
+
+        with self.assertRaisesMessage(ValueError, 'longer than'):
+            self.generate(self.SCHEMA.replace('@@index([role, score])', '@@index([team_id, role, score])'))
+
+    def test_committed_models_match_the_schema(self):
+        self.assertEqual(self.prisma_models.generate(), self.prisma_models.MODELS_FILE.read_text())
+
+    def test_check_fails_when_models_are_stale(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            models_file = Path(tmp) / 'models.py'
+            with mock.patch.object(self.prisma_models, 'MODELS_FILE', models_file):
+                with mock.patch.object(sys, 'argv', ['prisma_models.py', '--check']):
+                    with self.assertRaisesMessage(SystemExit, 'out of date'):
+                        self.prisma_models.main()
+                with mock.patch.object(sys, 'argv', ['prisma_models.py']):
+                    self.prisma_models.main()
+                with mock.patch.object(sys, 'argv', ['prisma_models.py', '--check']):
+                    self.prisma_models.main()
+            self.assertEqual(models_file.read_text(), self.prisma_models.generate())
@@ -0,0 +1,86 @@
+"""
+Fixed-size thumbnail renditions for admin previews.
+
+Renditions live in S3 next to the original under a derived key
+(``avatars/abc.png`` -> ``avatars/abc.png.thumb60.webp``) and are created
+lazily the first time a preview asks for them. Which renditions exist is
+remembered in the Django cache so warm pages link straight to S3.
+"""
+
+import io
+import tempfile
+
+from django.core.cache import cache
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from core.s3 import download_file, object_exists, public_url, upload_file
+
+THUMBNAIL_SIZES = (60, 200, 600)
+
+# Originals larger than this are spooled to disk while being thumbnailed.
+_SPOOL_LIMIT = 8 * 1024 * 1024
+
+
+def thumbnail_key(key, size):
+    return f'{key}.thumb{size}.webp'
+
+
+def thumbnail_keys(key):
+    return [thumbnail_key(key, size) for size in THUMBNAIL_SIZES]
+
+
+def thumbnail_source(key):
+    """The original a thumbnail key was made from (key itself if it isn't one)."""
+    for size in THUMBNAIL_SIZES:
+        suffix = thumbnail_key('', size)
+        if key.endswith(suffix):
+            return key[:-len(suffix)]
+    return key
+
+
+def _cache_key(key, size):
+    return f'thumb:{size}:{key}'
+
+
+def _render(key, size):
+    with tempfile.SpooledTemporaryFile(max_size=_SPOOL_LIMIT) as original:
+        download_file(key, original)
+        original.seek(0)
+        with Image.open(original) as img:
+            # Let JPEG decode at a reduced scale instead of full resolution.
+            img.draft('RGB', (size, size))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((size, size))
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA')
+            out = io.BytesIO()
+            img.save(out, format='WEBP', quality=80)
+    return out.getvalue()
+
+
+def ensure_thumbnail(key, size):
+    """Make sure the rendition exists in S3, creating it if needed. Returns its key."""
+    thumb_key = thumbnail_key(key, size)
+    if cache.get(_cache_key(key, size)):
+        return thumb_key
+    if not object_exists(thumb_key):
+        upload_file(thumb_key, _render(key, size), 'image/webp')
+    cache.set(_cache_key(key, size), True, timeout=None)
+    return thumb_key
+
+
+def thumbnail_url(key, size):
+    """URL for a preview <img>.
+
+    Points straight at S3 once the rendition is known to exist, otherwise at
+    the thumbnail view, which creates it and redirects.
+    """
+    if cache.get(_cache_key(key, size)):
+        return public_url(thumbnail_key(key, size))
+    return reverse('thumbnail', kwargs={'size': size, 'key': key})
+
+
+def forget_thumbnails(key):
+    """Drop cached state for a source key whose renditions are being deleted."""
+    cache.delete_many([_cache_key(key, size) for size in THUMBNAIL_SIZES])
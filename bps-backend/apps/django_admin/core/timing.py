@@ -0,0 +1,162 @@
+"""
+Where a request's time goes: database, S3 and template rendering.
+
+RequestTimingMiddleware opens a RequestTimings for every request. While the
+request runs:
+
+- a database execute wrapper counts and times every query;
+- each core.s3 operation is added by RequestTimingSink, one of the
+  core.instrumentation sinks (a multipart upload counts once, with its
+  parts and retries in its time);
+- TemplateResponse rendering is timed from process_template_response to a
+  post-render callback. That span includes any query the template runs
+  lazily, so db and render can overlap.
+
+The totals go back in a Server-Timing header (visible in the browser's
+network panel; sent to staff users, or everyone with DEBUG) and into the
+histograms below, labelled by admin view and
+model, which the /metrics view exposes for Prometheus.
+"""
+
+import contextvars
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connections
+
+from core.metrics import COUNT_BUCKETS, REGISTRY
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'admin_request_duration_seconds', 'Time to produce a response.', ['view', 'model', 'method'],
+)
+DB_SECONDS = REGISTRY.histogram(
+    'admin_request_db_seconds', 'Time spent in database queries per request.', ['view', 'model'],
+)
+DB_QUERIES = REGISTRY.histogram(
+    'admin_request_db_queries', 'Database queries per request.', ['view', 'model'], buckets=COUNT_BUCKETS,
+)
+S3_SECONDS = REGISTRY.histogram(
+    'admin_request_s3_seconds', 'Time spent in S3 calls per request.', ['view', 'model'],
+)
+RENDER_SECONDS = REGISTRY.histogram(
+    'admin_request_render_seconds', 'Template rendering time per request.', ['view', 'model'],
+)
+RESPONSES = REGISTRY.counter('admin_responses', 'Responses by status code.', ['view', 'model', 'status'])
+
+
+@dataclass
+class RequestTimings:
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    s3_calls: int = 0
+    s3_seconds: float = 0.0
+    render_seconds: float = 0.0
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"',
+            f's3;dur={self.s3_seconds * 1000:.1f};desc="{self.s3_calls} calls"',
+            f'render;dur={self.render_seconds * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def current():
+    """The RequestTimings of the request being handled, or None."""
+    return _current.get()
+
+
+@contextmanager
+def collect():
+    """Collect the timings of everything run inside the block into a new RequestTimings."""
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(_time_query))
+            yield timings
+    finally:
+        _current.reset(token)
+
+
+def record_s3(seconds):
+    timings = _current.get()
+    if timings is not None:
+        timings.s3_calls += 1
+        timings.s3_seconds += seconds
+
+
+class RequestTimingSink:
+    """core.instrumentation sink adding each S3 operation to the current request's timings."""
+
+    def __call__(self, op):
+        record_s3(op.seconds)
+
+
+def _time_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_queries += 1
+        timings.db_seconds += time.perf_counter() - start
+
+
+def view_labels(request):
+    """(view, model) labels: ('changelist', 'core.User') for admin pages, (url name, '') otherwise."""
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved', ''
+    model_admin = getattr(match.func, 'model_admin', None)
+    name = match.url_name or match.view_name or 'unnamed'
+    if model_admin is None:
+        return name, ''
+    opts = model_admin.model._meta
+    return name.removeprefix(f'{opts.app_label}_{opts.model_name}_'), opts.label
+
+
+def _is_staff(request):
+    user = getattr(request, 'user', None)  # unset if the request failed before AuthenticationMiddleware
+    return user is not None and user.is_active and user.is_staff
+
+
+class RequestTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with collect() as timings:
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        if settings.DEBUG or _is_staff(request):
+            response['Server-Timing'] = timings.server_timing(total)
+        view, model = view_labels(request)
+        REQUEST_SECONDS.observe(total, view=view, model=model, method=request.method)
+        DB_SECONDS.observe(timings.db_seconds, view=view, model=model)
+        DB_QUERIES.observe(timings.db_queries, view=view, model=model)
+        S3_SECONDS.observe(timings.s3_seconds, view=view, model=model)
+        RENDER_SECONDS.observe(timings.render_seconds, view=view, model=model)
+        RESPONSES.inc(view=view, model=model, status=response.status_code)
+        return response
+
+    def process_template_response(self, request, response):
+        timings = _current.get()
+        if timings is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                timings.render_seconds += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
@@ -1,3 +1,151 @@
-from django.shortcuts import render
+import logging
 
-# Create your views here.
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_POST
+
+from core.autocomplete import CachedAutocompleteJsonView
+from core.direct_upload import presign
+from core.instrumentation import BYTES, ERRORS, OPERATION_SECONDS
+from core.metrics import CONTENT_TYPE, REGISTRY
+from core.models import Map, Space
+from core.s3 import public_url
+from core.spatial import footprint, nearest, viewport
+from core.thumbnails import THUMBNAIL_SIZES, ensure_thumbnail
+
+logger = logging.getLogger(__name__)
+
+
+@staff_member_required
+def thumbnail(request, size, key):
+    """Redirect to a thumbnail rendition of ``key``, creating it on first use."""
+    if size not in THUMBNAIL_SIZES:
+        raise Http404('Unsupported thumbnail size.')
+    try:
+        response = redirect(public_url(ensure_thumbnail(key, size)))
+    except Exception:
+        # Not an image Pillow can read, or the original is gone: fall back to it.
+        logger.warning('Could not create %spx thumbnail for %s', size, key, exc_info=True)
+        return redirect(public_url(key))
+    # Source keys are never overwritten, so the rendition behind this URL is stable.
+    patch_cache_control(response, private=True, max_age=24 * 60 * 60)
+    return response
+
+
+@staff_member_required
+@require_POST
+def presign_upload(request):
+    """Return the content key and, unless already stored, a presigned POST policy for one image."""
+    try:
+        size = int(request.POST.get('size', '0'))
+        data = presign(
+            request.POST.get('prefix', ''),
+            request.POST.get('content_type', ''),
+            size,
+            request.POST.get('sha256', ''),
+        )
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(data)
+
+
+PLACEMENT_OWNERS = {'map': Map, 'space': Space}
+MAX_NEAREST = 1000
+
+
+def _placement_json(placement):
+    return {
+        'id': placement.id,
+        'element_id': placement.element_id,
+        'x': placement.x,
+        'y': placement.y,
+        'scale': placement.scale,
+        'rotation': placement.rotation,
+        'bounds': footprint(placement),
+    }
+
+
+def _placement_owner(owner, pk):
+    if owner not in PLACEMENT_OWNERS:
+        raise Http404('Placements belong to a map or a space.')
+    return get_object_or_404(PLACEMENT_OWNERS[owner], pk=pk)
+
+
+def _float_params(request, *names):
+    try:
+        return [float(request.GET[name]) for name in names]
+    except (KeyError, ValueError):
+        raise ValueError(f'{", ".join(names)} must all be numbers.')
+
+
+@staff_member_required
+def placements_viewport(request, owner, pk):
+    """Placements of a map/space intersecting ?x0=&y0=&x1=&y1=."""
+    obj = _placement_owner(owner, pk)
+    try:
+        x0, y0, x1, y1 = _float_params(request, 'x0', 'y0', 'x1', 'y1')
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({'placements': [_placement_json(p) for p in viewport(obj, x0, y0, x1, y1)]})
+
+
+@staff_member_required
+def placements_nearest(request, owner, pk):
+    """The ?k= placements of a map/space nearest to ?x=&y=."""
+    obj = _placement_owner(owner, pk)
+    try:
+        x, y = _float_params(request, 'x', 'y')
+        k = min(max(int(request.GET.get('k', 10)), 1), MAX_NEAREST)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({
+        'placements': [
+            {**_placement_json(p), 'distance': p.distance} for p in nearest(obj, x, y, k)
+        ],
+    })
+
+
+def metrics(request):
+    """Prometheus scrape endpoint for the in-process registry (core.metrics).
+
+    The scraper must send `Authorization: Bearer <METRICS_TOKEN>`. Logged-in
+    staff can read it without one; anyone else gets a 403, also when no
+    token is configured.
+    """
+    token = settings.METRICS_TOKEN
+    authorized = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not (authorized or request.user.is_active and request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.expose(), content_type=CONTENT_TYPE)
+
+
+@staff_member_required
+def s3_metrics(request):
+    """S3 latency, traffic and errors by operation and key prefix, since this process started."""
+    rows = []
+    for labels, count, total, p50, p95 in OPERATION_SECONDS.summaries():
+        rows.append({
+            **labels,
+            'count': count,
+            'mean_ms': total / count * 1000 if count else 0,
+            'p50_ms': p50 * 1000,
+            'p95_ms': p95 * 1000,
+            'bytes': BYTES.value(**labels),
+            'errors': ERRORS.value(**labels),
+        })
+    return render(request, 'admin/s3_metrics.html', {
+        **admin.site.each_context(request),
+        'title': 'S3 operations',
+        'rows': rows,
+    })
+
+
+@staff_member_required
+def autocomplete(request):
+    """JSON search behind the admin's foreign key autocomplete widgets (core.autocomplete)."""
+    return CachedAutocompleteJsonView.as_view(admin_site=admin.site)(request)
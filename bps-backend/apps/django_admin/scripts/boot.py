@@ -0,0 +1,133 @@
+"""
+Startup step for the admin: regenerate core/models.py and run Django
+migrations only when something has actually changed.
+
+core/models.py is generated from schema.prisma (scripts/prisma_models.py),
+which needs no database and only rewrites the file when its content changes.
+
+A fingerprint of the schema is built from the `_prisma_migrations` checksums,
+`information_schema` (columns and constraints), `pg_indexes`, the applied
+Django migrations, the committed migration files and the sources that feed
+makemigrations. It is stored next to the generated models module. When the
+fingerprint still matches, boot skips makemigrations and migrate entirely.
+
+Usage: python scripts/boot.py [--force]
+"""
+
+import hashlib
+import os
+import subprocess
+import sys
+import warnings
+from pathlib import Path
+
+from fix_models import MODELS_FILE, write_atomic
+from prisma_models import generate
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+FINGERPRINT_FILE = BASE_DIR / 'core' / '.schema-fingerprint'
+
+# Files whose content changes what makemigrations/migrate would do.
+MIGRATION_INPUTS = [
+    BASE_DIR / 'core' / 'models.py',
+    BASE_DIR / 'uploads' / 'models.py',
+    BASE_DIR / 'search' / 'indexes.py',
+]
+
+# Committed migrations: a new one must run even if nothing else changed.
+MIGRATION_DIRS = [
+    BASE_DIR / 'search' / 'migrations',
+    BASE_DIR / 'uploads' / 'migrations',
+]
+
+SCHEMA_QUERIES = [
+    # Prisma records one row per applied migration; ids change on reset.
+    '''
+    SELECT id, checksum, finished_at::text, rolled_back_at::text
+    FROM _prisma_migrations ORDER BY id
+    ''',
+    '''
+    SELECT table_name, column_name, data_type, udt_name, is_nullable, column_default
+    FROM information_schema.columns
+    WHERE table_schema = current_schema()
+    ORDER BY table_name, column_name
+    ''',
+    '''
+    SELECT tc.table_name, tc.constraint_name, tc.constraint_type, kcu.column_name
+    FROM information_schema.table_constraints tc
+    LEFT JOIN information_schema.key_column_usage kcu
+      ON kcu.constraint_name = tc.constraint_name AND kcu.table_schema = tc.table_schema
+    WHERE tc.table_schema = current_schema()
+    ORDER BY tc.table_name, tc.constraint_name, kcu.column_name
+    ''',
+    # Catches indexes Prisma dropped behind Django's back (search/indexes.py).
+    '''
+    SELECT tablename, indexname, indexdef FROM pg_indexes
+    WHERE schemaname = current_schema()
+    ORDER BY tablename, indexname
+    ''',
+    'SELECT app, name FROM django_migrations ORDER BY app, name',
+]
+
+
+def manage(*args):
+    subprocess.run([sys.executable, 'manage.py', *args], cwd=BASE_DIR, check=True)
+
+
+def schema_fingerprint():
+    # Only the database connection is needed, not the app registry, so this
+    # avoids a full django.setup() (and importing the generated models).
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    from django.db import connection, transaction
+
+    digest = hashlib.sha256()
+    with warnings.catch_warnings(), connection.cursor() as cursor:
+        # Django warns about queries before the app registry is ready; that is
+        # exactly what we want here.
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for query in SCHEMA_QUERIES:
+            try:
+                # A savepoint keeps the connection usable if the table is missing.
+                with transaction.atomic():
+                    cursor.execute(query)
+                    rows = cursor.fetchall()
+            except Exception:
+                rows = [('missing',)]
+            digest.update(repr(rows).encode())
+    connection.close()
+
+    for path in MIGRATION_INPUTS:
+        digest.update(path.read_bytes() if path.exists() else b'')
+    for directory in MIGRATION_DIRS:
+        for path in sorted(directory.glob('*.py')):
+            digest.update(path.name.encode() + path.read_bytes())
+    return digest.hexdigest()
+
+
+def generate_models():
+    """Regenerate models.py from schema.prisma, atomically and only if it changed."""
+    text = generate()
+    if not MODELS_FILE.exists() or MODELS_FILE.read_text() != text:
+        write_atomic(MODELS_FILE, text)
+
+
+def main():
+    force = '--force' in sys.argv[1:]
+    generate_models()
+
+    fingerprint = schema_fingerprint()
+    stored = FINGERPRINT_FILE.read_text().strip() if FINGERPRINT_FILE.exists() else None
+    if not force and fingerprint == stored:
+        print('Schema unchanged; skipping migrations.')
+        return
+
+    print('Schema changed; applying migrations...')
+    manage('makemigrations', 'core', 'uploads')
+    manage('migrate')
+
+    write_atomic(FINGERPRINT_FILE, schema_fingerprint() + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,13 +8,22 @@ Post-processing script for inspectdb output.
    unmanaged duplicate.
 """
 
+import os
 import re
+import tempfile
 from pathlib import Path
 
 MODELS_FILE = Path(__file__).resolve().parent.parent / "core" / "models.py"
 
 # Tables owned by Django-managed models (uploads app, etc.)
-MANAGED_TABLES = {'admin_uploaded_image'}
+MANAGED_TABLES = {
+    'admin_uploaded_image',
+    'admin_s3_deletion',
+    'admin_stored_object',
+    'admin_sprite_atlas',
+    'admin_image_rendition',
+    'admin_pending_rendition',
+}
 
 
 def fix_related_names(content: str) -> str:
@@ -42,11 +51,26 @@ def filter_managed_tables(content: str) -> str:
     return ''.join(kept)
 
 
+def write_atomic(path: Path, text: str):
+    """Replace path with text in one step so readers never see a partial file."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, path.stat().st_mode & 0o777 if path.exists() else 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
 def main():
     text = MODELS_FILE.read_text()
     text = filter_managed_tables(text)
     text = fix_related_names(text)
-    MODELS_FILE.write_text(text)
+    write_atomic(MODELS_FILE, text)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,421 @@
+"""
+Generate core/models.py straight from packages/db/prisma/schema.prisma.
+
+This replaces `manage.py inspectdb` + fix_models.py for the Prisma-owned
+tables, so producing the models needs no database connection. Compared with
+inspectdb the output also carries:
+
+1. choices for Prisma enums (e.g. User.role -> Role.choices),
+2. Python-side defaults for literal @default(...) values,
+3. Meta.indexes mirroring every @@index, and unique_together for @@unique.
+
+Class names follow inspectdb's convention (table 'MapElementPlacement' ->
+class Mapelementplacement) so existing imports keep working. Tables owned by
+Django itself (auth_*, django_*) and _prisma_migrations are appended from a
+fixed template, since they don't come from schema.prisma.
+
+Usage: python scripts/prisma_models.py [--check]
+"""
+
+import re
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from fix_models import MODELS_FILE, write_atomic
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SCHEMA_FILE = BASE_DIR.parent.parent / 'packages' / 'db' / 'prisma' / 'schema.prisma'
+
+SCALAR_FIELDS = {
+    'String': 'TextField',
+    'Int': 'IntegerField',
+    'BigInt': 'BigIntegerField',
+    'Float': 'FloatField',
+    'Decimal': 'DecimalField',
+    'Boolean': 'BooleanField',
+    'DateTime': 'DateTimeField',
+    'Json': 'JSONField',
+    'Bytes': 'BinaryField',
+}
+
+# Django rejects index names longer than this (models.E034).
+MAX_INDEX_NAME = 30
+
+HEADER = '''\
+# Generated from packages/db/prisma/schema.prisma by scripts/prisma_models.py.
+# Do not edit by hand: change the Prisma schema and regenerate instead.
+# Every model is unmanaged; Prisma owns these tables and their migrations.
+from django.db import models
+'''
+
+
+@dataclass
+class PrismaField:
+    name: str
+    type: str
+    optional: bool = False
+    is_list: bool = False
+    attrs: str = ''
+
+    def attr(self, name):
+        """Argument string of @name(...), '' for a bare @name, None if absent."""
+        match = re.search(rf'@{name}\b(\()?', self.attrs)
+        if not match:
+            return None
+        if not match.group(1):
+            return ''
+        return _balanced(self.attrs, match.end() - 1)
+
+
+@dataclass
+class PrismaModel:
+    name: str
+    fields: list = field(default_factory=list)
+    block_attrs: list = field(default_factory=list)
+
+    @property
+    def table(self):
+        for attr in self.block_attrs:
+            match = re.match(r'@@map\(\s*"([^"]+)"\s*\)', attr)
+            if match:
+                return match.group(1)
+        return self.name
+
+    def field(self, name):
+        return next(f for f in self.fields if f.name == name)
+
+
+def _balanced(text, start):
+    """Return the contents of the parenthesised group opening at text[start]."""
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == '(':
+            depth += 1
+        elif text[i] == ')':
+            depth -= 1
+            if depth == 0:
+                return text[start + 1:i]
+    raise ValueError(f'Unbalanced parentheses in {text!r}')
+
+
+def _strip_comment(line):
+    in_string = False
+    for i, ch in enumerate(line):
+        if ch == '"':
+            in_string = not in_string
+        elif not in_string and line.startswith('//', i):
+            return line[:i]
+    return line
+
+
+def parse_schema(text):
+    """Parse models and enums out of a Prisma schema."""
+    models, enums = {}, {}
+    for kind, name, body in re.findall(r'^\s*(model|enum)\s+(\w+)\s*\{(.*?)^\s*\}', text, re.M | re.S):
+        lines = [_strip_comment(line).strip() for line in body.splitlines()]
+        lines = [line for line in lines if line]
+        if kind == 'enum':
+            enums[name] = [line.split()[0] for line in lines if not line.startswith('@@')]
+            continue
+        model = PrismaModel(name)
+        for line in lines:
+            if line.startswith('@@'):
+                model.block_attrs.append(line)
+                continue
+            match = re.match(r'(\w+)\s+(\w+)(\[\])?(\?)?\s*(.*)', line)
+            if not match:
+                raise ValueError(f'Cannot parse field in model {name}: {line!r}')
+            fname, ftype, is_list, optional, attrs = match.groups()
+            model.fields.append(PrismaField(fname, ftype, bool(optional), bool(is_list), attrs))
+        models[name] = model
+    return models, enums
+
+
+def _list_arg(args, key):
+    match = re.search(rf'{key}\s*:\s*\[([^\]]*)\]', args)
+    return [p.strip() for p in match.group(1).split(',')] if match else []
+
+
+def _block_fields(attr):
+    """Field list of @@index([a, b]) / @@unique([a, b]) (sort/length args dropped)."""
+    inner = _balanced(attr, attr.index('('))
+    match = re.match(r'\s*(?:fields\s*:\s*)?\[([^\]]*)\]', inner)
+    return [re.sub(r'\(.*', '', p).strip() for p in match.group(1).split(',')]
+
+
+def class_name(table):
+    """inspectdb's table -> class name rule."""
+    return re.sub(r'[^a-zA-Z0-9]', '', table.title())
+
+
+def _literal_default(value, enums, ftype):
+    value = value.strip()
+    if ftype in enums:
+        return f'{ftype}.{value}'
+    if value in ('true', 'false'):
+        return value.capitalize()
+    if re.fullmatch(r'-?\d+(\.\d+)?', value) or re.fullmatch(r'"[^"]*"', value):
+        return value.replace('"', "'")
+    return None  # function defaults (cuid(), now(), ...) are left to the database
+
+
+def _index_name(table, columns):
+    name = f'{table}_{"_".join(columns)}_idx'
+    if len(name) > MAX_INDEX_NAME:
+        raise ValueError(
+            f'Index name {name!r} is longer than {MAX_INDEX_NAME} characters; '
+            'give the @@index an explicit map: "..." in schema.prisma.'
+        )
+    return name
+
+
+def render(models, enums):
+    out = [HEADER]
+
+    for enum, values in enums.items():
+        out.append(f'\nclass {enum}(models.TextChoices):')
+        out.extend(f"    {v} = '{v}'" for v in values)
+        out.append('')
+
+    ordered = sorted(models.values(), key=lambda m: m.table)
+    emitted = set()
+
+    for model in ordered:
+        # Scalar column -> (relation field, target model) for every FK.
+        relations = {}
+        for f in model.fields:
+            args = f.attr('relation')
+            if f.type in models and args and 'fields' in args:
+                for column, ref in zip(_list_arg(args, 'fields'), _list_arg(args, 'references')):
+                    relations[column] = (f, models[f.type], ref)
+
+        django_names = {}
+        lines = []
+        for f in model.fields:
+            if f.type in models or f.is_list:
+                continue  # relation / back-relation fields have no column of their own
+            column = f.attr('map')
+            column = column.strip().strip('"') if column else f.name
+            kwargs = []
+
+            if f.name in relations:
+                rel_field, target, ref = relations[f.name]
+                name = f.name[:-3] if f.name.endswith('_id') else rel_field.name
+                target_class = class_name(target.table)
+                target_ref = target_class if target.table in emitted else f"'{target_class}'"
+                kwargs.append(target_ref)
+                kwargs.append('models.DO_NOTHING')
+                target_pk = next((t.name for t in target.fields if t.attr('id') is not None), 'id')
+                if ref != target_pk:
+                    kwargs.append(f"to_field='{ref}'")
+                if column != f'{name}_id':
+                    kwargs.append(f"db_column='{column}'")
+                field_class = 'ForeignKey'
+            else:
+                name = f.name
+                if f.type in enums:
+                    field_class = 'TextField'
+                    kwargs.append(f'choices={f.type}.choices')
+                elif f.type in SCALAR_FIELDS:
+                    field_class = SCALAR_FIELDS[f.type]
+                else:
+                    raise ValueError(f'Unsupported Prisma type {f.type} on {model.name}.{f.name}')
+                if column != name:
+                    kwargs.append(f"db_column='{column}'")
+                if f.attr('id') is not None:
+                    kwargs.append('primary_key=True')
+                elif f.attr('unique') is not None:
+                    kwargs.append('unique=True')
+                default = f.attr('default')
+                if default:
+                    literal = _literal_default(default, enums, f.type)
+                    if literal is not None:
+                        kwargs.append(f'default={literal}')
+
+            if f.optional:
+                kwargs.append('blank=True, null=True')
+            if field_class == 'ForeignKey':
+                kwargs.append("related_name='+'")
+            django_names[f.name] = name
+            lines.append(f'    {name} = models.{field_class}({", ".join(kwargs)})')
+
+        meta = ['        managed = False', f"        db_table = '{model.table}'"]
+        uniques, indexes = [], []
+        for attr in model.block_attrs:
+            if attr.startswith('@@unique'):
+                uniques.append(tuple(django_names[c] for c in _block_fields(attr)))
+            elif attr.startswith('@@index'):
+                columns = _block_fields(attr)
+                mapped = re.search(r'map\s*:\s*"([^"]+)"', attr)
+                name = mapped.group(1) if mapped else _index_name(model.table, columns)
+                fields = ', '.join(f"'{django_names[c]}'" for c in columns)
+                indexes.append(f"            models.Index(fields=[{fields}], name='{name}'),")
+        if uniques:
+            meta.append(f'        unique_together = {tuple(uniques)!r}')
+        if indexes:
+            meta.append('        indexes = [')
+            meta.extend(indexes)
+            meta.append('        ]')
+
+        out.append(f'\nclass {class_name(model.table)}(models.Model):')
+        out.extend(lines)
+        out.append('')
+        out.append('    class Meta:')
+        out.extend(meta)
+        out.append('')
+        emitted.add(model.table)
+
+    out.append(DJANGO_TABLES)
+    return '\n'.join(out)
+
+
+def generate(schema_file=SCHEMA_FILE):
+    models, enums = parse_schema(Path(schema_file).read_text())
+    return render(models, enums)
+
+
+def main():
+    text = generate()
+    current = MODELS_FILE.read_text() if MODELS_FILE.exists() else None
+    if '--check' in sys.argv[1:]:
+        if current != text:
+            sys.exit('core/models.py is out of date with schema.prisma.')
+        return
+    if current != text:
+        write_atomic(MODELS_FILE, text)
+
+
+DJANGO_TABLES = '''
+class PrismaMigrations(models.Model):
+    id = models.CharField(primary_key=True, max_length=36)
+    checksum = models.CharField(max_length=64)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    migration_name = models.CharField(max_length=255)
+    logs = models.TextField(blank=True, null=True)
+    rolled_back_at = models.DateTimeField(blank=True, null=True)
+    started_at = models.DateTimeField()
+    applied_steps_count = models.IntegerField()
+
+    class Meta:
+        managed = False
+        db_table = '_prisma_migrations'
+
+
+class AuthGroup(models.Model):
+    name = models.CharField(unique=True, max_length=150)
+
+    class Meta:
+        managed = False
+        db_table = 'auth_group'
+
+
+class AuthGroupPermissions(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    group = models.ForeignKey(AuthGroup, models.DO_NOTHING, related_name='+')
+    permission = models.ForeignKey('AuthPermission', models.DO_NOTHING, related_name='+')
+
+    class Meta:
+        managed = False
+        db_table = 'auth_group_permissions'
+        unique_together = (('group', 'permission'),)
+
+
+class AuthPermission(models.Model):
+    name = models.CharField(max_length=255)
+    content_type = models.ForeignKey('DjangoContentType', models.DO_NOTHING, related_name='+')
+    codename = models.CharField(max_length=100)
+
+    class Meta:
+        managed = False
+        db_table = 'auth_permission'
+        unique_together = (('content_type', 'codename'),)
+
+
+class AuthUser(models.Model):
+    password = models.CharField(max_length=128)
+    last_login = models.DateTimeField(blank=True, null=True)
+    is_superuser = models.BooleanField()
+    username = models.CharField(unique=True, max_length=150)
+    first_name = models.CharField(max_length=150)
+    last_name = models.CharField(max_length=150)
+    email = models.CharField(max_length=254)
+    is_staff = models.BooleanField()
+    is_active = models.BooleanField()
+    date_joined = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'auth_user'
+
+
+class AuthUserGroups(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(AuthUser, models.DO_NOTHING, related_name='+')
+    group = models.ForeignKey(AuthGroup, models.DO_NOTHING, related_name='+')
+
+    class Meta:
+        managed = False
+        db_table = 'auth_user_groups'
+        unique_together = (('user', 'group'),)
+
+
+class AuthUserUserPermissions(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(AuthUser, models.DO_NOTHING, related_name='+')
+    permission = models.ForeignKey(AuthPermission, models.DO_NOTHING, related_name='+')
+
+    class Meta:
+        managed = False
+        db_table = 'auth_user_user_permissions'
+        unique_together = (('user', 'permission'),)
+
+
+class DjangoAdminLog(models.Model):
+    action_time = models.DateTimeField()
+    object_id = models.TextField(blank=True, null=True)
+    object_repr = models.CharField(max_length=200)
+    action_flag = models.SmallIntegerField()
+    change_message = models.TextField()
+    content_type = models.ForeignKey('DjangoContentType', models.DO_NOTHING, blank=True, null=True, related_name='+')
+    user = models.ForeignKey(AuthUser, models.DO_NOTHING, related_name='+')
+
+    class Meta:
+        managed = False
+        db_table = 'django_admin_log'
+
+
+class DjangoContentType(models.Model):
+    app_label = models.CharField(max_length=100)
+    model = models.CharField(max_length=100)
+
+    class Meta:
+        managed = False
+        db_table = 'django_content_type'
+        unique_together = (('app_label', 'model'),)
+
+
+class DjangoMigrations(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    app = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    applied = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'django_migrations'
+
+
+class DjangoSession(models.Model):
+    session_key = models.CharField(primary_key=True, max_length=40)
+    session_data = models.TextField()
+    expire_date = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'django_session'
+'''
+
+
+if __name__ == "__main__":
+    main()
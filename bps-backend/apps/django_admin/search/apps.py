@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class SearchConfig(AppConfig):
+    name = 'search'
+    verbose_name = 'Search'
+
+    def ready(self):
+        from search.indexes import ensure_indexes_after_migrate
+        post_migrate.connect(ensure_indexes_after_migrate, sender=self)
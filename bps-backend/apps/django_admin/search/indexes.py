@@ -0,0 +1,122 @@
+"""
+Indexes on the Prisma-owned tables that schema.prisma can't express.
+
+Prisma owns these tables and knows nothing about the indexes, so a reset or
+a table rebuild drops them without Django noticing. They are created by
+search's migrations and re-checked after every migrate (post_migrate), and
+ensure_indexes() is idempotent.
+
+- Trigram: a GIN pg_trgm index on UPPER(column). That expression is what
+  Django's own icontains compiles to, so both the default admin search and
+  the trigram search in search/backend.py can use it.
+- Spatial: a GiST index on (owner, point(x, y)) for the placement tables,
+  used by the viewport and nearest-neighbour queries in core/spatial.py.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = ['pg_trgm', 'btree_gist']
+
+# Prisma table -> columns searched in the admin.
+TRIGRAM_INDEXES = {
+    'Avatar': ['name'],
+    'Element': ['name'],
+    'Map': ['name'],
+    'Space': ['name'],
+    'User': ['name', 'handle', 'email'],
+}
+
+# Placement table -> owner column; btree_gist lets the text owner id share
+# the GiST index with the point.
+SPATIAL_INDEXES = {
+    'MapElementPlacement': 'map_id',
+    'SpaceElementPlacement': 'space_id',
+}
+
+
+def index_name(table, column):
+    return f'{table}_{column}_trgm_idx'
+
+
+def spatial_index_name(table):
+    return f'{table}_xy_gist_idx'
+
+
+def indexed_columns(model):
+    """Field names of model backed by a trigram index."""
+    columns = TRIGRAM_INDEXES.get(model._meta.db_table, [])
+    return [f.name for f in model._meta.concrete_fields if f.column in columns]
+
+
+def index_definitions(qn):
+    """(index name, table, USING clause) for every index managed here."""
+    for table, columns in TRIGRAM_INDEXES.items():
+        for column in columns:
+            yield index_name(table, column), table, f'gin (UPPER({qn(column)}) gin_trgm_ops)'
+    for table, owner in SPATIAL_INDEXES.items():
+        yield spatial_index_name(table), table, f'gist ({qn(owner)}, point({qn("x")}, {qn("y")}))'
+
+
+def ensure_indexes(connection):
+    """Create any missing (or invalid) index. Returns the names created.
+
+    Indexes are built CONCURRENTLY unless a transaction is open, so a large
+    table stays writable while its index builds. Tables that don't exist yet
+    (Prisma hasn't migrated) are skipped.
+    """
+    if connection.vendor != 'postgresql':
+        return []
+
+    qn = connection.ops.quote_name
+    concurrently = '' if connection.in_atomic_block else ' CONCURRENTLY'
+    created = []
+    with connection.cursor() as cursor:
+        for extension in EXTENSIONS:
+            cursor.execute(f'CREATE EXTENSION IF NOT EXISTS {extension}')
+        for name, table, using in index_definitions(qn):
+            cursor.execute('SELECT to_regclass(%s)', [qn(table)])
+            if cursor.fetchone()[0] is None:
+                continue
+            cursor.execute(
+                'SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(%s)',
+                [qn(name)],
+            )
+            row = cursor.fetchone()
+            if row and row[0]:
+                continue
+            if row:
+                # A failed CONCURRENTLY build leaves an invalid index behind.
+                cursor.execute(f'DROP INDEX{concurrently} {qn(name)}')
+            cursor.execute(f'CREATE INDEX{concurrently} IF NOT EXISTS {qn(name)} ON {qn(table)} USING {using}')
+            created.append(name)
+    return created
+
+
+def drop_indexes(connection, names=None):
+    """Drop the managed indexes (only those in names, if given)."""
+    if connection.vendor != 'postgresql':
+        return
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for name, _, _ in index_definitions(qn):
+            if names is None or name in names:
+                cursor.execute(f'DROP INDEX IF EXISTS {qn(name)}')
+
+
+# The names migration 0001 was written against, from before the spatial indexes.
+def ensure_trigram_indexes(connection):
+    return ensure_indexes(connection)
+
+
+def drop_trigram_indexes(connection):
+    drop_indexes(connection, {index_name(t, column) for t, columns in TRIGRAM_INDEXES.items() for column in columns})
+
+
+def ensure_indexes_after_migrate(sender, using='default', verbosity=1, **kwargs):
+    from django.db import connections
+
+    created = ensure_indexes(connections[using])
+    if created and verbosity:
+        logger.info('Created indexes: %s', ', '.join(created))
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from search.indexes import drop_trigram_indexes, ensure_trigram_indexes
+
+
+def create_indexes(apps, schema_editor):
+    ensure_trigram_indexes(schema_editor.connection)
+
+
+def drop_indexes(apps, schema_editor):
+    drop_trigram_indexes(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction.
+    atomic = False
+
+    dependencies = []
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
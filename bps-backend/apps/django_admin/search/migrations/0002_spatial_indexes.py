@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from search.indexes import SPATIAL_INDEXES, drop_indexes, ensure_indexes, spatial_index_name
+
+
+def create_indexes(apps, schema_editor):
+    ensure_indexes(schema_editor.connection)
+
+
+def drop_spatial_indexes(apps, schema_editor):
+    drop_indexes(schema_editor.connection, {spatial_index_name(table) for table in SPATIAL_INDEXES})
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('search', '0001_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_spatial_indexes),
+    ]
@@ -1,45 +1,113 @@
-import uuid
-import os
+import zipfile
 
 from django import forms
-from django.contrib import admin
-from django.conf import settings
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils.html import format_html
 
-from core.s3 import upload_file
-from uploads.models import UploadedImage
+from core.admin_mixins import LargeTablePaginationMixin, OptimizedChangelistMixin
+from core.direct_upload import DirectUploadFileInput, uploaded_file, uploaded_key_field, verify_uploaded_key
+from core.s3 import public_url
+from core.thumbnails import thumbnail_url
+from uploads.atlas import request_builds
+from uploads.dedup import acquire, release, store
+from uploads.ingest import (
+    ingest,
+    sources_from_uploaded_files,
+    sources_from_zip,
+)
+from uploads.models import PendingRendition, PendingS3Deletion, SpriteAtlas, UploadedImage
 
 
 class UploadImageForm(forms.ModelForm):
     """Form shown on the Add page -- only a file input."""
-    image_file = forms.FileField(label='Image file', required=True)
+    image_file = forms.FileField(label='Image file', required=False, widget=DirectUploadFileInput('uploads'))
+    # Filled by direct_upload.js when the browser uploaded straight to S3.
+    uploaded_key = uploaded_key_field()
+    uploaded_filename = forms.CharField(required=False, widget=forms.HiddenInput)
 
     class Meta:
         model = UploadedImage
         fields = []  # no model fields exposed
 
+    def clean_uploaded_key(self):
+        key = self.cleaned_data.get('uploaded_key')
+        if key:
+            self._direct_head = verify_uploaded_key(key, 'uploads')
+        return key
+
+    def clean(self):
+        cleaned = super().clean()
+        if not cleaned.get('image_file') and not cleaned.get('uploaded_key'):
+            raise forms.ValidationError('Select an image file to upload.')
+        return cleaned
+
     def save(self, commit=True):
-        uploaded = self.cleaned_data['image_file']
-        ext = os.path.splitext(uploaded.name)[1].lower() or '.bin'
-        key = f'uploads/{uuid.uuid4()}{ext}'
-
-        upload_file(
-            key=key,
-            file_body=uploaded.read(),
-            content_type=uploaded.content_type,
-        )
+        key = self.cleaned_data.get('uploaded_key')
+        if key:
+            filename = self.cleaned_data.get('uploaded_filename') or key.rsplit('/', 1)[-1]
+            content_type = self._direct_head.get('ContentType', 'application/octet-stream')
+            acquire(key, stored=[uploaded_file(key, self._direct_head)])
+        else:
+            uploaded = self.cleaned_data['image_file']
+            filename = uploaded.name
+            content_type = uploaded.content_type
+            stored = store('uploads', uploaded.chunks, content_type)
+            key = stored.key
+            acquire(key, stored=[stored])
 
         instance = super().save(commit=False)
         instance.s3_key = key
-        instance.original_filename = uploaded.name
-        instance.content_type = uploaded.content_type
+        instance.original_filename = filename[:255]
+        instance.content_type = content_type
         if commit:
             instance.save()
         return instance
 
 
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(d, initial) for d in data]
+        return [single_file_clean(data, initial)] if data else []
+
+
+class BulkUploadForm(forms.Form):
+    """Form shown on the Bulk upload page -- many files and/or a zip archive."""
+    files = MultipleFileField(label='Image files', required=False)
+    archive = forms.FileField(
+        label='Zip archive',
+        required=False,
+        help_text='Every image inside the archive is uploaded; folders are flattened.',
+    )
+
+    def clean_archive(self):
+        archive = self.cleaned_data.get('archive')
+        if archive and not zipfile.is_zipfile(archive):
+            raise forms.ValidationError('Not a valid zip archive.')
+        return archive
+
+    def clean(self):
+        cleaned = super().clean()
+        if not cleaned.get('files') and not cleaned.get('archive'):
+            raise forms.ValidationError('Select some image files or a zip archive.')
+        return cleaned
+
+
 @admin.register(UploadedImage)
-class UploadedImageAdmin(admin.ModelAdmin):
+class UploadedImageAdmin(OptimizedChangelistMixin, LargeTablePaginationMixin, admin.ModelAdmin):
+    change_list_template = 'admin/uploads/uploadedimage/change_list.html'
 
     # ------------------------------------------------------------------
     # List view
@@ -61,7 +129,7 @@ class UploadedImageAdmin(admin.ModelAdmin):
     def thumbnail(self, obj):
         if not obj.s3_key:
             return '(no image)'
-        url = f'{settings.S3_ENDPOINT}/{settings.S3_BUCKET_NAME}/{obj.s3_key}'
+        url = thumbnail_url(obj.s3_key, 60)
         return format_html(
             '<img src="{}" style="max-height:60px; max-width:60px; '
             'border:1px solid #ccc; border-radius:4px;" />',
@@ -77,6 +145,45 @@ class UploadedImageAdmin(admin.ModelAdmin):
             return UploadImageForm
         return super().get_form(request, obj, **kwargs)
 
+    # ------------------------------------------------------------------
+    # Bulk upload view -- many files or a zip, uploaded in parallel
+    # ------------------------------------------------------------------
+    def get_urls(self):
+        urls = [
+            path(
+                'bulk-upload/',
+                self.admin_site.admin_view(self.bulk_upload_view),
+                name='uploads_uploadedimage_bulk_upload',
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def bulk_upload_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        report = None
+        if request.method == 'POST':
+            form = BulkUploadForm(request.POST, request.FILES)
+            if form.is_valid():
+                sources = sources_from_uploaded_files(form.cleaned_data['files'])
+                archive = form.cleaned_data.get('archive')
+                if archive:
+                    sources += sources_from_zip(archive)
+                report = ingest(sources, created_by=request.user)
+                form = BulkUploadForm()
+        else:
+            form = BulkUploadForm()
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Bulk upload images',
+            'form': form,
+            'report': report,
+        }
+        return TemplateResponse(request, 'admin/uploads/uploadedimage/bulk_upload.html', context)
+
     # ------------------------------------------------------------------
     # Change view -- readonly + large preview
     # ------------------------------------------------------------------
@@ -84,7 +191,7 @@ class UploadedImageAdmin(admin.ModelAdmin):
 
     def get_fields(self, request, obj=None):
         if obj is None:
-            return ['image_file']
+            return ['image_file', 'uploaded_key', 'uploaded_filename']
         return ['id', 's3_key', 'original_filename', 'content_type', 'created_by', 'uploaded_at', 'image_preview']
 
     def save_model(self, request, obj, form, change):
@@ -95,7 +202,7 @@ class UploadedImageAdmin(admin.ModelAdmin):
     def image_preview(self, obj):
         if not obj.s3_key:
             return '(no image)'
-        url = f'{settings.S3_ENDPOINT}/{settings.S3_BUCKET_NAME}/{obj.s3_key}'
+        url = thumbnail_url(obj.s3_key, 600)
         return format_html(
             '<img src="{}" style="max-height:400px; max-width:600px; '
             'border:1px solid #ccc; border-radius:4px;" />',
@@ -109,3 +216,62 @@ class UploadedImageAdmin(admin.ModelAdmin):
 
     def has_delete_permission(self, request, obj=None):
         return True
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        release(obj.s3_key)
+
+    def delete_queryset(self, request, queryset):
+        keys = list(queryset.values_list('s3_key', flat=True))
+        super().delete_queryset(request, queryset)
+        release(*keys)
+
+
+@admin.register(PendingS3Deletion)
+class PendingS3DeletionAdmin(OptimizedChangelistMixin, LargeTablePaginationMixin, admin.ModelAdmin):
+    list_display = ('key', 'attempts', 'next_attempt_at', 'enqueued_at', 'last_error')
+    readonly_fields = ('key', 'attempts', 'next_attempt_at', 'enqueued_at', 'last_error')
+    search_fields = ('key',)
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(PendingRendition)
+class PendingRenditionAdmin(OptimizedChangelistMixin, LargeTablePaginationMixin, admin.ModelAdmin):
+    list_display = ('source_key', 'width', 'height', 'attempts', 'next_attempt_at', 'enqueued_at', 'last_error')
+    readonly_fields = ('source_key', 'width', 'height', 'attempts', 'next_attempt_at', 'enqueued_at', 'last_error')
+    search_fields = ('source_key',)
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(SpriteAtlas)
+class SpriteAtlasAdmin(admin.ModelAdmin):
+    list_display = ('scope', 'frames', 'sheets', 'packing', 'built_at', 'manifest_link')
+    readonly_fields = (
+        'scope', 'manifest_key', 'fingerprint', 'frames', 'sheets', 'efficiency', 'built_at', 'rebuild_requested',
+        'manifest',
+    )
+    search_fields = ('scope',)
+    actions = ['rebuild']
+
+    def packing(self, obj):
+        return f'{obj.efficiency:.1%}'
+    packing.short_description = 'Packing efficiency'
+
+    def manifest_link(self, obj):
+        return format_html('<a href="{}">{}</a>', public_url(obj.manifest_key), obj.manifest_key)
+    manifest_link.short_description = 'Manifest'
+
+    @admin.action(description='Rebuild selected atlases', permissions=['change'])
+    def rebuild(self, request, queryset):
+        scopes = list(queryset.values_list('scope', flat=True))
+        request_builds(scopes, force=True)
+        self.message_user(
+            request, f'Queued {len(scopes)} atlas rebuild(s) for the build_atlases worker.', messages.SUCCESS,
+        )
+
+    def has_add_permission(self, request):
+        return False
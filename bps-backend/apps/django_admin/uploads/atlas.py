@@ -0,0 +1,343 @@
+"""
+Sprite atlases: Element images packed into a few texture sheets.
+
+A client rendering a map would otherwise fetch one object per element. An
+atlas packs the images, each resized to its element's declared width x
+height, into PNG sheets of at most ATLAS_SHEET_SIZE pixels a side. A JSON
+manifest records where each element's frame is. There is one atlas per scope:
+
+- 'global': every element that isn't deleted, manifest atlases/global.json;
+- 'map:<id>': the elements placed on one map, atlases/maps/<id>.json.
+
+Frames are placed with MaxRects (best short side fit), largest first,
+ATLAS_PADDING transparent pixels apart so filtering doesn't bleed between
+neighbours. Sheets are trimmed to the area used. Elements that share an
+image and size share a frame. Images larger than a sheet, or that can't be
+read, are listed under "unpacked" with their image_key, so clients load
+them on their own as before.
+
+Builds are incremental. The fingerprint of an atlas covers its elements' ids,
+image keys and sizes, so an unchanged atlas is skipped without touching S3.
+A changed one reuses the frames of its previous sheets and downloads only
+images it didn't have. Sheets are content-addressed and reference-counted
+(uploads/dedup.py): the old ones are released and deleted once nothing else
+uses them. The manifest lives at a fixed key with Cache-Control: no-cache.
+
+Elements are also written by the HTTP API, outside Django, so there are no
+signals to hook. `build_atlases --loop` re-checks fingerprints on an
+interval instead. The admin actions only request builds (request_builds()),
+which that worker picks up on its next check.
+"""
+
+import hashlib
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from core.models import Element, Mapelementplacement
+from core.s3 import download_file, upload_stream
+from uploads.dedup import acquire, release, store
+from uploads.models import SpriteAtlas
+
+logger = logging.getLogger(__name__)
+
+GLOBAL = 'global'
+
+# Bump when the sheet or manifest layout changes, so every atlas is rebuilt.
+FORMAT_VERSION = 1
+
+
+# ----------------------------------------------------------------------
+# Packing
+# ----------------------------------------------------------------------
+
+class MaxRectsBin:
+    """One sheet: the free space is kept as maximal (possibly overlapping) rectangles."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.free = [(0, 0, width, height)]
+        self.used_width = self.used_height = 0
+
+    def score(self, w, h):
+        """(short side leftover, long side leftover, x, y) of the best fit, or None."""
+        best = None
+        for fx, fy, fw, fh in self.free:
+            if fw >= w and fh >= h:
+                candidate = (min(fw - w, fh - h), max(fw - w, fh - h), fx, fy)
+                if best is None or candidate < best:
+                    best = candidate
+        return best
+
+    def place(self, x, y, w, h):
+        kept, split = [], []
+        for free in self.free:
+            fx, fy, fw, fh = free
+            if x >= fx + fw or x + w <= fx or y >= fy + fh or y + h <= fy:
+                kept.append(free)
+                continue
+            if x > fx:
+                split.append((fx, fy, x - fx, fh))
+            if x + w < fx + fw:
+                split.append((x + w, fy, fx + fw - x - w, fh))
+            if y > fy:
+                split.append((fx, fy, fw, y - fy))
+            if y + h < fy + fh:
+                split.append((fx, y + h, fw, fy + fh - y - h))
+        # A new piece lies inside a rectangle that contained none of the kept
+        # ones, so only the new pieces can be redundant.
+        pieces = []
+        for i, piece in enumerate(split):
+            if not any(_contains(other, piece) for other in kept) and not any(
+                _contains(other, piece) and (other != piece or j < i) for j, other in enumerate(split) if j != i
+            ):
+                pieces.append(piece)
+        self.free = kept + pieces
+        self.used_width = max(self.used_width, x + w)
+        self.used_height = max(self.used_height, y + h)
+
+
+def _contains(outer, inner):
+    ox, oy, ow, oh = outer
+    ix, iy, iw, ih = inner
+    return ox <= ix and oy <= iy and ix + iw <= ox + ow and iy + ih <= oy + oh
+
+
+@dataclass
+class Packing:
+    positions: dict = field(default_factory=dict)  # index -> (sheet, x, y)
+    sheets: list = field(default_factory=list)  # (width, height), trimmed
+    oversize: list = field(default_factory=list)  # indexes that fit no sheet
+    efficiency: float = 0.0  # frame area / sheet area
+
+
+def pack(sizes, sheet_size, padding=0):
+    """Place (width, height) rectangles on as few sheet_size squares as possible."""
+    bins = []
+    result = Packing()
+    order = sorted(range(len(sizes)), key=lambda i: (max(sizes[i]), sizes[i][0] * sizes[i][1]), reverse=True)
+    for index in order:
+        # Padding goes on every side, so edges of the sheet get it too.
+        w, h = sizes[index][0] + 2 * padding, sizes[index][1] + 2 * padding
+        if w > sheet_size or h > sheet_size:
+            result.oversize.append(index)
+            continue
+        fits = [(fit, n) for n, b in enumerate(bins) if (fit := b.score(w, h))]
+        if fits:
+            (_, _, x, y), sheet = min(fits)
+        else:
+            bins.append(MaxRectsBin(sheet_size, sheet_size))
+            sheet, x, y = len(bins) - 1, 0, 0
+        bins[sheet].place(x, y, w, h)
+        result.positions[index] = (sheet, x + padding, y + padding)
+
+    result.sheets = [(b.used_width, b.used_height) for b in bins]
+    sheet_area = sum(w * h for w, h in result.sheets)
+    frame_area = sum(sizes[i][0] * sizes[i][1] for i in result.positions)
+    result.efficiency = frame_area / sheet_area if sheet_area else 0.0
+    result.oversize.sort()
+    return result
+
+
+# ----------------------------------------------------------------------
+# Building
+# ----------------------------------------------------------------------
+
+def map_scope(map_id):
+    return f'map:{map_id}'
+
+
+def manifest_key(scope):
+    if scope == GLOBAL:
+        return 'atlases/global.json'
+    return f'atlases/maps/{scope.removeprefix("map:")}.json'
+
+
+def scope_elements(scope):
+    elements = Element.objects.filter(deleted_at__isnull=True)
+    if scope != GLOBAL:
+        placed = Mapelementplacement.objects.filter(map_id=scope.removeprefix('map:')).values('element_id')
+        elements = elements.filter(pk__in=placed)
+    return elements.order_by('pk')
+
+
+def fingerprint(elements):
+    payload = json.dumps([FORMAT_VERSION, settings.ATLAS_SHEET_SIZE, settings.ATLAS_PADDING, elements])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@dataclass
+class AtlasResult:
+    scope: str
+    built: bool  # False when the atlas was up to date
+    frames: int = 0
+    sheets: int = 0
+    efficiency: float = 0.0
+    reused: int = 0
+    downloaded: int = 0
+    unpacked: int = 0
+
+    def __str__(self):
+        if not self.built:
+            return f'{self.scope}: up to date ({self.frames} frames, {self.efficiency:.1%} packed).'
+        return (
+            f'{self.scope}: {self.frames} frames on {self.sheets} sheet(s), {self.efficiency:.1%} packed '
+            f'({self.reused} reused, {self.downloaded} downloaded, {self.unpacked} unpacked).'
+        )
+
+
+def _fetch(key, size=None):
+    """The image at key as RGBA, resized to size if given; None if it can't be read."""
+    try:
+        buffer = io.BytesIO()
+        download_file(key, buffer)
+        buffer.seek(0)
+        with Image.open(buffer) as img:
+            img = img.convert('RGBA')
+    except Exception as exc:
+        # A missing object or a file that isn't an image: leave the element unpacked.
+        logger.warning('Sprite atlas: cannot read %s: %s', key, exc)
+        return None
+    return img if size is None or img.size == size else img.resize(size, Image.Resampling.LANCZOS)
+
+
+class _PreviousSheets:
+    """Frames of an atlas's last build, cut out of its sheets (each downloaded once)."""
+
+    def __init__(self, manifest):
+        self.sheets = manifest.get('sheets', [])
+        self.frames = {
+            (f['image_key'], f['w'], f['h']): f for f in manifest.get('frames', {}).values()
+        }
+        self._images = {}
+
+    def frame(self, image_key, size):
+        f = self.frames.get((image_key, *size))
+        if f is None:
+            return None
+        if f['sheet'] not in self._images:
+            self._images[f['sheet']] = _fetch(self.sheets[f['sheet']]['key'])
+        sheet = self._images[f['sheet']]
+        return sheet.crop((f['x'], f['y'], f['x'] + f['w'], f['y'] + f['h'])) if sheet else None
+
+
+def build(scope, force=False):
+    """Bring one atlas up to date. Returns an AtlasResult."""
+    elements = [list(row) for row in scope_elements(scope).values_list('pk', 'image_key', 'width', 'height')]
+    digest = fingerprint(elements)
+    atlas, _ = SpriteAtlas.objects.get_or_create(scope=scope, defaults={'manifest_key': manifest_key(scope)})
+    force = force or atlas.rebuild_requested
+    if atlas.fingerprint == digest and not force:
+        return AtlasResult(scope, False, atlas.frames, atlas.sheets, atlas.efficiency)
+
+    # One frame per distinct (image, size); elements sharing both share it.
+    users = {}
+    for pk, image_key, width, height in elements:
+        if image_key and width > 0 and height > 0:
+            users.setdefault((image_key, width, height), []).append(pk)
+
+    previous = _PreviousSheets(atlas.manifest)
+    images = {frame: previous.frame(frame[0], frame[1:]) for frame in users}
+    missing = [frame for frame, image in images.items() if image is None]
+    with ThreadPoolExecutor(max_workers=settings.UPLOAD_INGEST_WORKERS) as pool:
+        images.update(zip(missing, pool.map(lambda frame: _fetch(frame[0], frame[1:]), missing)))
+
+    readable = [frame for frame, image in images.items() if image is not None]
+    packing = pack([frame[1:] for frame in readable], settings.ATLAS_SHEET_SIZE, settings.ATLAS_PADDING)
+
+    canvases = [Image.new('RGBA', size, (0, 0, 0, 0)) for size in packing.sheets]
+    frames = {}
+    for index, (sheet, x, y) in packing.positions.items():
+        frame = image_key, w, h = readable[index]
+        canvases[sheet].paste(images[frame], (x, y))
+        for pk in users[frame]:
+            frames[pk] = {'sheet': sheet, 'x': x, 'y': y, 'w': w, 'h': h, 'image_key': image_key}
+    unpacked = {pk: image_key for pk, image_key, _, _ in elements if pk not in frames}
+
+    stored = []
+    for canvas in canvases:
+        body = io.BytesIO()
+        canvas.save(body, format='PNG', optimize=True)
+        stored.append(store('atlases', lambda data=body.getvalue(): [data], 'image/png'))
+
+    manifest = {
+        'version': FORMAT_VERSION,
+        'scope': scope,
+        'generated_at': timezone.now().isoformat(),
+        'sheets': [{'key': s.key, 'width': w, 'height': h} for s, (w, h) in zip(stored, packing.sheets)],
+        'frames': frames,
+        'unpacked': unpacked,
+        'efficiency': round(packing.efficiency, 4),
+    }
+
+    with transaction.atomic():
+        # Builds of one scope can overlap (worker and a manual run): the row
+        # is re-read under a lock so each old sheet is released exactly once.
+        atlas = SpriteAtlas.objects.select_for_update().get(scope=scope)
+        if atlas.fingerprint == digest and not force:
+            # Built from the same elements meanwhile; same content, same sheet keys.
+            return AtlasResult(scope, False, atlas.frames, atlas.sheets, atlas.efficiency)
+        # Acquire first: a sheet that didn't change never drops to zero references.
+        acquire(*(s.key for s in stored), stored=stored)
+        release(*(sheet['key'] for sheet in atlas.manifest.get('sheets', [])))
+        atlas.fingerprint = digest
+        atlas.manifest = manifest
+        atlas.frames = len(frames)
+        atlas.sheets = len(stored)
+        atlas.efficiency = packing.efficiency
+        atlas.built_at = timezone.now()
+        atlas.rebuild_requested = False
+        atlas.save()
+        # S3 must never point at sheets whose references haven't committed.
+        transaction.on_commit(lambda: publish(scope))
+
+    return AtlasResult(
+        scope, True, atlas.frames, atlas.sheets, atlas.efficiency,
+        reused=len(images) - len(missing), downloaded=len(missing), unpacked=len(unpacked),
+    )
+
+
+def publish(scope):
+    """Upload the atlas's committed manifest.
+
+    Runs under the row lock, so overlapping builds can't leave an older
+    manifest last in S3. If the upload fails, the fingerprint is cleared and
+    the next check builds the atlas again.
+    """
+    try:
+        with transaction.atomic():
+            atlas = SpriteAtlas.objects.select_for_update().get(scope=scope)
+            upload_stream(
+                atlas.manifest_key, [json.dumps(atlas.manifest).encode()], 'application/json',
+                cache_control='no-cache',
+            )
+    except Exception:
+        SpriteAtlas.objects.filter(scope=scope).update(fingerprint='')
+        raise
+
+
+def request_builds(scopes, force=False):
+    """Mark atlases for the build_atlases worker instead of building them here.
+
+    New scopes get a row with no fingerprint, which the worker always builds.
+    force also rebuilds atlases whose elements haven't changed.
+    """
+    for scope in scopes:
+        SpriteAtlas.objects.get_or_create(scope=scope, defaults={'manifest_key': manifest_key(scope)})
+    if force:
+        SpriteAtlas.objects.filter(scope__in=scopes).update(rebuild_requested=True)
+
+
+def scopes_for_elements(element_ids):
+    """The global atlas and the built map atlases that contain any of element_ids."""
+    map_ids = Mapelementplacement.objects.filter(element_id__in=element_ids).values_list('map_id', flat=True)
+    built = SpriteAtlas.objects.filter(scope__in=[map_scope(m) for m in set(map_ids)]).values_list('scope', flat=True)
+    return [GLOBAL, *sorted(built)]
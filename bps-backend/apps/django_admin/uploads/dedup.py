@@ -0,0 +1,147 @@
+"""
+Content-addressed, reference-counted image storage.
+
+Uploaded files are keyed by the SHA-256 of their content
+(``elements/<sha256>.png``), so uploading the same sprite twice stores one
+object and both rows point at it. The object is immutable, so it is uploaded
+with a year-long immutable Cache-Control header and browsers and the CDN can
+keep it for good.
+
+- store() hashes the file, then uploads it only if the key is missing: no
+  StoredObject row and no object on a HEAD. It reads the file twice (hash,
+  then upload), so it takes a callable returning fresh chunks. Browser
+  uploads (core/direct_upload.py) hash in the browser and get the same key.
+- acquire() and release() count the rows that point at a key. Call them in
+  the transaction that saves those rows. The release that brings the count
+  to zero queues the object, its thumbnails and its renditions for deletion,
+  after DEDUP_DELETE_GRACE. A key with no StoredObject row is never
+  deleted: uploads/migrations/0006 counted every key in use, so a missing
+  row means the count is unknown, and release() only logs it.
+- The deletion drain (uploads/deletions.py) skips keys that were acquired
+  again after being queued, and keys that rows still point at.
+"""
+
+import hashlib
+import logging
+import mimetypes
+from collections import Counter
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from core.metrics import REGISTRY
+from core.s3 import object_exists, upload_stream
+from core.thumbnails import forget_thumbnails, thumbnail_keys
+from uploads.deletions import queue_deletion, references
+from uploads.models import ImageRendition, StoredObject
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Time a released object lingers before deletion, so a concurrent upload of
+# the same content that skipped its PUT has committed its reference first.
+DEDUP_DELETE_GRACE = timedelta(minutes=10)
+
+DEDUPLICATED = REGISTRY.counter('uploads_deduplicated', 'Uploads skipped because the content was stored.', ['prefix'])
+DEDUPLICATED_BYTES = REGISTRY.counter('uploads_deduplicated_bytes', 'Bytes not uploaded thanks to deduplication.', ['prefix'])
+
+
+@dataclass
+class StoredFile:
+    key: str
+    sha256: str
+    size: int
+    uploaded: bool  # False when the content was already stored
+
+
+def digest(chunks):
+    """(hex SHA-256, size) of a stream of byte chunks."""
+    sha = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        sha.update(chunk)
+        size += len(chunk)
+    return sha.hexdigest(), size
+
+
+def content_key(prefix, sha256, content_type):
+    # The extension comes from the content type, not the filename, so
+    # sprite.PNG and sprite.png share a key.
+    extension = mimetypes.guess_extension(content_type or '') or '.bin'
+    return f'{prefix}/{sha256}{extension}'
+
+
+def is_stored(prefix, key, size, check_index=True):
+    """Whether key's content is already stored; counts the skipped upload if so."""
+    if (check_index and StoredObject.objects.filter(key=key).exists()) or object_exists(key):
+        DEDUPLICATED.inc(prefix=prefix)
+        DEDUPLICATED_BYTES.inc(size, prefix=prefix)
+        return True
+    return False
+
+
+def store(prefix, open_chunks, content_type, sha256=None, size=None, check_index=True):
+    """Upload the content of open_chunks() under its content key unless already stored.
+
+    Pass sha256 and size if the content was already hashed (e.g. in a form's
+    clean()). check_index=False skips the StoredObject lookup and relies on
+    HEAD alone, for worker threads that shouldn't open database connections.
+    """
+    if sha256 is None:
+        sha256, size = digest(open_chunks())
+    key = content_key(prefix, sha256, content_type)
+    if is_stored(prefix, key, size, check_index):
+        return StoredFile(key, sha256, size, uploaded=False)
+    upload_stream(key, open_chunks(), content_type, cache_control=IMMUTABLE)
+    return StoredFile(key, sha256, size, uploaded=True)
+
+
+def acquire(*keys, stored=()):
+    """Count one more reference to each key (repeat a key to count it twice).
+
+    A key seen for the first time also counts the rows that already point at
+    it, so call this before saving the rows that add the new references.
+    stored: StoredFile results whose sha256/size to record for new rows.
+    """
+    metadata = {f.key: f for f in stored}
+    untracked = {}
+    for key, count in Counter(k for k in keys if k).items():
+        if not StoredObject.objects.filter(key=key).update(refcount=F('refcount') + count):
+            untracked[key] = count
+    existing = references(untracked)
+    for key, count in untracked.items():
+        info = metadata.get(key)
+        try:
+            with transaction.atomic():
+                StoredObject.objects.create(
+                    key=key, refcount=count + existing[key],
+                    sha256=info.sha256 if info else '', size=info.size if info else None,
+                )
+        except IntegrityError:
+            # Created by a concurrent acquire between our UPDATE and INSERT.
+            StoredObject.objects.filter(key=key).update(refcount=F('refcount') + count)
+
+
+def _derived_keys(key):
+    """Thumbnails and game renditions (core/renditions.py) made from key."""
+    return [*thumbnail_keys(key), *ImageRendition.objects.filter(source_key=key).values_list('key', flat=True)]
+
+
+def release(*keys):
+    """Drop one reference to each key; queue the ones nothing references any more."""
+    for key, count in Counter(k for k in keys if k).items():
+        with transaction.atomic():
+            row = StoredObject.objects.select_for_update().filter(key=key).first()
+            if row is None:
+                # Not counted, so other rows may still use it: keep the object.
+                logger.warning('Not deleting %s: it has no reference count', key)
+                continue
+            if row.refcount > count:
+                StoredObject.objects.filter(key=key).update(refcount=F('refcount') - count)
+                continue
+            row.delete()
+            queue_deletion(key, *_derived_keys(key), delay=DEDUP_DELETE_GRACE)
+        forget_thumbnails(key)
@@ -0,0 +1,101 @@
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.models import Avatar, Element, Map
+from core.s3 import MAX_DELETE_KEYS, delete_files
+from core.renditions import rendition_source
+from core.thumbnails import thumbnail_source
+from uploads.models import ImageRendition, PendingS3Deletion, StoredObject, UploadedImage
+
+logger = logging.getLogger(__name__)
+
+# Retry delays grow as BASE * 2^attempts, capped at MAX.
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=6)
+
+
+def queue_deletion(*keys, delay=None):
+    """Record S3 keys for deletion. Call inside the transaction that orphaned them.
+
+    With a delay (a timedelta) the keys are not deleted before it has passed.
+    """
+    due = timezone.now() + delay if delay else timezone.now()
+    PendingS3Deletion.objects.bulk_create(
+        [PendingS3Deletion(key=key, next_attempt_at=due) for key in keys if key]
+    )
+
+
+# Every column that holds the key of a stored object.
+KEY_COLUMNS = [(Avatar, 'image_key'), (Element, 'image_key'), (Map, 'thumbnail_key'), (UploadedImage, 's3_key')]
+
+
+def references(keys):
+    """Counter of the rows in KEY_COLUMNS that point at each of keys."""
+    counts = Counter()
+    keys = set(keys)
+    if keys:
+        for model, column in KEY_COLUMNS:
+            rows = model.objects.filter(**{f'{column}__in': keys}).values_list(column).annotate(n=Count('pk'))
+            counts.update(dict(rows.order_by()))
+    return counts
+
+
+def _backoff(attempts):
+    return min(BACKOFF_BASE * (2 ** attempts), BACKOFF_MAX)
+
+
+def drain_once(batch_size=MAX_DELETE_KEYS):
+    """Delete one batch of due keys from S3.
+
+    Rows are locked with SKIP LOCKED so several workers can drain in parallel.
+    Returns (deleted, failed) counts.
+    """
+    batch_size = max(1, min(batch_size, MAX_DELETE_KEYS))
+    now = timezone.now()
+
+    with transaction.atomic():
+        rows = list(
+            PendingS3Deletion.objects
+            .select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        if not rows:
+            return 0, 0
+
+        # A content-addressed key can be referenced again after it was queued;
+        # it and its renditions then stay, and their queue rows just go.
+        sources = {row.key: rendition_source(thumbnail_source(row.key)) for row in rows}
+        referenced = set(StoredObject.objects.filter(key__in=set(sources.values())).values_list('key', flat=True))
+        # Last line of defence for keys without a count (stored before counting
+        # began, or written by the HTTP API): never delete what a row uses.
+        in_use = references(set(sources.values()) - referenced)
+        if in_use:
+            logger.warning('Not deleting %d object(s) still referenced by rows: %s', len(in_use), sorted(in_use))
+            StoredObject.objects.bulk_create(
+                [StoredObject(key=key, refcount=count) for key, count in in_use.items()], ignore_conflicts=True,
+            )
+            referenced |= set(in_use)
+        keys = {row.key for row in rows if sources[row.key] not in referenced}
+        try:
+            failed = delete_files(keys) if keys else {}
+        except Exception as exc:
+            failed = {key: str(exc) for key in keys}
+
+        done = [row.pk for row in rows if row.key not in failed]
+        retry = [row for row in rows if row.key in failed]
+        for row in retry:
+            row.attempts += 1
+            row.last_error = failed[row.key][:2000]
+            row.next_attempt_at = now + _backoff(row.attempts)
+
+        PendingS3Deletion.objects.filter(pk__in=done).delete()
+        ImageRendition.objects.filter(key__in=keys - failed.keys()).delete()
+        PendingS3Deletion.objects.bulk_update(retry, ['attempts', 'last_error', 'next_attempt_at'])
+
+    return len(done), len(retry)
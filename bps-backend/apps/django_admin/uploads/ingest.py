@@ -0,0 +1,154 @@
+"""
+Bulk ingestion of images into the Uploads app.
+
+Files are streamed to S3 concurrently on a bounded thread pool (all threads
+share the pooled client from core.s3) and the UploadedImage rows for every
+successful upload are created with a single bulk_create. Storage is
+content-addressed (uploads/dedup.py): a file whose content is already in S3
+is not uploaded again.
+"""
+
+import mimetypes
+import os
+import time
+import zipfile
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+from uploads.dedup import StoredFile, acquire, store
+from uploads.deletions import queue_deletion
+from uploads.models import UploadedImage
+
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class IngestSource:
+    """One file to ingest. open_chunks() is called on the worker thread."""
+    filename: str
+    content_type: str
+    open_chunks: Callable[[], Iterable[bytes]]
+
+
+@dataclass
+class IngestResult:
+    filename: str
+    stored: StoredFile = None
+    error: str = ''
+
+    @property
+    def key(self):
+        return self.stored.key if self.stored else ''
+
+    @property
+    def ok(self):
+        return not self.error
+
+
+@dataclass
+class IngestReport:
+    results: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def succeeded(self):
+        return [r for r in self.results if r.ok]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def files_per_second(self):
+        return len(self.succeeded) / self.elapsed if self.elapsed else 0.0
+
+
+def _guess_type(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def _read_chunks(fileobj):
+    with fileobj:
+        while chunk := fileobj.read(CHUNK_SIZE):
+            yield chunk
+
+
+def sources_from_uploaded_files(files):
+    return [
+        IngestSource(f.name, f.content_type or _guess_type(f.name), f.chunks)
+        for f in files
+    ]
+
+
+def sources_from_zip(fileobj):
+    """Sources for the files in a zip archive, which must stay open until ingest() returns."""
+    archive = zipfile.ZipFile(fileobj)
+    sources = []
+    for info in archive.infolist():
+        name = os.path.basename(info.filename)
+        if info.is_dir() or not name or info.filename.startswith('__MACOSX/'):
+            continue
+        sources.append(IngestSource(
+            name,
+            _guess_type(name),
+            lambda info=info: _read_chunks(archive.open(info)),
+        ))
+    return sources
+
+
+def sources_from_directory(path, recursive=False):
+    pattern = '**/*' if recursive else '*'
+    return [
+        IngestSource(p.name, _guess_type(p.name), lambda p=p: _read_chunks(p.open('rb')))
+        for p in sorted(Path(path).glob(pattern))
+        if p.is_file()
+    ]
+
+
+def _upload(source):
+    if not source.content_type.startswith('image/'):
+        return IngestResult(source.filename, error=f'not an image ({source.content_type})')
+    try:
+        # HEAD only: this runs on pool threads, which stay off the database.
+        stored = store('uploads', source.open_chunks, source.content_type, check_index=False)
+    except Exception as exc:
+        return IngestResult(source.filename, error=str(exc) or exc.__class__.__name__)
+    return IngestResult(source.filename, stored=stored)
+
+
+def ingest(sources, created_by=None, max_workers=None):
+    """Upload every source to S3 in parallel and create their UploadedImage rows.
+
+    Returns an IngestReport with one result per source, in input order.
+    """
+    max_workers = max_workers or settings.UPLOAD_INGEST_WORKERS
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(_upload, sources))
+
+    rows = [
+        UploadedImage(
+            s3_key=result.key,
+            original_filename=result.filename[:255],
+            content_type=source.content_type,
+            created_by=created_by,
+        )
+        for source, result in zip(sources, results) if result.ok
+    ]
+    stored = [result.stored for result in results if result.ok]
+    try:
+        with transaction.atomic():
+            acquire(*(row.s3_key for row in rows), stored=stored)
+            UploadedImage.objects.bulk_create(rows)
+    except Exception:
+        # Don't leak the objects we just uploaded if the rows can't be written.
+        queue_deletion(*{f.key for f in stored if f.uploaded})
+        raise
+
+    return IngestReport(results=results, elapsed=time.perf_counter() - start)
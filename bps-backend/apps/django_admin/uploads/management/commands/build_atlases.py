@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Map
+from uploads.atlas import GLOBAL, build, map_scope
+from uploads.models import SpriteAtlas
+
+
+class Command(BaseCommand):
+    help = (
+        'Pack element images into sprite atlas sheets and write their manifests to S3. '
+        'Without --map/--all-maps, rebuilds the global atlas and every map atlas built before, '
+        'skipping those whose elements have not changed. Admin actions only queue builds for this command.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--map', action='append', default=[], help='Build the atlas of this map id (repeatable).')
+        parser.add_argument('--all-maps', action='store_true', help='Build an atlas for every map that is not deleted.')
+        parser.add_argument('--force', action='store_true', help='Rebuild even if nothing changed.')
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running, re-checking the atlases every --interval seconds.',
+        )
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between checks (with --loop).')
+
+    def scopes(self, options):
+        if options['all_maps']:
+            maps = Map.objects.filter(deleted_at__isnull=True).order_by('pk').values_list('pk', flat=True)
+            return [GLOBAL, *(map_scope(pk) for pk in maps)]
+        if options['map']:
+            unknown = set(options['map']) - set(Map.objects.filter(pk__in=options['map']).values_list('pk', flat=True))
+            if unknown:
+                raise CommandError(f'No such map: {", ".join(sorted(unknown))}')
+            return [map_scope(pk) for pk in options['map']]
+        return [GLOBAL, *SpriteAtlas.objects.exclude(scope=GLOBAL).values_list('scope', flat=True)]
+
+    def handle(self, *args, **options):
+        while True:
+            for scope in self.scopes(options):
+                result = build(scope, force=options['force'])
+                self.stdout.write(self.style.SUCCESS(str(result)) if result.built else str(result))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
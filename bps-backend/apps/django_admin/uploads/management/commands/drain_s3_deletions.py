@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.s3 import MAX_DELETE_KEYS
+from uploads.deletions import drain_once
+
+
+class Command(BaseCommand):
+    help = 'Delete S3 objects queued in the PendingS3Deletion outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=MAX_DELETE_KEYS,
+            help=f'Keys per DeleteObjects call (max {MAX_DELETE_KEYS}).',
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running as a worker instead of exiting once the queue is empty.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=10.0,
+            help='Seconds to sleep between polls when the queue is empty (with --loop).',
+        )
+
+    def handle(self, *args, **options):
+        total_deleted = total_failed = 0
+        while True:
+            deleted, failed = drain_once(options['batch_size'])
+            total_deleted += deleted
+            total_failed += failed
+            if deleted or failed:
+                self.stdout.write(f'Deleted {deleted} object(s), {failed} scheduled for retry.')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Queue drained: {total_deleted} deleted, {total_failed} failed attempt(s).'
+        ))
@@ -0,0 +1,45 @@
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from uploads.ingest import ingest, sources_from_directory
+
+
+class Command(BaseCommand):
+    help = 'Upload every image in a local directory to S3 and register it as an UploadedImage.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--recursive', action='store_true', help='Include sub-directories.')
+        parser.add_argument('--workers', type=int, default=None, help='Parallel S3 uploads.')
+        parser.add_argument('--user', help='Username to record as created_by.')
+
+    def handle(self, *args, **options):
+        directory = Path(options['directory'])
+        if not directory.is_dir():
+            raise CommandError(f'{directory} is not a directory.')
+
+        created_by = None
+        if options['user']:
+            try:
+                created_by = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f'No admin user named {options["user"]!r}.')
+
+        sources = sources_from_directory(directory, recursive=options['recursive'])
+        if not sources:
+            raise CommandError(f'No files found in {directory}.')
+
+        report = ingest(sources, created_by=created_by, max_workers=options['workers'])
+
+        for result in report.results:
+            if result.ok:
+                self.stdout.write(f'OK    {result.filename} -> {result.key}')
+            else:
+                self.stdout.write(self.style.ERROR(f'FAIL  {result.filename}: {result.error}'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(report.succeeded)} uploaded, {len(report.failed)} failed '
+            f'in {report.elapsed:.2f}s ({report.files_per_second:.1f} files/s).'
+        ))
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import Element, Map
+from uploads.models import ImageRendition, PendingRendition
+from uploads.transcoding import process_once
+
+
+def backfill():
+    """Queue every Element/Map image that has no renditions at its declared size. Returns the count."""
+    wanted = {
+        *Element.objects.filter(deleted_at__isnull=True).values_list('image_key', 'width', 'height'),
+        *Map.objects.filter(deleted_at__isnull=True).values_list('thumbnail_key', 'width', 'height'),
+    }
+    have = set(
+        ImageRendition.objects.order_by().values_list('source_key', 'declared_width', 'declared_height').distinct()
+    )
+    missing = [(key, w, h) for key, w, h in wanted if key and (key, w, h) not in have]
+    PendingRendition.objects.bulk_create(
+        [PendingRendition(source_key=key, width=w, height=h) for key, w, h in missing], ignore_conflicts=True,
+    )
+    return len(missing)
+
+
+class Command(BaseCommand):
+    help = 'Render the resized, re-encoded game renditions queued by Element and Map image uploads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10, help='Jobs per transaction.')
+        parser.add_argument(
+            '--backfill', action='store_true',
+            help='First queue every Element/Map image that has no renditions at its declared size.',
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running as a worker instead of exiting once the queue is empty.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=10.0,
+            help='Seconds to sleep between polls when the queue is empty (with --loop).',
+        )
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.stdout.write(f'Queued {backfill()} image(s).')
+        total_rendered = total_failed = 0
+        while True:
+            rendered, failed = process_once(options['batch_size'])
+            total_rendered += rendered
+            total_failed += failed
+            if rendered or failed:
+                self.stdout.write(f'Rendered {rendered} image(s), {failed} scheduled for retry.')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Queue drained: {total_rendered} rendered, {total_failed} failed attempt(s).'
+        ))
@@ -0,0 +1,38 @@
+# Generated by Django 6.1.2 on 2026-10-18 11:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredObject',
+            fields=[
+                ('key', models.CharField(max_length=512, primary_key=True, serialize=False)),
+                ('sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'admin_stored_object',
+                'managed': True,
+            },
+        ),
+        migrations.AlterField(
+            model_name='uploadedimage',
+            name='s3_key',
+            field=models.CharField(db_index=True, editable=False, max_length=512),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedimage',
+            index=models.Index(fields=['uploaded_at', 'id'], name='admin_upl_uploaded_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.1.2 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0002_storedobject_alter_uploadedimage_s3_key_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpriteAtlas',
+            fields=[
+                ('scope', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('manifest_key', models.CharField(max_length=512)),
+                ('fingerprint', models.CharField(blank=True, default='', max_length=64)),
+                ('manifest', models.JSONField(blank=True, default=dict)),
+                ('frames', models.PositiveIntegerField(default=0)),
+                ('sheets', models.PositiveIntegerField(default=0)),
+                ('efficiency', models.FloatField(default=0)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'sprite atlases',
+                'db_table': 'admin_sprite_atlas',
+                'ordering': ['scope'],
+                'managed': True,
+            },
+        ),
+    ]
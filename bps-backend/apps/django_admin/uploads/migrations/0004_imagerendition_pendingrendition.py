@@ -0,0 +1,53 @@
+# Generated by Django 6.1.2 on 2026-10-18 11:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0003_spriteatlas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageRendition',
+            fields=[
+                ('key', models.CharField(max_length=600, primary_key=True, serialize=False)),
+                ('source_key', models.CharField(db_index=True, max_length=512)),
+                ('declared_width', models.PositiveIntegerField(default=0)),
+                ('declared_height', models.PositiveIntegerField(default=0)),
+                ('scale', models.PositiveSmallIntegerField()),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('format', models.CharField(max_length=8)),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'admin_image_rendition',
+                'ordering': ['source_key', 'scale', 'format'],
+                'managed': True,
+            },
+        ),
+        migrations.CreateModel(
+            name='PendingRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_key', models.CharField(max_length=512)),
+                ('width', models.PositiveIntegerField(default=0)),
+                ('height', models.PositiveIntegerField(default=0)),
+                ('enqueued_at', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'db_table': 'admin_pending_rendition',
+                'ordering': ['next_attempt_at'],
+                'managed': True,
+                'constraints': [models.UniqueConstraint(fields=('source_key', 'width', 'height'), name='admin_pending_rendition_uniq')],
+            },
+        ),
+    ]
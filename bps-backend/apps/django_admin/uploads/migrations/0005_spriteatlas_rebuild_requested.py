@@ -0,0 +1,18 @@
+# Generated by Django 6.1.2 on 2026-10-18 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0004_imagerendition_pendingrendition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spriteatlas',
+            name='rebuild_requested',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,71 @@
+"""
+Count the rows that already point at each stored object (uploads/dedup.py).
+
+Keys stored before reference counting have no StoredObject row, so their
+first release would not know who else uses them. This sets every key's count
+to the number of Avatar, Element, Map and UploadedImage rows using it.
+
+Prisma's tables are read with SQL, since core's unmanaged models have no
+migrations.
+"""
+
+from collections import Counter
+
+from django.db import migrations
+
+# (table, column) of every key that points at a stored object.
+KEY_COLUMNS = [
+    ('Avatar', 'image_key'),
+    ('Element', 'image_key'),
+    ('Map', 'thumbnail_key'),
+    ('admin_uploaded_image', 's3_key'),
+]
+
+BATCH_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    connection = schema_editor.connection
+    tables = set(connection.introspection.table_names())
+    if 'admin_stored_object' not in tables:
+        raise RuntimeError('admin_stored_object is missing; uploads 0002 must create it first.')
+    StoredObject = apps.get_model('uploads', 'StoredObject')
+
+    counts = Counter()
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for table, column in KEY_COLUMNS:
+            if table not in tables:
+                continue
+            cursor.execute(
+                f"SELECT {qn(column)}, COUNT(*) FROM {qn(table)} "
+                f"WHERE {qn(column)} IS NOT NULL AND {qn(column)} <> '' GROUP BY {qn(column)}"
+            )
+            counts.update(dict(cursor.fetchall()))
+
+    existing = set()
+    changed = []
+    for row in StoredObject.objects.iterator():
+        if row.key in counts:
+            existing.add(row.key)
+            if row.refcount != counts[row.key]:
+                row.refcount = counts[row.key]
+                changed.append(row)
+    StoredObject.objects.bulk_update(changed, ['refcount'], batch_size=BATCH_SIZE)
+    StoredObject.objects.bulk_create(
+        [StoredObject(key=key, refcount=count) for key, count in counts.items() if key not in existing],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        # Creates admin_stored_object; 0005 only keeps a single leaf.
+        ('uploads', '0002_storedobject_alter_uploadedimage_s3_key_and_more'),
+        ('uploads', '0005_spriteatlas_rebuild_requested'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
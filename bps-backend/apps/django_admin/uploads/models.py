@@ -1,11 +1,13 @@
 import uuid
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
 class UploadedImage(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    s3_key = models.CharField(max_length=512, unique=True, editable=False)
+    # Content-addressed (uploads/dedup.py), so identical files share a key.
+    s3_key = models.CharField(max_length=512, db_index=True, editable=False)
     original_filename = models.CharField(max_length=255, editable=False)
     content_type = models.CharField(max_length=100, editable=False)
     created_by = models.ForeignKey(
@@ -21,6 +23,134 @@ class UploadedImage(models.Model):
         db_table = 'admin_uploaded_image'
         managed = True
         ordering = ['-uploaded_at']
+        indexes = [
+            # Keyset pagination in the admin walks (uploaded_at, id).
+            models.Index(fields=['uploaded_at', 'id'], name='admin_upl_uploaded_at_id_idx'),
+        ]
 
     def __str__(self):
         return self.original_filename
+
+
+class PendingS3Deletion(models.Model):
+    """Outbox of S3 objects to delete, drained by the drain_s3_deletions command.
+
+    Rows are written in the same transaction as the model change that orphaned
+    the object, so a rolled-back save never deletes a live image and a crashed
+    request never leaks one.
+    """
+    key = models.CharField(max_length=512)
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        db_table = 'admin_s3_deletion'
+        managed = True
+        ordering = ['next_attempt_at']
+
+    def __str__(self):
+        return self.key
+
+
+class StoredObject(models.Model):
+    """Reference count of a content-addressed S3 object (uploads/dedup.py).
+
+    A row exists while at least one model row points at the key; the last
+    release deletes it and queues the object for deletion.
+    """
+    key = models.CharField(max_length=512, primary_key=True)
+    sha256 = models.CharField(max_length=64, blank=True, default='')
+    size = models.BigIntegerField(null=True, blank=True)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'admin_stored_object'
+        managed = True
+
+    def __str__(self):
+        return self.key
+
+
+class SpriteAtlas(models.Model):
+    """Last build of a sprite atlas (uploads/atlas.py): 'global' or 'map:<id>'.
+
+    manifest is what was written to manifest_key; the next build reuses its
+    frames and compares fingerprint to skip unchanged atlases.
+    """
+    scope = models.CharField(max_length=64, primary_key=True)
+    manifest_key = models.CharField(max_length=512)
+    fingerprint = models.CharField(max_length=64, blank=True, default='')
+    manifest = models.JSONField(default=dict, blank=True)
+    frames = models.PositiveIntegerField(default=0)
+    sheets = models.PositiveIntegerField(default=0)
+    efficiency = models.FloatField(default=0)
+    built_at = models.DateTimeField(null=True, blank=True)
+    # Set by the admin's rebuild action; the next build ignores the fingerprint.
+    rebuild_requested = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = 'admin_sprite_atlas'
+        managed = True
+        ordering = ['scope']
+        verbose_name_plural = 'sprite atlases'
+
+    def __str__(self):
+        return self.scope
+
+
+class ImageRendition(models.Model):
+    """A resized, re-encoded copy of an Element or Map image (core/renditions.py).
+
+    Clients look renditions up by source_key and the row's declared size
+    (0 x 0 for "the source's own size"). Rows are removed when the deletion
+    drain deletes the object.
+    """
+    key = models.CharField(max_length=600, primary_key=True)
+    source_key = models.CharField(max_length=512, db_index=True)
+    declared_width = models.PositiveIntegerField(default=0)
+    declared_height = models.PositiveIntegerField(default=0)
+    scale = models.PositiveSmallIntegerField()
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=8)
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'admin_image_rendition'
+        managed = True
+        ordering = ['source_key', 'scale', 'format']
+
+    def __str__(self):
+        return self.key
+
+
+class PendingRendition(models.Model):
+    """Outbox of images to render, drained by the render_renditions command.
+
+    Written in the transaction that saves the row pointing at the image.
+    Small uploads are rendered as soon as that commits. The rest wait for
+    the worker, so the admin request doesn't.
+    """
+    source_key = models.CharField(max_length=512)
+    # The row's declared size; 0 x 0 keeps the source's own size.
+    width = models.PositiveIntegerField(default=0)
+    height = models.PositiveIntegerField(default=0)
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        db_table = 'admin_pending_rendition'
+        managed = True
+        ordering = ['next_attempt_at']
+        constraints = [
+            models.UniqueConstraint(fields=['source_key', 'width', 'height'], name='admin_pending_rendition_uniq'),
+        ]
+
+    def __str__(self):
+        return self.source_key
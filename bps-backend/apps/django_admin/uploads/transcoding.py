@@ -0,0 +1,128 @@
+"""
+Queue that turns uploaded Element and Map images into renditions.
+
+Saving a row with a new image, or a new declared size, queues a
+PendingRendition in the same transaction. When the upload's header shows at
+most RENDITION_INLINE_MAX_PIXELS pixels, the job runs right after the commit:
+decoding and encoding such an image takes well under a second. Larger or
+unknown sources (direct browser uploads, typed keys) are left to the
+render_renditions worker, which drains the queue like drain_s3_deletions:
+rows are claimed with SKIP LOCKED and failures back off. Rendering itself
+runs outside any transaction.
+
+Each rendition is uploaded as immutable and recorded in ImageRendition.
+Sources that aren't images, or no longer exist, are logged and dropped from
+the queue.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from PIL import UnidentifiedImageError
+
+from core.renditions import render
+from core.s3 import object_exists, upload_stream
+from uploads.dedup import IMMUTABLE
+from uploads.deletions import _backoff
+from uploads.models import ImageRendition, PendingRendition, PendingS3Deletion
+
+logger = logging.getLogger(__name__)
+
+# How long a worker owns the jobs it claimed before others may take them over.
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def queue_rendition(source_key, width=0, height=0, pixels=None):
+    """Queue renditions of source_key at a declared size. Call inside the saving transaction.
+
+    pixels: the source's width x height, if known; small sources are
+    rendered as soon as the transaction commits.
+    """
+    if not source_key:
+        return
+    width, height = max(width or 0, 0), max(height or 0, 0)
+    PendingRendition.objects.bulk_create(
+        [PendingRendition(source_key=source_key, width=width, height=height)], ignore_conflicts=True,
+    )
+    if pixels is not None and pixels <= settings.RENDITION_INLINE_MAX_PIXELS:
+        # robust: the save has committed; a failure is logged and the job left to the worker.
+        transaction.on_commit(lambda: process_once(source_key=source_key, width=width, height=height), robust=True)
+
+
+def _render(job):
+    if PendingS3Deletion.objects.filter(key=job.source_key).exists():
+        return  # released while queued; don't leave renditions of a deleted source
+    declared = (job.width, job.height) if job.width and job.height else None
+    rendered = render(job.source_key, declared)
+    for image in rendered:
+        upload_stream(image.key, [image.body], image.content_type, cache_control=IMMUTABLE)
+    ImageRendition.objects.bulk_create(
+        [
+            ImageRendition(
+                key=image.key, source_key=job.source_key, declared_width=job.width, declared_height=job.height,
+                scale=image.scale, width=image.width, height=image.height, format=image.format,
+                size=len(image.body),
+            )
+            for image in rendered
+        ],
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=['declared_width', 'declared_height', 'scale', 'size'],
+    )
+
+
+def _missing(key):
+    try:
+        return not object_exists(key)
+    except Exception:
+        return False
+
+
+def process_once(batch_size=10, **filters):
+    """Render one batch of due jobs (optionally only those matching filters).
+
+    The jobs are claimed in a short transaction: locked with SKIP LOCKED and
+    pushed CLAIM_TIMEOUT into the future, so other workers pass them over.
+    Rendering runs after that commits, holding no locks; the results are
+    recorded in a second short transaction. A worker that dies mid-batch
+    leaves its jobs to be picked up again once the claim runs out.
+
+    Returns (rendered, failed) counts.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            PendingRendition.objects
+            .select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=now, **filters)
+            .order_by('next_attempt_at')[:max(1, batch_size)]
+        )
+        PendingRendition.objects.filter(pk__in=[job.pk for job in jobs]).update(next_attempt_at=now + CLAIM_TIMEOUT)
+
+    done, retry = [], []
+    for job in jobs:
+        try:
+            _render(job)
+        except UnidentifiedImageError:
+            logger.warning('Not rendering %s: not an image', job.source_key)
+            done.append(job.pk)
+        except Exception as exc:
+            if _missing(job.source_key):
+                logger.warning('Not rendering %s: no such object', job.source_key)
+                done.append(job.pk)
+                continue
+            job.attempts += 1
+            job.last_error = str(exc)[:2000]
+            job.next_attempt_at = timezone.now() + _backoff(job.attempts)
+            retry.append(job)
+        else:
+            done.append(job.pk)
+
+    with transaction.atomic():
+        PendingRendition.objects.filter(pk__in=done).delete()
+        PendingRendition.objects.bulk_update(retry, ['attempts', 'last_error', 'next_attempt_at'])
+
+    return len(done), len(retry)